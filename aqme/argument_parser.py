@@ -37,9 +37,12 @@ var_dict = {
     "opt_steps_rdkit": 1000,
     "heavyonly": True,
     "degree": 120.0,
+    "ewin_prune_summ": None,
     "max_torsions": 0,
     "sample": "auto",
     "auto_sample": 20,
+    "sample_convergence": 0.1,
+    "max_sample": None,
     "ff": "MMFF",
     "seed": 62609,
     "rms_threshold": 0.25,
@@ -48,14 +51,23 @@ var_dict = {
     "initial_energy_threshold": 0.0001,
     "max_mol_wt": 0,
     "ani_method": "ANI2x",
+    "ani_jit": False,
+    "ewin_ani_prescreen": None,
     "stacksize": "1G",
     "xtb_keywords": None,
     "max_workers": 4,
+    "input_chunksize": 0,
+    "resume": False,
+    "conformer_cache": None,
+    "max_cache_size": 1000,
     "ewin_sample_fullmonte": 2.0,
     "ewin_fullmonte": 5.0,
     "nsteps_fullmonte": 100,
     "nrot_fullmonte": 3,
     "ang_fullmonte": 30,
+    "nwalkers_fullmonte": 1,
+    "nproposals_fullmonte": 1,
+    "ang_prefilter_fullmonte": None,
     "cregen": False,
     "cregen_keywords": None,
     "program": None,
@@ -96,6 +108,7 @@ var_dict = {
     "bond_thres": 0.2,
     "angle_thres": 30,
     "dihedral_thres": 30,
+    "geom_prescreen": None,
     "crest_keywords": None,
     "crest_force": 0.5,
     "prefix": "",
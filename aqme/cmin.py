@@ -6,8 +6,9 @@ General
 +++++++
 
    files : str or list of str, default=None
-     Input files. Formats accepted: XYZ, SDF, GJF, COM and PDB. Also, lists can
-     be used (i.e. [FILE1.sdf, FILE2.sdf] or \*.FORMAT such as \*.sdf).  
+     Input files. Formats accepted: XYZ, SDF, AQMZ (conformer archives), GJF, 
+     COM and PDB. Also, lists can be used (i.e. [FILE1.sdf, FILE2.sdf] or 
+     \*.FORMAT such as \*.sdf).  
    program : str, default=None
      Program required in the conformational refining. 
      Current options: 'xtb', 'ani'
@@ -17,8 +18,19 @@ General
      Directory to create the output file(s)  
    varfile : str, default=None
      Option to parse the variables using a yaml file (specify the filename)  
+   output : str, default='.sdf'
+     Format of the output files with the refined conformers. Options: '.sdf' 
+     or '.aqmz' (compressed binary conformer archive with the same conformers 
+     and properties, much smaller and faster to read than SDF files)  
    nprocs : int, default=2
-     Number of processors used in the xTB optimizations  
+     Number of processors used in the xTB optimizations. When max_workers > 1, 
+     the processors are split between the simultaneous optimizations  
+   max_workers : int, default=4
+     Number of conformer optimizations run simultaneously with multiprocessing. 
+     The conformers of all the input files are sent to the same pool of 
+     processes, and the filters of each file are applied once all its 
+     conformers are optimized. Use max_workers=1 to run all the optimizations 
+     sequentially  
    charge : int, default=None
      Charge of the calculations used in the xTB calculations. If charge isn't 
      defined, it automatically reads the charge from the input SDF files 
@@ -75,11 +87,27 @@ ANI only
 ++++++++
 
    opt_steps : int, default=1000
-     Maximum number of steps used in the ase.optimize.BFGS optimizer.  
+     Maximum number of steps used in the ANI optimizer. All the conformers of 
+     each molecule are optimized at once with a batched FIRE optimizer (same 
+     algorithm as ase.optimize.FIRE), in batches of up to 64 conformers  
    opt_fmax : float, default=0.05
-     Maximum force value to determine convergence in the ase.optimize.BFGS optimizer.  
+     Maximum force value (eV/Å) to determine convergence in the ANI optimizer 
+     (each conformer stops once it converges)  
    ani_method : str, default='ANI2x'
-     ANI model used in the ase.optimize.BFGS optimizer.  
+     ANI model used in the ANI optimizer.  
+   ani_jit : bool, default=False
+     If True, the energies and forces of the ANI optimizer are calculated with 
+     the TorchScript-compiled (frozen) version of the ANI model, which reduces 
+     the Python overhead of each step on CPUs. If the model can't be compiled, 
+     the regular model is used  
+   ewin_ani_prescreen : float, default=None
+     If specified, the conformers are optimized in two stages. First, all the 
+     conformers are optimized with a single network of the ANI ensemble, and 
+     the conformers outside this energy window (in kcal/mol) and the energy and 
+     RMSD duplicates are discarded. Then, only the remaining conformers are 
+     refined with the full ensemble and go through the usual filters. Use a 
+     wider window than ewin_cmin (i.e. 2*ewin_cmin) to account for the energy 
+     differences between the single network and the ensemble  
 """
 #####################################################.
 #          This file stores the CMIN class          #
@@ -89,8 +117,10 @@ ANI only
 import os
 import sys
 import glob
-import subprocess
 import numpy as np
+import concurrent.futures as futures
+import multiprocessing as mp
+from collections import deque
 from pathlib import Path
 from rdkit.Chem import AllChem as Chem
 from rdkit.Chem import Descriptors as Descriptors
@@ -103,14 +133,27 @@ from aqme.utils import (
     load_variables,
     mol_from_sdf_or_mol_or_mol2,
     add_prefix_suffix,
-    check_xtb
+    check_xtb,
+    conformer_writer,
+    pdb_mols,
+    JobLogger,
+    CONF_ARCHIVE_EXT,
 )
 from aqme.filter import ewin_filter, pre_E_filter, RMSD_and_E_filter
-from aqme.cmin_utils import creation_of_dup_csv_cmin
+from aqme.cmin_utils import (
+    creation_of_dup_csv_cmin,
+    fire_optimize,
+    get_ani_model,
+    cmin_worker_init,
+    hartree_to_ev,
+)
 from aqme.csearch.crest import xtb_opt_main
 from aqme.csearch.utils import prepare_com_files
+from aqme.csearch.base import job_args
 
 hartree_to_kcal = 627.509
+# maximum number of conformers optimized at once with ANI
+ANI_BATCH_SIZE = 64
 
 
 class cmin:
@@ -140,9 +183,19 @@ class cmin:
             self.args.log.finalize()
             sys.exit()
 
-        # check if xTB is installed
+        # check if xTB or the ANI modules are installed
         if self.args.program.lower() == "xtb":
             _ = check_xtb(self)
+        elif self.args.program.lower() == "ani":
+            if self.args.charge is not None:
+                self.args.log.write("\nx  Charge is automatically calculated for ANI methods, do not use the charge option!")
+                self.args.log.finalize()
+                sys.exit()
+            elif self.args.mult is not None:
+                self.args.log.write("\nx  Multiplicity is automatically calculated for ANI methods, do not use the mult option!")
+                self.args.log.finalize()
+                sys.exit()
+            self.check_ani()
 
         # retrieves the different files to run in CMIN
         if len(self.args.files) == 0:
@@ -167,58 +220,42 @@ class cmin:
             files_cmin = glob.glob('*.sdf')
         elif file_format.lower() == 'pdb':
             for file in self.args.files:
-                command_pdb = [
-                    "obabel",
-                    "-ipdb",
-                    f"{file}",
-                    "-osdf",
-                    f"-O{file.split('.pdb')[0]}.sdf",
-                ]
-                subprocess.run(
-                    command_pdb,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                )
+                # PDB files are converted into SDF files with RDKit (no Open Babel required)
+                sdwriter_pdb = Chem.SDWriter(f"{file.split('.pdb')[0]}.sdf")
+                for mol in pdb_mols(file):
+                    sdwriter_pdb.write(mol)
+                sdwriter_pdb.close()
             files_cmin = glob.glob('*.sdf')
-        elif file_format.lower() == 'sdf':
+        elif file_format.lower() == 'sdf' or f'.{file_format.lower()}' == CONF_ARCHIVE_EXT:
             files_cmin = self.args.files
         else:
-            self.args.log.write(f"\nx  The input format {file_format} is not supported for CMIN refinement! Formats allowed: SDF, XYZ, COM, GJF and PDB")
+            self.args.log.write(f"\nx  The input format {file_format} is not supported for CMIN refinement! Formats allowed: SDF, AQMZ, XYZ, COM, GJF and PDB")
             self.args.log.finalize()
             sys.exit()
 
-        for file in files_cmin:
-            # load jobs for cmin minimization
-            self.mols, self.name = self.load_jobs(file)
-            self.name = add_prefix_suffix(self.name, self.args)
-
-            self.args.log.write(f"\n\n   ----- {self.name} -----")
-
-            if self.args.destination is None:
-                self.cmin_folder = self.args.initial_dir.joinpath("CMIN")
-            elif self.args.initial_dir.joinpath(self.args.destination).exists():
-                self.cmin_folder = Path(self.args.initial_dir.joinpath(self.args.destination))
-            else:
-                self.cmin_folder = Path(self.args.destination)
-
-            self.cmin_folder.mkdir(exist_ok=True, parents=True)
-
-            self.cmin_all_file = self.cmin_folder.joinpath(
-                f"{self.name}_{self.args.program.lower()}_all_confs{self.args.output}"
-            )
-            self.sdwriterall = Chem.SDWriter(str(self.cmin_all_file))
-
-            self.cmin_file = self.cmin_folder.joinpath(
-                self.name + "_" + self.args.program.lower() + self.args.output
-            )
-            self.sdwriter = Chem.SDWriter(str(self.cmin_file))
-
-            # runs the conformer sampling with multiprocessors
-            total_data = self.compute_cmin(file)
-
-            frames = [self.final_dup_data, total_data]
-            self.final_dup_data = pd.concat(frames, ignore_index=True, sort=True)
-            bar.next()
+        # the conformers of all the files are optimized in the same pool of processes
+        n_processes = max(1, int(self.args.max_workers))
+        # the log file can't be shared with the optimizations, which send their
+        # messages once they finish
+        pool_args = job_args(self.args, log=JobLogger())
+        # the ANI models are loaded once per process, using the threads available for each process
+        num_threads = max(1, (os.cpu_count() or 1) // n_processes)
+        prescreen = self.args.ewin_ani_prescreen is not None
+        init_args = (self.args.program, self.args.ani_method, num_threads, prescreen, self.args.stacksize)
+        if n_processes == 1:
+            cmin_worker_init(*init_args)
+            self.run_cmin(files_cmin, pool_args, None, bar)
+        else:
+            pool_args.nprocs = max(1, int(self.args.nprocs) // n_processes)
+            if self.args.program.lower() == "xtb":
+                self.args.log.write(f"\no  Running the xTB optimizations using {n_processes} processes with {pool_args.nprocs} threads each")
+            with futures.ProcessPoolExecutor(
+                max_workers=n_processes,
+                mp_context=mp.get_context("spawn"),
+                initializer=cmin_worker_init,
+                initargs=init_args,
+            ) as executor:
+                self.run_cmin(files_cmin, pool_args, executor, bar)
         bar.finish()
         
         # store all the information into a CSV file
@@ -250,27 +287,50 @@ class cmin:
             file_path = file_path.as_posix()
             inmols = mol_from_sdf_or_mol_or_mol2(file_path, 'cmin', self.args)
 
-        name_mol = os.path.basename(file).split(".sdf")[0]
+        name_mol = os.path.splitext(os.path.basename(file))[0]
 
         return inmols, name_mol
 
-    def compute_cmin(self, file):
+    def run_cmin(self, files_cmin, pool_args, executor, bar):
+        """
+        Sends the optimizations of the conformers of each file to the pool of
+        processes (or runs them if executor is None) and applies the filters of
+        each file, in the same order as files_cmin, once all its conformers are
+        optimized. Only a few files are loaded ahead of the files that are being
+        filtered, so the inputs are never loaded into memory all at once
+        """
+
+        max_pending = 4 * int(self.args.max_workers)
+        pending_jobs = deque()
+        for file in files_cmin:
+            pending_jobs.append(self.submit_cmin(file, pool_args, executor))
+            while pending_jobs and sum(len(job["results"]) for job in pending_jobs) >= max_pending:
+                self.finish_cmin(pending_jobs.popleft(), pool_args, executor, bar)
+        while pending_jobs:
+            self.finish_cmin(pending_jobs.popleft(), pool_args, executor, bar)
+
+    def submit_cmin(self, file, pool_args, executor):
+        """
+        Loads the conformers of a file, sets their charge and multiplicity and
+        sends the optimization jobs (cmin_job) to the pool of processes (one job
+        per conformer with xTB, and batches of ANI_BATCH_SIZE conformers with
+        ANI, using a single network of the ensemble if ewin_ani_prescreen is
+        used). Returns a dictionary with the information of the file
+        """
+
+        # load jobs for cmin minimization
+        self.mols, name = self.load_jobs(file)
+        name = add_prefix_suffix(name, self.args)
 
         dup_data = creation_of_dup_csv_cmin(self.args.program.lower())
         dup_data_idx = 0
-        dup_data.at[dup_data_idx, "Molecule"] = self.name
-        cenergy, outmols = [], []
+        dup_data.at[dup_data_idx, "Molecule"] = name
+        # the messages are written once the jobs of the file are finished
+        file_log = JobLogger()
         start_time = time.time()
+        final_mult = None
 
         if self.args.program.lower() == "ani":
-            if self.args.charge is not None:
-                self.args.log.write("\nx  Charge is automatically calculated for ANI methods, do not use the charge option!")
-                self.args.log.finalize()
-                sys.exit()
-            elif self.args.mult is not None:
-                self.args.log.write("\nx  Multiplicity is automatically calculated for ANI methods, do not use the mult option!")
-                self.args.log.finalize()
-                sys.exit()
             charge,mult,final_mult,dup_data = self.charge_mult_cmin(dup_data, dup_data_idx)
 
         elif self.args.program.lower() == "xtb":
@@ -292,52 +352,195 @@ class cmin:
                             mult_found = True
                         if charge_found and mult_found:
                             break
+            elif f'.{file_format.lower()}' == CONF_ARCHIVE_EXT and len(self.mols) > 0:
+                # conformer archives store the SDF properties of each conformer
+                if self.mols[0].HasProp("Real charge"):
+                    charge_input = self.mols[0].GetProp("Real charge").split()[0]
+                if self.mols[0].HasProp("Mult"):
+                    mult_input = self.mols[0].GetProp("Mult").split()[0]
             if self.args.charge is None and charge_input is None:
                 # if no charge/mult was specified or found, the charge is calculated using the mol object
                 charge = 0
-                self.args.log.write(f'nx  No charge was assigned! Setting a value of 0, it can be changed with the charge option (or column in CSV inputs).')
+                file_log.write(f'nx  No charge was assigned! Setting a value of 0, it can be changed with the charge option (or column in CSV inputs).')
             elif self.args.charge is None:
                 charge = charge_input
             else:
                 charge = self.args.charge
             if self.args.mult is None and mult_input is None:
                 mult = 1
-                self.args.log.write(f'nx  No multiplicity was assigned! Setting a value of 1, it can be changed with the mult option (or column in CSV inputs).')
+                file_log.write(f'nx  No multiplicity was assigned! Setting a value of 1, it can be changed with the mult option (or column in CSV inputs).')
             elif self.args.mult is None:
                 mult = mult_input
             else:
                 mult = self.args.mult
 
-        for i, mol in enumerate(self.mols):
-            if mol is not None:
-                # ANI calculations use ASE to run
-                if self.args.program.lower() == "ani":
-                    mol, energy, cmin_valid = self.ani_optimize(mol,charge,mult)
-                # xTB calculations use the xTB program directly
-                elif self.args.program.lower() == "xtb":
-                    # for contrained optimizations
-                    complex_ts = False
-                    if len(self.args.constraints_atoms) >= 1 or len(self.args.constraints_dist) >= 1 or len(self.args.constraints_angle) >= 1 or len(self.args.constraints_dihedral) >= 1:
-                        complex_ts = True
-                    name_init = mol.GetProp('_Name')
-                    mol, energy, cmin_valid = xtb_opt_main(
-                        f'{self.name}_conf_{i}',
-                        dup_data,
-                        dup_data_idx,
-                        self,
-                        charge,
-                        mult,
-                        None,
-                        self.args.constraints_atoms,
-                        self.args.constraints_dist,
-                        self.args.constraints_angle,
-                        self.args.constraints_dihedral,
-                        'xtb',
-                        self.args.geom,
-                        complex_ts=complex_ts,
-                        mol=mol,
-                        name_init=name_init
-                    )
+        # PropertyMol keeps the properties of the mol objects sent to other processes.
+        # xTB jobs optimize one conformer, and ANI jobs a batch of conformers
+        valid_mols = [(i, PropertyMol(mol)) for i, mol in enumerate(self.mols) if mol is not None]
+        if self.args.program.lower() == "xtb":
+            job_inputs = [
+                (f'{name}_conf_{i}', [mol], charge, mult, None) for i, mol in valid_mols
+            ]
+            results = self.submit_jobs(job_inputs, pool_args, executor)
+        elif self.args.program.lower() == "ani":
+            model_index = None if self.args.ewin_ani_prescreen is None else 0
+            results = self.submit_ani_jobs(
+                name, [mol for _, mol in valid_mols], charge, mult, model_index, pool_args, executor
+            )
+
+        return {
+            "name": name,
+            "dup_data": dup_data,
+            "charge": charge,
+            "mult": mult,
+            "final_mult": final_mult,
+            "n_mols": len(self.mols),
+            "log": file_log,
+            "results": results,
+            "start_time": start_time,
+            "prescreen_ewin": 0,
+            "prescreen_duplicates": 0,
+        }
+
+    def submit_jobs(self, job_inputs, pool_args, executor):
+        """
+        Sends the jobs to the pool of processes, or runs them if executor is None
+        """
+
+        if executor is None:
+            return [cmin_job(pool_args, job_input) for job_input in job_inputs]
+        return [executor.submit(cmin_job, pool_args, job_input) for job_input in job_inputs]
+
+    def submit_ani_jobs(self, name, mols, charge, mult, model_index, pool_args, executor):
+        """
+        Sends the ANI optimizations of a list of conformers in batches of
+        ANI_BATCH_SIZE conformers (using only the model_index network of the
+        ensemble if model_index is not None)
+        """
+
+        job_inputs = [
+            (name, mols[start:start + ANI_BATCH_SIZE], charge, mult, model_index)
+            for start in range(0, len(mols), ANI_BATCH_SIZE)
+        ]
+
+        return self.submit_jobs(job_inputs, pool_args, executor)
+
+    def prescreen_ani(self, cmin_data, results, pool_args, executor):
+        """
+        Filters the conformers optimized with a single network of the ANI
+        ensemble (energy window ewin_ani_prescreen and energy/RMSD duplicates)
+        and refines the remaining conformers with the full ensemble. Returns the
+        results of the refinement
+        """
+
+        cenergy, outmols, messages = [], [], []
+        for job_results, job_messages in results:
+            messages.extend(job_messages)
+            for mol, energy, cmin_valid in job_results:
+                if cmin_valid:
+                    outmols.append(mol)
+                    cenergy.append(energy)
+        if len(outmols) == 0:
+            return results
+
+        # the counts of these filters are added to the final filters
+        prescreen_data = creation_of_dup_csv_cmin("ani")
+        sorted_all_cids = sorted(range(len(outmols)), key=lambda cid: cenergy[cid])
+        sortedcids = ewin_filter(
+            sorted_all_cids,
+            cenergy,
+            prescreen_data,
+            0,
+            "ani",
+            self.args.ewin_ani_prescreen,
+        )
+        selectedcids = RMSD_and_E_filter(
+            outmols,
+            sortedcids,
+            cenergy,
+            self.args,
+            prescreen_data,
+            0,
+            "ani",
+        )
+        cmin_data["prescreen_ewin"] = len(sorted_all_cids) - len(sortedcids)
+        cmin_data["prescreen_duplicates"] = len(sortedcids) - len(selectedcids)
+        messages.append(f"\no  {len(outmols) - len(selectedcids)} conformers were discarded in the ANI prescreening with a single network (ewin_ani_prescreen = {self.args.ewin_ani_prescreen} kcal/mol), {len(selectedcids)} conformers will be refined with the full ensemble")
+
+        # the conformers are refined in the same order as the input conformers
+        refine_results = self.submit_ani_jobs(
+            cmin_data["name"],
+            [outmols[cid] for cid in sorted(selectedcids)],
+            cmin_data["charge"],
+            cmin_data["mult"],
+            None,
+            pool_args,
+            executor,
+        )
+        if executor is not None:
+            refine_results = [job.result() for job in refine_results]
+
+        return [([], messages)] + refine_results
+
+    def finish_cmin(self, cmin_data, pool_args, executor, bar):
+        """
+        Collects the optimized conformers of a file from submit_cmin(), applies
+        the filters and writes the SDF files
+        """
+
+        self.name = cmin_data["name"]
+        self.args.log.write(f"\n\n   ----- {self.name} -----")
+        for message in cmin_data["log"].messages:
+            self.args.log.write(message)
+
+        if self.args.destination is None:
+            self.cmin_folder = self.args.initial_dir.joinpath("CMIN")
+        elif self.args.initial_dir.joinpath(self.args.destination).exists():
+            self.cmin_folder = Path(self.args.initial_dir.joinpath(self.args.destination))
+        else:
+            self.cmin_folder = Path(self.args.destination)
+
+        self.cmin_folder.mkdir(exist_ok=True, parents=True)
+
+        self.cmin_all_file = self.cmin_folder.joinpath(
+            f"{self.name}_{self.args.program.lower()}_all_confs{self.args.output}"
+        )
+        self.sdwriterall = conformer_writer(self.cmin_all_file)
+
+        self.cmin_file = self.cmin_folder.joinpath(
+            self.name + "_" + self.args.program.lower() + self.args.output
+        )
+        self.sdwriter = conformer_writer(self.cmin_file)
+
+        results = cmin_data["results"]
+        if executor is not None:
+            results = [job.result() for job in results]
+        if self.args.program.lower() == "ani" and self.args.ewin_ani_prescreen is not None:
+            results = self.prescreen_ani(cmin_data, results, pool_args, executor)
+
+        total_data = self.compute_cmin(cmin_data, results)
+
+        frames = [self.final_dup_data, total_data]
+        self.final_dup_data = pd.concat(frames, ignore_index=True, sort=True)
+        bar.next()
+
+    def compute_cmin(self, cmin_data, results):
+        """
+        Applies the energy and RMSD filters to the optimized conformers of a
+        file (results of the cmin_job jobs, in the same order as the input conformers)
+        and writes the SDF files
+        """
+
+        dup_data = cmin_data["dup_data"]
+        dup_data_idx = 0
+        charge, mult = cmin_data["charge"], cmin_data["mult"]
+        final_mult = cmin_data["final_mult"]
+        cenergy, outmols = [], []
+
+        for job_results, messages in results:
+            for message in messages:
+                self.args.log.write(message)
+            for mol, energy, cmin_valid in job_results:
                 if cmin_valid:
                     pmol = PropertyMol(mol)
                     outmols.append(pmol)
@@ -398,9 +601,12 @@ class cmin:
             )
 
             if self.args.program.lower() == "xtb":
-                dup_data.at[dup_data_idx, "xTB-Initial-samples"] = len(self.mols)
+                dup_data.at[dup_data_idx, "xTB-Initial-samples"] = cmin_data["n_mols"]
             elif self.args.program.lower() == "ani":
-                dup_data.at[dup_data_idx, "ANI-Initial-samples"] = len(self.mols)
+                dup_data.at[dup_data_idx, "ANI-Initial-samples"] = cmin_data["n_mols"]
+                # adds the conformers discarded in the ANI prescreening
+                dup_data.at[dup_data_idx, "ANI-energy-window"] += cmin_data["prescreen_ewin"]
+                dup_data.at[dup_data_idx, "ANI-RMSD-and-energy-duplicates"] += cmin_data["prescreen_duplicates"]
 
             # write the filtered, ordered conformers to external file
             self.write_confs(
@@ -408,121 +614,121 @@ class cmin:
             )
 
         dup_data.at[dup_data_idx, "CMIN time (seconds)"] = round(
-            time.time() - start_time, 2
+            time.time() - cmin_data["start_time"], 2
         )
 
-        # removing temporary files
-        temp_files = [
-            "gfn2.out",
-            "cmin_opt.traj",
-            "wbo",
-            "xtbrestart",
-            "ase.opt",
-            "cmin.opt",
-            "gfnff_topo"
-        ]
-        for file in temp_files:
-            if os.path.exists(file):
-                os.remove(file)
-
         return dup_data
 
-    # ANI MAIN OPTIMIZATION PROCESS
-    def ani_optimize(self, mol, charge, mult):
+    def check_ani(self):
+        """
+        Attempts ANI imports and exits if the programs are not installed (this is
+        checked before sending the optimizations to other processes)
+        """
 
-        # Attempts ANI imports and exits if the programs are not installed
         try:
             import torch
-            import warnings
-            warnings.filterwarnings('ignore')
-
         except ModuleNotFoundError:
             self.args.log.write("x  Torch-related modules are not installed! You can install these modules with 'pip install torch torchvision torchani'")
             self.args.log.finalize()
             sys.exit()
         try:
-            import ase
-            import ase.optimize
-        except ModuleNotFoundError:
-            self.args.log.write("x  ASE is not installed! You can install the program with 'conda install -c conda-forge ase' or 'pip install ase'")
+            import torchani
+        except (ImportError,ModuleNotFoundError):
+            self.args.log.write("x  Torchani is not installed! You can install the program with 'pip install torchani'")
             self.args.log.finalize()
             sys.exit()
 
-        self.args.log.write(f"\no  Starting ANI optimization")
-
-        os.environ["KMP_DUPLICATE_LIB_OK"] = "True"
-        DEVICE = torch.device("cpu")
-
-        # if a large system is used, you might need to increase the stack size
-        os.environ["OMP_STACKSIZE"] = self.args.stacksize
+    # ANI MAIN OPTIMIZATION PROCESS
+    def ani_optimize(self, mols, model_index=None):
+        """
+        Optimizes a list of conformers of the same molecule with ANI. The energies 
+        and forces of all the conformers are calculated in single forward/backward 
+        passes of the model, and the geometries are updated with a batched FIRE 
+        optimizer until each conformer converges (opt_fmax) or opt_steps is reached. 
+        If model_index is specified, only that network of the ANI ensemble is used
 
-        elements = ""
-        for _, atom in enumerate(mol.GetAtoms()):
-            elements += atom.GetSymbol()
+        Returns
+        -------
+        results : list
+            List with the optimized mol object, its energy (kcal/mol) and whether 
+            the optimization succeeded, for each conformer
+        """
 
-        cartesians = mol.GetConformers()[0].GetPositions()
-        coordinates = torch.tensor(
-            [cartesians.tolist()], requires_grad=True, device=DEVICE
-        )
-        cmin_valid = True
-        model = self.get_cmin_model()
+        import torch
+        import warnings
+        warnings.filterwarnings('ignore')
 
-        # define ase molecule using ANI calculator
-        ase_molecule = ase.Atoms(
-            elements, positions=coordinates.tolist()[0], calculator=model.ase()
-        )
+        if model_index is None:
+            self.args.log.write(f"\no  Starting ANI optimization of {len(mols)} conformers")
+        else:
+            self.args.log.write(f"\no  Starting ANI prescreening of {len(mols)} conformers")
 
-        # Adjust charge and multiplicity from the input SDFs
-        for i, atom in enumerate(ase_molecule):
-            # will update only for cdx, smi, and csv formats.
-            atom.charge = charge[i]
-            atom.magmom = mult[i]
+        DEVICE = torch.device("cpu")
 
-        optimizer = ase.optimize.BFGS(
-            ase_molecule, trajectory="cmin_opt.traj", logfile="cmin.opt"
-        )
+        model = self.get_cmin_model(model_index)
+
+        # all the conformers share the same atoms. Models that read atomic numbers
+        # (periodic_table_index) don't raise KeyError with unsupported elements, 
+        # so the atoms are checked against the elements of the model first
+        error_msg = f"\nx  {self.args.ani_method} could not optimize this molecule (i.e. check if all the atoms used are compatible with ANI)"
+        symbols = [atom.GetSymbol() for atom in mols[0].GetAtoms()]
+        model_symbols = getattr(model, "symbols", None) or getattr(model, "species", None)
+        if model_symbols is not None and not set(symbols).issubset(model_symbols):
+            self.args.log.write(error_msg)
+            return [(mol, 0, False) for mol in mols]
         try:
-            optimizer.run(fmax=self.args.opt_fmax, steps=self.args.opt_steps)
-
+            if getattr(model, "periodic_table_index", False):
+                species = torch.tensor([[atom.GetAtomicNum() for atom in mols[0].GetAtoms()]], device=DEVICE)
+            else:
+                species = model.species_to_tensor(symbols).to(DEVICE).unsqueeze(0)
         except KeyError:
-            self.args.log.write(f"\nx  {self.args.ani_method} could not optimize this molecule (i.e. check if all the atoms used are compatible with ANI)")
-            cmin_valid = False
-            energy = 0
-
-        if cmin_valid:
-            if len(ase.io.Trajectory("cmin_opt.traj", mode="r")) != (self.args.opt_steps + 1):
-                species_coords = ase_molecule.get_positions().tolist()
-                coordinates = torch.tensor(
-                    [species_coords], requires_grad=True, device=DEVICE
-                )
+            self.args.log.write(error_msg)
+            return [(mol, 0, False) for mol in mols]
+
+        if self.args.ani_jit:
+            try:
+                model = get_ani_model(self.args.ani_method, jit=True, model_index=model_index)
+            except (RuntimeError, torch.jit.frontend.FrontendError):
+                self.args.log.write(f"\nx  {self.args.ani_method} could not be compiled with TorchScript, the regular model will be used")
+
+        def energy_forces(coords):
+            # energies in eV and forces in eV/A, as in the opt_fmax option of ASE
+            coordinates = torch.tensor(coords, dtype=torch.float32, requires_grad=True, device=DEVICE)
+            _, ani_energies = model((species.expand(len(coords), -1), coordinates))
+            forces = -torch.autograd.grad(ani_energies.sum(), coordinates)[0]
+            return (
+                ani_energies.detach().double().numpy() * hartree_to_ev,
+                forces.double().numpy() * hartree_to_ev,
+            )
 
-            # compute energy:
-            species = model.species_to_tensor(elements).to(DEVICE).unsqueeze(0)
-            _, ani_energy = model((species, coordinates))
-            energy = ani_energy.item() * hartree_to_kcal  # Hartree to kcal/mol
+        cartesians = np.array([mol.GetConformers()[0].GetPositions() for mol in mols])
+        try:
+            cartesians, energies, _ = fire_optimize(
+                energy_forces, cartesians, self.args.opt_fmax, self.args.opt_steps
+            )
+        except ValueError:
+            self.args.log.write(error_msg)
+            return [(mol, 0, False) for mol in mols]
 
-            # update coordinates of mol object
-            cartesians = np.array(coordinates.tolist()[0])
+        # update coordinates of mol objects
+        results = []
+        for mol, coords, energy in zip(mols, cartesians, energies):
             for j in range(mol.GetNumAtoms()):
-                [x, y, z] = cartesians[j]
+                [x, y, z] = coords[j]
                 mol.GetConformer().SetAtomPosition(j, Point3D(x, y, z))
+            # eV to kcal/mol
+            results.append((mol, energy / hartree_to_ev * hartree_to_kcal, True))
 
-        return mol, energy, cmin_valid
+        return results
 
     # generate the CMIN optimization model
-    def get_cmin_model(self):
+    def get_cmin_model(self, model_index=None):
         """
-        Function to generate the optimization model for CMIN (using xTB or ANI methods)
+        Function to generate the optimization model for CMIN (using xTB or ANI methods).
+        The ANI model is only created once in each process (see get_ani_model)
         """
 
-        try:
-            import torchani
-        except (ImportError,ModuleNotFoundError):
-            self.args.log.write("x  Torchani is not installed! You can install the program with 'pip install torchani'")
-            self.args.log.finalize()
-            sys.exit()
-
-        model = getattr(torchani.models,self.args.ani_method)()
+        model = get_ani_model(self.args.ani_method, model_index=model_index)
 
         return model
 
@@ -576,4 +782,65 @@ class cmin:
         dup_data.at[dup_data_idx, "Overall charge"] = np.sum(charge)
         dup_data.at[dup_data_idx, "Mult"] = final_mult
 
-        return charge,mult,final_mult,dup_data
\ No newline at end of file
+        return charge,mult,final_mult,dup_data
+
+
+def cmin_job(args, job_input):
+    """
+    Optimizes a list of conformers (a single conformer with xTB) with xTB or ANI
+    using an isolated cmin object (the xTB files are created in private temporary
+    folders). This function is picklable, so it can be sent to the
+    multiprocessing pool of cmin
+
+    Returns
+    -------
+    results : list
+        List with the optimized mol object (PropertyMol), its energy in kcal/mol
+        and whether the optimization succeeded, for each conformer
+    messages : list
+        Messages of the log generated in the optimization
+    """
+
+    name, mols, charge, mult, model_index = job_input
+
+    job = cmin.__new__(cmin)
+    job.args = job_args(args, log=JobLogger())
+    job.name = name
+
+    # ANI calculations optimize all the conformers at once
+    if args.program.lower() == "ani":
+        results = job.ani_optimize(mols, model_index)
+    # xTB calculations use the xTB program directly
+    elif args.program.lower() == "xtb":
+        mol = mols[0]
+        # for contrained optimizations
+        complex_ts = False
+        if len(args.constraints_atoms) >= 1 or len(args.constraints_dist) >= 1 or len(args.constraints_angle) >= 1 or len(args.constraints_dihedral) >= 1:
+            complex_ts = True
+        name_init = mol.GetProp('_Name')
+        mol, energy, cmin_valid = xtb_opt_main(
+            name,
+            creation_of_dup_csv_cmin("xtb"),
+            0,
+            job,
+            charge,
+            mult,
+            None,
+            args.constraints_atoms,
+            args.constraints_dist,
+            args.constraints_angle,
+            args.constraints_dihedral,
+            'xtb',
+            args.geom,
+            complex_ts=complex_ts,
+            mol=mol,
+            name_init=name_init
+        )
+        results = [(mol, energy, cmin_valid)]
+
+    results = [
+        (PropertyMol(mol), energy, True) if cmin_valid else (mol, energy, False)
+        for mol, energy, cmin_valid in results
+    ]
+
+    return results, job.args.log.messages
@@ -3,9 +3,28 @@
 #             used in in the CMIN module            #
 #####################################################.
 
+import os
+import numpy as np
 import pandas as pd
 
 hartree_to_kcal = 627.509
+hartree_to_ev = 27.211386
+
+# ANI models loaded in this process (one per ani_method, single network of the
+# ensemble and TorchScript compilation)
+ANI_MODELS = {}
+
+# parameters of the FIRE optimizer (same default values as in ase.optimize.FIRE)
+FIRE_PARAMS = {
+    "dt": 0.1,
+    "maxstep": 0.2,
+    "dtmax": 1.0,
+    "Nmin": 5,
+    "finc": 1.1,
+    "fdec": 0.5,
+    "astart": 0.1,
+    "fa": 0.99,
+}
 
 
 def creation_of_dup_csv_cmin(cmin):
@@ -53,3 +72,152 @@ def creation_of_dup_csv_cmin(cmin):
 
     columns += end_columns
     return pd.DataFrame(columns=columns)
+
+
+def get_ani_model(ani_method, jit=False, model_index=None):
+    """
+    Returns the ANI model of ani_method (i.e. 'ANI2x'). The model is only created
+    the first time it's used in each process, so the weights of the ensemble are
+    loaded once and reused for all the conformers and files. If model_index is
+    specified, only that network of the ensemble is used. If jit is True, the
+    model is compiled with TorchScript and frozen (the eager model is still
+    needed to convert the atoms into species). If the compilation fails, the
+    error is raised once and the eager model is returned in the next calls
+    """
+
+    model_key = (ani_method, jit, model_index)
+    if model_key not in ANI_MODELS:
+        if jit:
+            import torch
+
+            eager_model = get_ani_model(ani_method, model_index=model_index)
+            try:
+                model = torch.jit.freeze(torch.jit.script(eager_model))
+            except (RuntimeError, torch.jit.frontend.FrontendError):
+                # the compilation isn't repeated in this process
+                ANI_MODELS[model_key] = eager_model
+                raise
+        elif model_index is not None:
+            # the network shares the weights of the ensemble
+            model = get_ani_model(ani_method)[model_index]
+        else:
+            import torchani
+
+            model = getattr(torchani.models, ani_method)()
+            # only the gradients of the coordinates are needed
+            model.eval()
+            model.requires_grad_(False)
+        ANI_MODELS[model_key] = model
+
+    return ANI_MODELS[model_key]
+
+
+def cmin_worker_init(program, ani_method, num_threads, prescreen=False, stacksize="1G"):
+    """
+    Initializer of the processes of the CMIN pool (also used in the main process
+    when the optimizations run serially). With ANI, it sets the OpenMP variables
+    of the process before torch is imported (if a large system is used, you might
+    need to increase the stack size), sets the number of torch threads of the
+    process (to share the CPUs between the processes) and loads the ANI model
+    before the first job arrives (the TorchScript models are compiled in the
+    first job, so compilation errors are shown in the log)
+    """
+
+    if program.lower() == "ani":
+        os.environ["KMP_DUPLICATE_LIB_OK"] = "True"
+        os.environ["OMP_STACKSIZE"] = stacksize
+
+        import torch
+
+        torch.set_num_threads(num_threads)
+        try:
+            get_ani_model(ani_method)
+            if prescreen:
+                get_ani_model(ani_method, model_index=0)
+        except Exception:
+            # the error is raised again (and shown) when the jobs use the model
+            pass
+
+
+def fire_optimize(energy_forces, coords, fmax, steps):
+    """
+    Optimizes an ensemble of conformers at the same time with the FIRE
+    algorithm (as in ase.optimize.FIRE, applied to each conformer separately).
+    The energies and forces of the conformers that are not converged are
+    calculated in a single call of energy_forces in each step, and the
+    conformers stop moving once their largest atomic force is lower than fmax.
+
+    Parameters
+    ----------
+    energy_forces : function
+        Function that returns the energies (array with shape (n_confs,)) and the
+        forces (array with shape (n_confs, n_atoms, 3)) of a coordinates array
+    coords : numpy.ndarray
+        Initial coordinates of the conformers, with shape (n_confs, n_atoms, 3)
+    fmax : float
+        Maximum force (in the units of energy_forces) to reach convergence
+    steps : int
+        Maximum number of steps
+
+    Returns
+    -------
+    coords : numpy.ndarray
+        Optimized coordinates
+    energies : numpy.ndarray
+        Energies of the optimized coordinates
+    converged : numpy.ndarray
+        Boolean array with the conformers that reached convergence
+    """
+
+    coords = np.array(coords, dtype=float)
+    n_confs = len(coords)
+    velocities = np.zeros_like(coords)
+    dt = np.full(n_confs, FIRE_PARAMS["dt"])
+    alpha = np.full(n_confs, FIRE_PARAMS["astart"])
+    n_downhill = np.zeros(n_confs, dtype=int)
+
+    energies, forces = energy_forces(coords)
+    energies, forces = np.array(energies, dtype=float), np.array(forces, dtype=float)
+    converged = np.sqrt((forces ** 2).sum(axis=2)).max(axis=1) < fmax
+
+    for step in range(int(steps)):
+        active = np.flatnonzero(~converged)
+        if len(active) == 0:
+            break
+        f, v = forces[active], velocities[active]
+
+        # the velocities are mixed with the forces while the conformers move
+        # downhill, and reset otherwise (not in the first step)
+        if step > 0:
+            vf = np.einsum("cij,cij->c", f, v)
+            downhill = vf > 0
+            f_norm = np.sqrt(np.einsum("cij,cij->c", f, f))
+            v_norm = np.sqrt(np.einsum("cij,cij->c", v, v))
+            a = alpha[active][:, None, None]
+            mixed = (1.0 - a) * v + a * f / np.maximum(f_norm, 1e-12)[:, None, None] * v_norm[:, None, None]
+            v = np.where(downhill[:, None, None], mixed, 0.0)
+
+            grow = active[downhill & (n_downhill[active] > FIRE_PARAMS["Nmin"])]
+            dt[grow] = np.minimum(dt[grow] * FIRE_PARAMS["finc"], FIRE_PARAMS["dtmax"])
+            alpha[grow] *= FIRE_PARAMS["fa"]
+            n_downhill[active[downhill]] += 1
+
+            reset = active[~downhill]
+            alpha[reset] = FIRE_PARAMS["astart"]
+            dt[reset] *= FIRE_PARAMS["fdec"]
+            n_downhill[reset] = 0
+
+        step_dt = dt[active][:, None, None]
+        v = v + step_dt * f
+        dr = step_dt * v
+        dr_norm = np.sqrt(np.einsum("cij,cij->c", dr, dr))
+        dr *= np.minimum(1.0, FIRE_PARAMS["maxstep"] / np.maximum(dr_norm, 1e-12))[:, None, None]
+
+        velocities[active] = v
+        coords[active] += dr
+        active_energies, active_forces = energy_forces(coords[active])
+        energies[active] = active_energies
+        forces[active] = active_forces
+        converged[active] = np.sqrt((forces[active] ** 2).sum(axis=2)).max(axis=1) < fmax
+
+    return coords, energies, converged
@@ -22,11 +22,39 @@ General
       Working directory 
    destination : str, default=None,
      Directory to create the output file(s)   
+   output : str, default='.sdf'  
+      Format of the output files with the conformers. Options: '.sdf' or 
+      '.aqmz' (compressed binary conformer archive that stores the topology, 
+      coordinates, energies and SDF properties of the conformers, much smaller 
+      and faster to read than SDF files). CMIN and QPREP accept both formats  
    varfile : str, default=None  
       Option to parse the variables using a yaml file (specify the filename)  
    max_workers : int, default=4  
-      Number of simultaneous RDKit jobs run with multiprocessing 
+      Number of simultaneous RDKit jobs run with multiprocessing. Each molecule 
+      of the input is sent to a different process (CREST jobs split the nprocs 
+      threads between the processes). Use max_workers=1 to run all the jobs sequentially
       (WARNING! More than 12 simultaneous jobs might collapse your computer!)  
+   input_chunksize : int, default=0  
+      If higher than 0, SMILES-based (.smi, .txt, etc.) and .csv inputs are read 
+      in chunks of input_chunksize molecules while the conformer searches run, 
+      instead of loading the whole file first. Only a few jobs per worker are 
+      kept in memory and the CSEARCH-Data CSV file is updated as the jobs 
+      finish (useful for large libraries of molecules)  
+   resume : bool, default=False  
+      Skip the jobs that already finished in a previous run with the same input 
+      and options. With resume=True, finished jobs are recorded in the 
+      CSEARCH-manifest.csv file of the destination folder (with the hashes of the job and the options, and the 
+      checksum of the output SDF file), and only the data of the remaining jobs is 
+      appended to the CSEARCH-Data CSV file  
+   conformer_cache : str, default=None  
+      Folder used as an on-disk conformer cache. If a folder is specified, the 
+      conformers of SMILES-based inputs are stored there and reused in later runs 
+      for molecules with the same canonical SMILES, charge, mult, constraints and 
+      sampling options (program, sample, seed, ff, thresholds, etc.) instead of 
+      repeating the conformer search  
+   max_cache_size : float, default=1000  
+      Maximum size of the conformer cache (in MB). The least recently used 
+      molecules are removed when the cache gets larger  
    charge : int, default=None  
       Charge of the calculations used in the following input files. 
       If charge isn't defined, it automatically reads the charge of the 
@@ -52,9 +80,21 @@ General RDKit-based
       isn't specified, AQME automatically calculates (previously benchmarked) an
       approximate number based on number of rotatable bonds, XH (i.e. OH) groups, 
       saturated cycles, etc (see the auto_sampling() function in csearch.py for 
-      more information)
+      more information). With sample='adaptive', the conformers are embedded 
+      and minimized in batches of auto_sample conformers until the batches 
+      stop finding new unique conformers (see sample_convergence and 
+      max_sample)
    auto_sample : int, default=20
       Base multiplicator number used in the sample option
+   sample_convergence : float, default=0.1
+      Only with sample='adaptive'. The sampling stops when a batch contributes 
+      fewer new unique conformers (after the energy and RMSD filters, without 
+      using the energy window) than this fraction of the conformers of the 
+      batch
+   max_sample : int, default=None
+      Only with sample='adaptive'. Maximum number of conformers embedded. If 
+      None, the maximum is 5 times the number of conformers used with 
+      sample='auto', so flexible molecules can be sampled further
    ff : str, default='MMFF'
       Force field used in RDKit optimizations and energy calculations. Current 
       options: MMFF and UFF (if MMFF fails, AQME tries to use UFF automatically)
@@ -98,6 +138,12 @@ General RDKit-based
       Threshold used to discard angles in the geom option (+-30 degrees) 
    dihedral_thres : float, default=30
       Threshold used to discard dihedral angles in the geom option (+-30 degrees) 
+   geom_prescreen : float, default=None
+      If defined, the embedded conformers are checked with the geom rule before 
+      the RDKit minimization, using the bond_thres, angle_thres and 
+      dihedral_thres thresholds multiplied by geom_prescreen (i.e. 2.0 to use 
+      +-60 degrees in angles). Only the conformers that pass this screening are 
+      minimized, and the final geom filter is applied after the minimization
 
 Only organometallic molecules
 .............................
@@ -119,6 +165,13 @@ SUMM only
       Interval of degrees to rotate dihedral angles during SUMM sampling 
       (i.e. 120.0 would create 3 conformers for each dihedral, at 0, 
       120 and 240 degrees)
+   ewin_prune_summ : float, default=None
+      If defined, branch-and-bound energy cutoff in kcal/mol used to speed up 
+      SUMM sampling of molecules with many rotatable bonds. After each dihedral 
+      rotation, the partial rotamer is discarded (with all the rotamers that 
+      share its dihedral angles) if its single-point energy (without 
+      minimization) is more than ewin_prune_summ above the lowest one found for 
+      the same dihedral
 
 Fullmonte only
 ++++++++++++++
@@ -140,6 +193,25 @@ Fullmonte only
       Available angle interval to use in the Fullmonte sampling. For example, if
       the angle is 120.0, the program chooses randomly between 120 and 240 
       degrees (picked at random) during each step of the sampling
+   nwalkers_fullmonte : int, default=1
+      Number of independent walkers (Markov chains) that share the 
+      nsteps_fullmonte steps of the Fullmonte sampling. The walkers run in 
+      parallel and merge their unique conformers every 10 steps, using 
+      the ewin_fullmonte and ewin_sample_fullmonte energy windows. The results 
+      are reproducible and don't depend on the number of processors available
+   nproposals_fullmonte : int, default=1
+      Number of random rotations (proposals) generated in each step of the 
+      Fullmonte sampling. When nproposals_fullmonte > 1, the proposals are 
+      stored as conformers of the same molecule, minimized together using 
+      multiple threads and filtered in one pass
+   ang_prefilter_fullmonte : float, default=None
+      Maximum difference in degrees between the dihedral angles of two 
+      conformers (considering the symmetry of the molecule) to compare them 
+      with the RMSD filter during the Fullmonte sampling (i.e. 60.0). Conformers 
+      with larger differences are considered different without calculating the 
+      RMSD, and only the conformers with similar dihedrals are searched (in 
+      buckets of dihedral angles). By default, the RMSD of all the conformers 
+      inside the energy_threshold is calculated
 
 CREST only
 ++++++++++
@@ -175,47 +247,63 @@ CREST only
       included in -c, --uhf, -P and --input. For example: '--alpb ch2cl2 --gfn 1' 
     crest_nrun : int, default=1
       Specify as number of runs if multiple starting points from RDKit starting points is required.
+      The runs are executed at the same time in separate folders, splitting the nprocs 
+      processors between them (i.e. crest_nrun=4 and nprocs=32 runs 4 CREST jobs with 8 
+      processors each)
 """
 #####################################################.
 #          This file stores the CSEARCH class       #
 #             used in conformer generation          #
 #####################################################.
 
-import math
 import os
+import copy
+import csv
 import sys
 import time
 import shutil
 import subprocess
 import glob
+from functools import partial
 from pathlib import Path
 import pandas as pd
 import concurrent.futures as futures
 import multiprocessing as mp
 from progress.bar import IncrementalBar
+from progress.counter import Counter
 import numpy as np
 
 from rdkit.Chem import AllChem as Chem
 from rdkit.Chem import Descriptors as Descriptors
 from rdkit.Chem import rdmolfiles
-from rdkit.Chem import rdMolTransforms, PropertyMol, rdDistGeom, Lipinski
+from rdkit.Chem import rdDistGeom, Lipinski
 
 from aqme.filter import (
     filters, ewin_filter,
     pre_E_filter,
     RMSD_and_E_filter,
-    geom_filter
+    geom_filter,
+    geom_rule,
+    EnergyWindow,
+    get_rmsd_coords,
+    get_best_rms_batch,
     )
 from aqme.csearch.utils import (
     prepare_direct_smi,
     prepare_smiles_files,
+    generate_smiles_jobs,
     prepare_csv_files,
+    generate_csv_jobs,
+    job_checksum,
+    params_checksum,
+    file_checksum,
     prepare_cdx_files,
     prepare_com_files,
     prepare_sdf_files,
     prepare_pdb_files,
     creation_of_dup_csv_csearch,
     minimize_rdkit_energy,
+    minimize_rdkit_confs,
     com_2_xyz,
     check_constraints,
     smi_to_mol,
@@ -224,15 +312,30 @@ from aqme.csearch.utils import (
     )
 from aqme.csearch.templates import template_embed, check_metal_neigh
 from aqme.csearch.fullmonte import generating_conformations_fullmonte, realign_mol
+from aqme.csearch.summ import generating_conformations_summ
 from aqme.utils import (
     substituted_mol,
     load_variables,
     set_metal_atomic_number,
     check_xtb,
     check_crest,
-    get_files
+    get_files,
+    JobLogger,
+    ConformerEnsemble,
+    conformer_writer,
+    conformer_reader,
     )
 from aqme.csearch.crest import xtb_opt_main
+from aqme.csearch.cache import (
+    conformer_cache_key,
+    load_cached_confs,
+    store_cached_confs,
+)
+
+# with sample='adaptive' and max_sample=None, up to this number of times the
+# conformers of sample='auto' are embedded (flexible molecules that keep finding
+# new conformers are sampled further, while rigid molecules stop early)
+ADAPTIVE_MAX_SAMPLE_FACTOR = 5
 
 
 class csearch:
@@ -296,6 +399,14 @@ class csearch:
                 sys.exit()
 
         for csearch_file in csearch_files:
+            # store all the information into a CSV file
+            csearch_file_no_path = (
+                os.path.basename(Path(csearch_file)).split(".")[0]
+            )
+            self.csearch_csv_file = self.args.w_dir_main.joinpath(
+                f"CSEARCH-Data-{csearch_file_no_path}.csv"
+            )
+
             # load jobs for conformer generation
             if self.args.smi is not None:
                 job_inputs = prepare_direct_smi(self.args)
@@ -303,23 +414,20 @@ class csearch:
             else:
                 job_inputs = self.load_jobs(csearch_file)
 
-            self.args.log.write(f"\nStarting CSEARCH with {len(job_inputs)} job(s) (SDF, XYZ, CSV, etc. files might contain multiple jobs/structures inside)\n")
+            if isinstance(job_inputs, list):
+                self.args.log.write(f"\nStarting CSEARCH with {len(job_inputs)} job(s) (SDF, XYZ, CSV, etc. files might contain multiple jobs/structures inside)\n")
+            else:
+                self.args.log.write(f"\nStarting CSEARCH reading the jobs of {os.path.basename(csearch_file)} in chunks of {self.args.input_chunksize} molecules\n")
 
             # runs the conformer sampling with multiprocessors
             self.run_csearch(job_inputs)
 
-            # store all the information into a CSV file
-            csearch_file_no_path = (
-                os.path.basename(Path(csearch_file)).split(".")[0]
-            )
-            self.csearch_csv_file = self.args.w_dir_main.joinpath(
-                f"CSEARCH-Data-{csearch_file_no_path}.csv"
-            )
-            if self.args.verbose:
+            # jobs read in chunks (or with resume=True) are written to the CSV file as they finish
+            if self.args.verbose and isinstance(job_inputs, list) and not self.args.resume:
                 self.final_dup_data.to_csv(self.csearch_csv_file, index=False)
 
             # removes systems that did not generate any conformers
-            for sdf_file in glob.glob(f'{self.args.w_dir_main}/CSEARCH/*.sdf'):
+            for sdf_file in glob.glob(f'{self.args.w_dir_main}/CSEARCH/*{self.args.output}'):
                 if os.path.getsize(sdf_file) == 0:
                     os.remove(sdf_file)
 
@@ -373,9 +481,21 @@ class csearch:
         Extension2inputgen["mol2"] = prepare_sdf_files
         Extension2inputgen["pdb"] = prepare_pdb_files
 
+        # large SMILES and CSV files are read in chunks while the jobs run
+        stream_jobs = int(self.args.input_chunksize) > 0
+        if stream_jobs:
+            for key in smi_derivatives:
+                Extension2inputgen[key] = generate_smiles_jobs
+            Extension2inputgen["csv"] = partial(
+                generate_csv_jobs, chunksize=int(self.args.input_chunksize)
+            )
+
         # Prepare the jobs
         prepare_function = Extension2inputgen[file_format]
         try:
+            if stream_jobs and file_format in smi_derivatives + ["csv"]:
+                # generators only open the file once the first job is requested
+                open(csearch_file).close()
             job_inputs = prepare_function(self.args, csearch_file)
         except FileNotFoundError:
             self.args.log.write(f'\nx  File {os.path.basename(csearch_file)} was not found! In the "input" option, make sure that 1) the PATH to the files is correct and 2) the PATH doesn\'t start with "/".')
@@ -388,47 +508,198 @@ class csearch:
         # create the dataframe to store the data
         self.final_dup_data = creation_of_dup_csv_csearch(self.args.program.lower())
 
-        bar = IncrementalBar(
-            "o  Number of finished jobs from CSEARCH", max=len(job_inputs)
+        # finished jobs are recorded in a manifest, so they can be skipped with resume=True
+        self.csearch_folder = get_csearch_folder(self.args)
+        self.manifest_file = self.csearch_folder.joinpath("CSEARCH-manifest.csv")
+        self.params_hash = params_checksum(self.args)
+        self.skipped_jobs = 0
+        finished_jobs = {}
+        if self.args.resume:
+            finished_jobs = self.load_manifest()
+
+        # jobs coming from generators (input_chunksize option) are read while the
+        # previous jobs run, so the total number of jobs is unknown
+        stream_jobs = not isinstance(job_inputs, list)
+        job_inputs = self.pending_jobs(job_inputs, finished_jobs)
+        if stream_jobs:
+            bar = Counter("o  Number of finished jobs from CSEARCH: ")
+        else:
+            job_inputs = list(job_inputs)
+            if self.skipped_jobs > 0:
+                self.args.log.write(f"\no  {self.skipped_jobs} job(s) skipped since they finished in a previous run (resume option)\n")
+            bar = IncrementalBar(
+                "o  Number of finished jobs from CSEARCH", max=len(job_inputs)
+            )
+
+        # rows of the CSV file (with resume=True, the new rows are appended to the previous file)
+        self.csv_columns = sorted(
+            set(self.final_dup_data.columns) | {"Real charge", "Mult"}
+        )
+        if self.args.verbose and os.path.exists(self.csearch_csv_file):
+            if self.args.resume:
+                self.csv_columns = list(pd.read_csv(self.csearch_csv_file, nrows=0).columns)
+            elif stream_jobs:
+                os.remove(self.csearch_csv_file)
+
+        parallel_run = (
+            int(self.args.max_workers) > 1
+            and (stream_jobs or len(job_inputs) > 1)
         )
-        with futures.ProcessPoolExecutor(
-            max_workers=self.args.max_workers, mp_context=mp.get_context("spawn")
-        ) as executor:
-            # Submit a set of asynchronous jobs
-            jobs = []
-            # Submit the Jobs
-            for job_input in job_inputs:
-                (
-                    smi_,
-                    name_,
-                    charge_,
-                    mult_,
-                    constraints_atoms_,
-                    constraints_dist_,
-                    constraints_angle_,
-                    constraints_dihedral_,
-                    complex_type_,
-                    geom_
-                ) = job_input
-                job = executor.submit(
-                    self.compute_confs(
-                        smi_,
-                        name_,
-                        charge_,
-                        mult_,
-                        constraints_atoms_,
-                        constraints_dist_,
-                        constraints_angle_,
-                        constraints_dihedral_,
-                        complex_type_,
-                        geom_
-                    )
-                )
-                jobs.append(job)
 
+        # the data of each job is stored in the same order as the jobs were loaded. With
+        # resume=True, the rows are appended to the CSV file before the job is added
+        # to the manifest, so the rows of finished jobs are kept if the run stops
+        append_rows = stream_jobs or self.args.resume
+        job_data = {}
+        if not parallel_run:
+            for i, (job_input, job_hash) in enumerate(job_inputs):
+                total_data, _, stop_csearch = csearch_job(self.args, job_input)
+                if stop_csearch:
+                    sys.exit()
+                self.store_job_data(job_data, i, total_data, append_rows)
+                self.update_manifest(job_input[1], job_hash)
                 bar.next()
 
-            bar.finish()
+        else:
+            # the log of each job is stored in the worker and written here once the job finishes
+            pool_args = job_args(self.args, log=JobLogger())
+            # xTB and CREST run in private folders (JobSandbox), so the jobs only
+            # need to split the nprocs threads between them
+            if self.args.program.lower() == "crest":
+                pool_args.nprocs = max(1, int(self.args.nprocs) // int(self.args.max_workers))
+                self.args.log.write(f"\no  Running the CREST jobs using {self.args.max_workers} processes with {pool_args.nprocs} threads each")
+            # only a few jobs per worker are submitted at a time, so the inputs are
+            # never loaded into memory all at once
+            max_pending = 2 * int(self.args.max_workers)
+            job_iter = enumerate(job_inputs)
+            with futures.ProcessPoolExecutor(
+                max_workers=self.args.max_workers, mp_context=mp.get_context("spawn")
+            ) as executor:
+                jobs = {}
+                inputs_left = True
+                while inputs_left or jobs:
+                    # Submit the Jobs
+                    while inputs_left and len(jobs) < max_pending:
+                        try:
+                            i, (job_input, job_hash) = next(job_iter)
+                        except StopIteration:
+                            inputs_left = False
+                            break
+                        job = executor.submit(csearch_job, pool_args, job_input)
+                        jobs[job] = (i, job_input[1], job_hash)
+                    if not jobs:
+                        break
+
+                    done_jobs, _ = futures.wait(
+                        jobs, return_when=futures.FIRST_COMPLETED
+                    )
+                    for job in done_jobs:
+                        i, job_name, job_hash = jobs.pop(job)
+                        total_data, job_log, stop_csearch = job.result()
+                        for message in job_log.messages:
+                            self.args.log.write(message)
+                        if stop_csearch:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            self.args.log.finalize()
+                            sys.exit()
+                        self.store_job_data(job_data, i, total_data, append_rows)
+                        self.update_manifest(job_name, job_hash)
+                        bar.next()
+
+        bar.finish()
+        if stream_jobs and self.skipped_jobs > 0:
+            self.args.log.write(f"\no  {self.skipped_jobs} job(s) skipped since they finished in a previous run (resume option)\n")
+
+        # Updates the dataframe with infromation about conformer generation
+        frames = [self.final_dup_data]
+        for i in sorted(job_data):
+            frames.append(job_data[i])
+        self.final_dup_data = pd.concat(frames, ignore_index=True, sort=True)
+
+    def store_job_data(self, job_data, idx, total_data, append_rows):
+        """
+        Keeps the data of a finished job, or appends it to the CSV file when the
+        jobs are read in chunks (input_chunksize option) or resume=True
+        """
+
+        if total_data is None:
+            return
+        if not append_rows:
+            job_data[idx] = total_data
+        elif self.args.verbose:
+            total_data = total_data.reindex(columns=self.csv_columns)
+            total_data.to_csv(
+                self.csearch_csv_file,
+                mode="a",
+                header=not os.path.exists(self.csearch_csv_file),
+                index=False,
+            )
+
+    def load_manifest(self):
+        """
+        Reads the jobs finished in previous runs from the CSEARCH manifest
+        """
+
+        finished_jobs = {}
+        if os.path.exists(self.manifest_file):
+            manifest = pd.read_csv(self.manifest_file, dtype=str, keep_default_na=False)
+            # if a job was run more than once, the last entry is used
+            for job_row in manifest.to_dict("records"):
+                finished_jobs[job_row["code_name"]] = job_row
+
+        return finished_jobs
+
+    def pending_jobs(self, job_inputs, finished_jobs):
+        """
+        Yields the jobs (and their hashes) that need to run, skipping the jobs 
+        from finished_jobs that don't need to be repeated
+        """
+
+        for job_input in job_inputs:
+            job_hash = job_checksum(job_input)
+            job_row = finished_jobs.get(str(job_input[1]))
+            if job_row is not None and self.finished_job(job_row, job_hash):
+                self.skipped_jobs += 1
+                continue
+            yield job_input, job_hash
+
+    def finished_job(self, job_row, job_hash):
+        """
+        Checks that a job from the manifest used the same input and options, and 
+        that its SDF file wasn't modified afterwards
+        """
+
+        if job_row["input_hash"] != job_hash or job_row["params_hash"] != self.params_hash:
+            return False
+        # jobs that didn't generate any conformers
+        if job_row["sdf_file"] == "":
+            return True
+        sdf_file = self.csearch_folder.joinpath(job_row["sdf_file"])
+
+        return sdf_file.exists() and file_checksum(sdf_file) == job_row["sdf_checksum"]
+
+    def update_manifest(self, job_name, job_hash):
+        """
+        Adds a finished job to the CSEARCH manifest (only used with resume=True)
+        """
+
+        if not self.args.resume:
+            return
+
+        sdf_name = f'{os.path.basename(Path(job_name)).split(".")[0]}_{self.args.program.lower()}{self.args.output}'
+        sdf_file = self.csearch_folder.joinpath(sdf_name)
+        if sdf_file.exists() and os.path.getsize(sdf_file) > 0:
+            sdf_checksum = file_checksum(sdf_file)
+        else:
+            sdf_name, sdf_checksum = "", ""
+
+        self.csearch_folder.mkdir(exist_ok=True, parents=True)
+        new_manifest = not os.path.exists(self.manifest_file)
+        with open(self.manifest_file, "a", newline="") as manifest:
+            writer = csv.writer(manifest)
+            if new_manifest:
+                writer.writerow(["code_name", "input_hash", "params_hash", "sdf_file", "sdf_checksum"])
+            writer.writerow([job_name, job_hash, self.params_hash, sdf_name, sdf_checksum])
 
     def compute_confs(
         self,
@@ -449,7 +720,8 @@ class csearch:
 
         self.args.log.write(f"\n   ----- {os.path.basename(Path(name))} -----")
 
-        if self.args.smi is not None or os.path.basename(Path(self.args.input)).split(".")[1] in ["smi","csv","cdx","txt","yaml","yml","rtf"]:
+        smiles_input = self.args.smi is not None or os.path.basename(Path(self.args.input)).split(".")[1] in ["smi","csv","cdx","txt","yaml","yml","rtf"]
+        if smiles_input:
             (
                 mol,
                 constraints_atoms,
@@ -488,18 +760,34 @@ class csearch:
             # check if the optimization is constrained
             complex_ts = check_constraints(self)
 
-        if self.args.destination is None:
-            self.csearch_folder = Path(self.args.initial_dir).joinpath(
-                f"CSEARCH"
-            )
-        else:
-            if self.args.initial_dir.as_posix() in f"{self.args.destination}":
-                self.csearch_folder = Path(self.args.destination)
-            else:
-                self.csearch_folder = Path(self.args.initial_dir).joinpath(self.args.destination)
-
+        self.csearch_folder = get_csearch_folder(self.args)
         self.csearch_folder.mkdir(exist_ok=True, parents=True)
 
+        # molecules from SMILES inputs can reuse the conformers stored in the conformer cache
+        cache_key = None
+        if self.args.conformer_cache is not None and smiles_input:
+            start_time = time.time()
+            sdf_file = self.csearch_folder.joinpath(
+                f'{os.path.basename(Path(name)).split(".")[0]}_{self.args.program.lower()}{self.args.output}'
+            )
+            cache_key = conformer_cache_key(
+                self.args,
+                mol,
+                charge,
+                mult,
+                constraints_atoms,
+                constraints_dist,
+                constraints_angle,
+                constraints_dihedral,
+                complex_type,
+                geom,
+            )
+            cached_data = load_cached_confs(self.args, cache_key, name, smi, sdf_file)
+            if cached_data is not None:
+                self.args.log.write(f"\no  Conformers of {os.path.basename(Path(name))} loaded from the conformer cache")
+                cached_data["CSEARCH time (seconds)"] = round(time.time() - start_time, 2)
+                return cached_data
+
         # for 3D input types
         if self.args.program.lower() in ["crest"] and self.args.smi is None:
             if os.path.basename(Path(self.args.input)).split(".")[1] in ["pdb", "mol2", "mol", "sdf"]:
@@ -613,9 +901,10 @@ class csearch:
                 geom
             )
 
-        # Updates the dataframe with infromation about conformer generation
-        frames = [self.final_dup_data, total_data]
-        self.final_dup_data = pd.concat(frames, ignore_index=True, sort=True)
+        if cache_key is not None:
+            store_cached_confs(self.args, cache_key, name, sdf_file, total_data)
+
+        return total_data
 
     # automatic detection of metal atoms   
     def find_metal_atom(self,mol,charge,mult):
@@ -700,31 +989,25 @@ class csearch:
                 n_seconds = round(time.time() - start_time, 2)
                 dup_data.at[dup_data_idx, "CSEARCH time (seconds)"] = n_seconds
             else:
-                for pt in range(1, int(self.args.crest_nrun)+1):
-                    start_time = time.time()
-                    dup_data.at[dup_data_idx, "Real charge"] = charge
-                    dup_data.at[dup_data_idx, "Mult"] = mult
-                    dup_data.at[dup_data_idx, "Molecule"] = name + "_run_{0}".format(pt)
+                num_start_points = int(self.args.crest_nrun)
+                for pt in range(1, num_start_points+1):
+                    dup_data.at[pt-1, "Real charge"] = charge
+                    dup_data.at[pt-1, "Mult"] = mult
                     shutil.copy(f"{name}_{self.args.program.lower()}.xyz", f"{name}_run_{pt}_{self.args.program.lower()}.xyz")
-                    status = xtb_opt_main(
-                        f"{name}_run_{pt}_{self.args.program.lower()}",
-                        dup_data,
-                        dup_data_idx,
-                        self,
-                        charge,
-                        mult,
-                        smi,
-                        constraints_atoms,
-                        constraints_dist,
-                        constraints_angle,
-                        constraints_dihedral,
-                        'crest',
-                        geom,
-                        mol=mol, 
-                    )
-                    n_seconds = round(time.time() - start_time, 2)
-                    dup_data.at[dup_data_idx, "CSEARCH time (seconds)"] = n_seconds
-                    dup_data_idx +=1
+                status = self.crest_multistart(
+                    name,
+                    num_start_points,
+                    dup_data,
+                    charge,
+                    mult,
+                    smi,
+                    constraints_atoms,
+                    constraints_dist,
+                    constraints_angle,
+                    constraints_dihedral,
+                    geom,
+                    mol=mol,
+                )
 
         else:
             start_time = time.time()
@@ -735,7 +1018,7 @@ class csearch:
             if self.args.crest_nrun != 1 and self.args.program.lower() =='crest':
                 sdwriter_init = None
             else:
-                sdwriter_init = Chem.SDWriter(str(self.csearch_file))
+                sdwriter_init = conformer_writer(self.csearch_file)
 
             valid_structure = filters(
                 mol, self.args.log, self.args.max_mol_wt
@@ -772,11 +1055,11 @@ class csearch:
 
         #combining all the sdfs from more than one run
         if self.args.crest_nrun != 1:
-            sdwriter_rd = Chem.SDWriter(str(self.csearch_file))
-            file_runs = glob.glob(str(self.csearch_folder)+'/'+ name +'_run_*'+ self.args.program.lower() +'.sdf')
+            sdwriter_rd = conformer_writer(self.csearch_file)
+            file_runs = glob.glob(str(self.csearch_folder)+'/'+ name +'_run_*'+ self.args.program.lower() + self.args.output)
             allenergy, allmols = [], []
             for file in file_runs:
-                mols = Chem.SDMolSupplier(file, removeHs=False)
+                mols = conformer_reader(file, removeHs=False)
                 for mol in mols:
                     allmols.append(mol)
                     allenergy.append(float(mol.GetProp('Energy')))
@@ -784,6 +1067,7 @@ class csearch:
             allmols_sorted = [mol for _, mol in sorted(zip(allenergy, allmols), key=lambda pair: pair[0])]
             for mol in allmols_sorted:
                 sdwriter_rd.write(mol)
+            sdwriter_rd.close()
         return dup_data
 
     def summ_search(
@@ -850,13 +1134,9 @@ class csearch:
                     sdwriter.close()
             except RuntimeError:
                 pass
-            # reads the initial SDF files from RDKit and uses dihedral scan if selected
+            # the SUMM rotamers are minimized and filtered while they are generated
             if status not in [-1, 0]:
-                # getting the energy and mols after rotations
                 if self.args.program.lower() == "summ" and len(rotmatches) != 0:
-                    status = self.dihedral_filter_and_sdf(
-                        name, dup_data, dup_data_idx, coord_Map, alg_Map, mol_template, ff
-                    )
                     n_seconds = round(time.time() - start_time, 2)
                     dup_data.at[dup_data_idx, "CSEARCH time (seconds)"] = n_seconds
 
@@ -864,18 +1144,23 @@ class csearch:
             stop_xtb_opt = False
             if not complex_ts:
                 # mol_crest is the RDKit-optimized mol object
+                # (the mol objects written to the XYZ files, with H atoms, are the topology
+                # of the CREST conformers)
                 if mol_crest is not None:
                     if self.args.crest_nrun == 1:
                         dup_data.at[dup_data_idx, "Molecule"] = name
                         rdmolfiles.MolToXYZFile(mol_crest[0], name + "_crest.xyz")
+                        crest_mols = [mol_crest[0]]
                     else:
                         # clustering to get the best mol objects
-                        cluster_centroird_mols, centroids = cluster_conformers(mol_crest, self.args.heavyonly, self.args.max_matches_rmsd, self.args.crest_nclust)
+                        n_processes = max(1, (os.cpu_count() or 1) // int(self.args.max_workers))
+                        cluster_centroird_mols, centroids = cluster_conformers(mol_crest, self.args.heavyonly, self.args.max_matches_rmsd, self.args.crest_nclust, n_processes)
                         num_start_points = min(int(self.args.crest_nrun), len(cluster_centroird_mols))
                         for pt in range(1, num_start_points+1):
                             dup_data.at[dup_data_idx, "Molecule"] = name + "_run_{0}".format(pt)
-                            rdmolfiles.MolToXYZFile(cluster_centroird_mols[pt-1], name + "_run_{0}_crest.xyz".format(pt), confId=centroids[pt-1])
-                            
+                            rdmolfiles.MolToXYZFile(cluster_centroird_mols[pt-1], name + "_run_{0}_crest.xyz".format(pt))
+                        crest_mols = cluster_centroird_mols[:num_start_points]
+
                 else:
                     stop_xtb_opt = True
                     status = -1
@@ -886,11 +1171,13 @@ class csearch:
                     if self.args.crest_nrun == 1:
                         dup_data.at[dup_data_idx, "Molecule"] = name
                         rdmolfiles.MolToXYZFile(mol, name + "_crest.xyz")
+                        crest_mols = [mol]
                     else:
                         num_start_points = min(int(self.args.crest_nrun), len(mol_crest))
                         for pt in range(1, num_start_points+1):
                             dup_data.at[pt-1, "Molecule"] = name + "_run_{0}".format(pt)
                             rdmolfiles.MolToXYZFile(mol, name + "_run_{0}_crest.xyz".format(pt))
+                        crest_mols = [mol] * num_start_points
                 else:
                     stop_xtb_opt = True
                     status = -1
@@ -913,122 +1200,96 @@ class csearch:
                         'crest',
                         geom,
                         complex_ts=complex_ts,
-                        mol=mol, # this is necessary for CREST calculations with constraints 
+                        mol=crest_mols[0], # this is necessary for CREST calculations with constraints 
                         )
                     n_seconds = round(time.time() - start_time, 2)
                     dup_data.at[dup_data_idx, "CSEARCH time (seconds)"] = n_seconds
                 else:
-                    num_start_points = min(int(self.args.crest_nrun), len(mol_crest))
+                    num_start_points = len(crest_mols)
                     dup_data = pd.DataFrame(np.repeat(dup_data.values, num_start_points, axis=0), columns=dup_data.columns)
-                    for pt in range(1, num_start_points+1):
-                        start_time = time.time()
-                        dup_data.at[pt-1, "Molecule"] = f"{name}_run_{pt}"
-                        status = xtb_opt_main(
-                            f"{name}_run_{pt}_{self.args.program.lower()}",
-                            dup_data,
-                            pt-1,
-                            self,
-                            charge,
-                            mult,
-                            smi,
-                            constraints_atoms,
-                            constraints_dist,
-                            constraints_angle,
-                            constraints_dihedral,
-                            'crest',
-                            geom,
-                            complex_ts=complex_ts,
-                            mol=mol, # this is necessary for CREST calculations with constraints
-                            
-                        )
-                        n_seconds = round(time.time() - start_time, 2)
-                        dup_data.at[pt-1, "CSEARCH time (seconds)"] = n_seconds
+                    status = self.crest_multistart(
+                        name,
+                        num_start_points,
+                        dup_data,
+                        charge,
+                        mult,
+                        smi,
+                        constraints_atoms,
+                        constraints_dist,
+                        constraints_angle,
+                        constraints_dihedral,
+                        geom,
+                        complex_ts=complex_ts,
+                        mols=crest_mols, # this is necessary for CREST calculations with constraints
+                    )
 
         return status, dup_data
 
-    def dihedral_filter_and_sdf(
-        self, name, dup_data, dup_data_idx, coord_Map, alg_Map, mol_template, ff
+    def crest_multistart(
+        self,
+        name,
+        num_start_points,
+        dup_data,
+        charge,
+        mult,
+        smi,
+        constraints_atoms,
+        constraints_dist,
+        constraints_angle,
+        constraints_dihedral,
+        geom,
+        complex_ts=False,
+        mols=None,
     ):
         """
-        Filtering after dihedral scan to sdf
+        Runs the CREST sampling of the starting points ({name}_run_{pt}_crest.xyz)
+        when crest_nrun > 1, using the mol object of each starting point (mols) as
+        the topology of its conformers. Each run uses a private scratch folder, so 
+        the runs are executed at the same time in a pool of threads (CREST runs in 
+        its own subprocesses), splitting the nprocs threads between them
         """
 
-        rotated_energy = []
+        n_processes = min(num_start_points, max(1, int(self.args.nprocs)))
+        # the log file can't be shared with the runs, which send their messages
+        # once they finish
+        run_args = job_args(self.args, log=JobLogger())
+        run_args.nprocs = max(1, int(self.args.nprocs) // n_processes)
 
-        # apply filters
-        rdmols = Chem.SDMolSupplier(str(self.csearch_file), removeHs=False) 
-        if rdmols is None:
-            self.args.log.write("\nCould not open " + name + self.args.output)
-            if os.path.basename(Path(self.args.input)).split(".")[1] not in ["csv","cdx","txt","yaml","yml","rtf"]:
-                self.args.log.finalize()
-                sys.exit()
-            return
-
-        for i, rd_mol_i in enumerate(rdmols):
-            if coord_Map is None and alg_Map is None and mol_template is None:
-                energy = minimize_rdkit_energy(
-                    rd_mol_i, -1, self.args.log, ff, self.args.opt_steps_rdkit
-                )
-            else:
-                rd_mol_i, energy = realign_mol(
-                    rd_mol_i,
-                    -1,
-                    coord_Map,
-                    alg_Map,
-                    mol_template,
-                    self.args.opt_steps_rdkit,
+        run_inputs = []
+        for pt in range(1, num_start_points+1):
+            dup_data.at[pt-1, "Molecule"] = f"{name}_run_{pt}"
+            run_inputs.append(
+                (
+                    f"{name}_run_{pt}_{self.args.program.lower()}",
+                    charge,
+                    mult,
+                    smi,
+                    constraints_atoms,
+                    constraints_dist,
+                    constraints_angle,
+                    constraints_dihedral,
+                    geom,
+                    complex_ts,
+                    # each run gets its own copy, since the runs share the process
+                    None if mols is None else Chem.Mol(mols[pt-1]),
                 )
-            rotated_energy.append(energy)
+            )
 
-        rotated_cids = list(range(len(rdmols)))
-        sorted_rotated_cids = sorted(rotated_cids, key=lambda cid: rotated_energy[cid])
+        if n_processes == 1:
+            results = [crest_run_job(run_args, inputs) for inputs in run_inputs]
+        else:
+            self.args.log.write(f"\no  Running {num_start_points} CREST runs at the same time ({n_processes} runs with {run_args.nprocs} threads each)")
+            with futures.ThreadPoolExecutor(max_workers=n_processes) as executor:
+                jobs = [executor.submit(crest_run_job, run_args, inputs) for inputs in run_inputs]
+                results = [job.result() for job in jobs]
+
+        status = None
+        for pt, (status, n_confs, n_seconds, messages) in enumerate(results):
+            for message in messages:
+                self.args.log.write(message)
+            dup_data.at[pt, "crest-conformers"] = n_confs
+            dup_data.at[pt, "CSEARCH time (seconds)"] = n_seconds
 
-        # filter based on energy window ewin_csearch
-        sortedcids_rotated = ewin_filter(
-            sorted_rotated_cids,
-            rotated_energy,
-            dup_data,
-            dup_data_idx,
-            "summ",
-            self.args.ewin_csearch,
-        )
-        # pre-filter based on energy only
-        selectedcids_initial_rotated = pre_E_filter(
-            sortedcids_rotated,
-            rotated_energy,
-            dup_data,
-            dup_data_idx,
-            "summ",
-            self.args.initial_energy_threshold,
-        )
-        # filter based on energy and RMSD
-        selectedcids_rotated = RMSD_and_E_filter(
-            rdmols,
-            selectedcids_initial_rotated,
-            rotated_energy,
-            self.args,
-            dup_data,
-            dup_data_idx,
-            "summ",
-        )
-        mol_select = []
-        for i, cid in enumerate(selectedcids_rotated):
-            mol_rd = Chem.RWMol(rdmols[cid])
-            mol_rd.SetProp("_Name", rdmols[cid].GetProp("_Name") + " " + str(i))
-            mol_rd.SetProp("Energy", str(rotated_energy[cid]))
-            if len(self.args.metal_atoms) >= 1:
-                set_metal_atomic_number(
-                    mol_rd, self.args.metal_idx, self.args.metal_sym
-                )
-            mol_select.append(mol_rd) 
-
-        # update SDF file            
-        os.remove(self.csearch_file)
-        sdwriter_rd = Chem.SDWriter(str(self.csearch_file))
-        for mol in mol_select:
-            sdwriter_rd.write(mol)
-        sdwriter_rd.close()
-        status = 1
         return status
 
     def auto_sampling(self, mol):
@@ -1070,8 +1331,8 @@ class csearch:
     ):
         """
         If program = RDKit, this replaces iodine back to the metal (if needed) 
-        and writes the RDKit SDF files. With program = summ, this function 
-        optimizes rotamers
+        and writes the RDKit SDF files (the rotamers of SUMM are generated in 
+        generating_conformations_summ)
         """
 
         if i >= len(matches):  # base case, torsions should be set in conf
@@ -1121,36 +1382,9 @@ class csearch:
 
             return mol
 
-        # when SUMM is selected, this cycle generates conformers based on rotation of dihedral angles
-        total = 0
-        deg = 0
-        while deg < 360.0:
-            rad = math.pi * deg / 180.0
-            rdMolTransforms.SetDihedralRad(
-                mol.GetConformer(conf), *matches[i], value=rad
-            )
-            mol.SetProp("_Name", name)
-            total += self.genConformer_r(
-                mol,
-                conf,
-                i + 1,
-                matches,
-                sdwriter,
-                name,
-                update_to_rdkit,
-                coord_Map,
-                alg_Map,
-                mol_template,
-                original_atn,
-                geom
-            )
-            deg += int(self.args.degree)
-
-        return total
-
-    def embed_conf(self, mol, initial_confs, coord_Map, alg_Map, mol_template):
+    def embed_conf(self, mol, initial_confs, coord_Map, alg_Map, mol_template, seed=None):
         """
-        Function to embed conformers
+        Function to embed conformers (using the seed option if seed is None)
         """
 
         is_sdf_mol_or_mol2 = os.path.basename(Path(self.args.input)).split('.')[1].lower() in [
@@ -1164,7 +1398,7 @@ class csearch:
 
         embed_kwargs = dict()
         embed_kwargs["ignoreSmoothingFailures"] = True
-        embed_kwargs["randomSeed"] = self.args.seed
+        embed_kwargs["randomSeed"] = self.args.seed if seed is None else seed
         embed_kwargs["numThreads"] = 0
 
         if (coord_Map, alg_Map, mol_template) != (None, None, None):
@@ -1188,16 +1422,52 @@ class csearch:
 
     def min_and_E_calc(self, mol, cids, coord_Map, alg_Map, mol_template, ff, geom):
         """
-        Minimization and E calculation with RDKit after embeding
+        Minimization and E calculation with RDKit after embeding. The conformers 
+        that pass the geom filter are stored in a ConformerEnsemble
         """
 
-        cenergy, outmols = [], []
+        cenergy, passing_cids = [], []
+
+        # the atoms of the geom rule are only searched once per molecule
+        rule = None
+        if geom != []:
+            mol_geom = Chem.Mol(mol)
+            if len(self.args.metal_atoms) >= 1:
+                set_metal_atomic_number(mol_geom, self.args.metal_idx, self.args.metal_sym)
+            rule = geom_rule(self, mol_geom, geom)
+
+            # conformers that are far from the geom rule before the minimization
+            # are discarded (with looser thresholds than the final geom filter)
+            if self.args.geom_prescreen is not None:
+                screened_cids = [
+                    conf
+                    for conf in cids
+                    if geom_filter(
+                        self,
+                        mol_geom,
+                        geom,
+                        rule=rule,
+                        thres_factor=float(self.args.geom_prescreen),
+                        conf=conf,
+                    )
+                ]
+                screened_set = set(screened_cids)
+                for conf in cids:
+                    if conf not in screened_set:
+                        mol.RemoveConformer(conf)
+                self.args.log.write(f"\no  {len(cids) - len(screened_cids)} embedded conformers discarded by the geom filter before the minimization (geom_prescreen = {self.args.geom_prescreen})")
+                cids = screened_cids
+
+        if coord_Map is None and alg_Map is None and mol_template is None:
+            # all the conformers are minimized at once, using the CPUs available for this job
+            num_threads = max(1, (os.cpu_count() or 1) // int(self.args.max_workers))
+            energies = minimize_rdkit_confs(
+                mol, self.args.log, ff, self.args.opt_steps_rdkit, num_threads
+            )
 
         for _, conf in enumerate(cids):
             if coord_Map is None and alg_Map is None and mol_template is None:
-                energy = minimize_rdkit_energy(
-                    mol, conf, self.args.log, ff, self.args.opt_steps_rdkit
-                )
+                energy = energies[conf]
             else:  # template realign before doing calculations
                 mol, energy = realign_mol(
                     mol,
@@ -1209,17 +1479,103 @@ class csearch:
                 )
 
             # removes geometries that do not pass the filters (geom option)
-            mol_geom = Chem.Mol(mol)
-            if len(self.args.metal_atoms) >= 1:
-                set_metal_atomic_number(mol_geom, self.args.metal_idx, self.args.metal_sym)
-            passing_geom = geom_filter(self,mol_geom,geom)
+            if geom != []:
+                mol_geom = Chem.Mol(mol, confId=conf)
+                mol_geom.GetConformer(conf).SetId(0)
+                if len(self.args.metal_atoms) >= 1:
+                    set_metal_atomic_number(mol_geom, self.args.metal_idx, self.args.metal_sym)
+                passing_geom = geom_filter(self,mol_geom,geom,rule=rule)
+            else:
+                passing_geom = True
             if passing_geom:
                 cenergy.append(energy)
-                pmol = PropertyMol.PropertyMol(mol)
-                outmols.append(pmol)
+                passing_cids.append(conf)
+
+        outmols = ConformerEnsemble.from_mol(mol, passing_cids, cenergy)
 
         return outmols, cenergy
 
+    def adaptive_embed(
+        self,
+        mol,
+        max_confs,
+        coord_Map,
+        alg_Map,
+        mol_template,
+        ff,
+        geom,
+    ):
+        """
+        Embeds and minimizes conformers in batches of auto_sample conformers 
+        (sample='adaptive'). After each batch, the new conformers are compared 
+        with the unique conformers found so far (same energy and RMSD criteria 
+        as pre_E_filter and RMSD_and_E_filter) and the sampling stops when the 
+        new unique conformers of the batch are fewer than sample_convergence 
+        times the conformers embedded, or when max_confs conformers are embedded
+        """
+
+        batch_size = int(self.args.auto_sample)
+        initial_energy_threshold = float(self.args.initial_energy_threshold)
+        energy_threshold = float(self.args.energy_threshold)
+        rms_threshold = float(self.args.rms_threshold)
+        coords, cenergy = [], []
+        outmols = None
+        # conformers accepted by the energy filter and by the energy and RMSD filters
+        energy_window, unique_window = EnergyWindow(), EnergyWindow()
+        rms_coords = {}
+        n_embedded, n_batch, n_unique = 0, 0, 0
+        while n_embedded < max_confs:
+            n_confs = min(batch_size, max_confs - n_embedded)
+            # each batch uses a different seed to get new conformers
+            cids = self.embed_conf(
+                mol, n_confs, coord_Map, alg_Map, mol_template, seed=self.args.seed + n_batch
+            )
+            n_embedded += len(cids)
+            n_batch += 1
+            if len(cids) == 0:
+                break
+
+            batch_mols, batch_energy = self.min_and_E_calc(
+                mol, cids, coord_Map, alg_Map, mol_template, ff, geom
+            )
+            n_previous = len(cenergy)
+            coords.extend(batch_mols.coords)
+            cenergy.extend(batch_energy)
+            outmols = ConformerEnsemble(batch_mols.mol, coords, cenergy)
+            if len(cenergy) == n_previous:
+                continue
+
+            # only the conformers of the new batch are filtered (the counters of
+            # dup_data are filled once all the conformers are embedded)
+            batch_cids = sorted(range(n_previous, len(cenergy)), key=lambda cid: cenergy[cid])
+            batch_coords, matches = get_rmsd_coords(
+                outmols, batch_cids, "rdkit", self.args.heavyonly, int(self.args.max_matches_rmsd)
+            )
+            rms_coords.update(batch_coords)
+            n_new = 0
+            for cid in batch_cids:
+                if len(energy_window.get_cids(cenergy[cid], initial_energy_threshold, max_cids=1)) > 0:
+                    continue
+                energy_window.add(cid, cenergy[cid])
+                seen_cids = unique_window.get_cids(cenergy[cid], energy_threshold)
+                if len(seen_cids) > 0:
+                    rms_list = get_best_rms_batch(
+                        rms_coords[cid], np.array([rms_coords[seen_cid] for seen_cid in seen_cids]), matches
+                    )
+                    if min(rms_list) < rms_threshold:
+                        continue
+                unique_window.add(cid, cenergy[cid])
+                n_new += 1
+            n_unique += n_new
+            self.args.log.write(f"\no  Adaptive sampling: batch {n_batch} ({len(cids)} conformers) added {n_new} new unique conformers ({n_unique} in total)")
+            if n_new < float(self.args.sample_convergence) * len(cids):
+                break
+
+        if outmols is None:
+            outmols = ConformerEnsemble(mol)
+
+        return outmols, cenergy, n_embedded
+
     def min_after_embed(
         self,
         mol,
@@ -1238,29 +1594,35 @@ class csearch:
         ff,
         smi,
         geom,
-        original_atn
+        original_atn,
+        minimized=None
     ):
         """
-        Minimizes, gets the energy and filters RDKit conformers after embeding
+        Minimizes, gets the energy and filters RDKit conformers after embeding 
+        (minimized contains the conformers and energies if they were already 
+        minimized during the adaptive sampling)
         """
 
         # gets optimized mol objects and energies
         if geom != []:
             self.args.log.write(f"o  Applying geometry filters ({geom})")
-        outmols, cenergy = self.min_and_E_calc(
-            mol, cids, coord_Map, alg_Map, mol_template, ff, geom
-        )
+        if minimized is None:
+            outmols, cenergy = self.min_and_E_calc(
+                mol, cids, coord_Map, alg_Map, mol_template, ff, geom
+            )
+        else:
+            outmols, cenergy = minimized
 
         # writing charges and multiplicity after RDKit
         dup_data.at[dup_data_idx, "Mult"] = mult
         dup_data.at[dup_data_idx, "Real charge"] = charge
 
-        for i, cid in enumerate(cids):
-            outmols[cid].SetProp("_Name", name + " " + str(i + 1))
-            outmols[cid].SetProp("Energy", str(cenergy[cid]))
-            outmols[cid].SetProp("Real charge", str(charge))
-            outmols[cid].SetProp("Mult", str(mult))
-            outmols[cid].SetProp("SMILES", str(smi))
+        n_confs = len(outmols)
+        outmols.set_prop("_Name", [name + " " + str(i + 1) for i in range(n_confs)])
+        outmols.set_prop("Energy", cenergy)
+        outmols.set_prop("Real charge", [charge] * n_confs)
+        outmols.set_prop("Mult", [mult] * n_confs)
+        outmols.set_prop("SMILES", [smi] * n_confs)
 
         # sorts the energies
         cids = list(range(len(outmols)))
@@ -1299,24 +1661,37 @@ class csearch:
             "rdkit",
         )
 
-        if self.args.program.lower() in ["summ", "rdkit", "crest"]:
+        if self.args.program.lower() == "summ" and not update_to_rdkit:
             # now exhaustively drive torsions of selected conformers
+            status = generating_conformations_summ(
+                name,
+                self.args,
+                rotmatches,
+                selectedcids_rdkit,
+                outmols,
+                sdwriter,
+                dup_data,
+                dup_data_idx,
+                coord_Map,
+                alg_Map,
+                mol_template,
+                ff,
+            )
+
+        elif self.args.program.lower() in ["summ", "rdkit", "crest"]:
             total = 0
+            crest_mols = []
             for conf in selectedcids_rdkit:
-                if self.args.program.lower() == "summ" and not update_to_rdkit:
-                    sdwriter.write(outmols[conf], conf)
-                    for m in rotmatches:
-                        rdMolTransforms.SetDihedralDeg(
-                            outmols[conf].GetConformer(conf), *m, 180.0
-                        )
+                # mol object with only this conformer (created from the ensemble)
+                mol_conf = outmols[conf]
                 if self.args.program.lower() in ["summ", "rdkit"]:
                     total += self.genConformer_r(
-                        outmols[conf],
+                        mol_conf,
                         conf,
                         0,
                         rotmatches,
                         sdwriter,
-                        outmols[conf].GetProp("_Name"),
+                        mol_conf.GetProp("_Name"),
                         update_to_rdkit,
                         coord_Map,
                         alg_Map,
@@ -1326,12 +1701,12 @@ class csearch:
                     )
                 elif self.args.program.lower() in ["crest"]:
                     mol = self.genConformer_r(
-                        outmols[conf],
+                        mol_conf,
                         conf,
                         0,
                         rotmatches,
                         sdwriter,
-                        outmols[conf].GetProp("_Name"),
+                        mol_conf.GetProp("_Name"),
                         update_to_rdkit,
                         coord_Map,
                         alg_Map,
@@ -1339,13 +1714,18 @@ class csearch:
                         original_atn,
                         geom
                     )
-                    outmols = [mol]
-                    break
+                    # the lowest energy conformer is enough for a single CREST run,
+                    # multiple runs start from the centroids of the clusters
+                    crest_mols.append(mol)
+                    if int(self.args.crest_nrun) == 1:
+                        break
 
             status = 1
 
-        if self.args.program.lower() == "summ":
-            dup_data.at[dup_data_idx, "summ-conformers"] = total
+            if self.args.program.lower() == "summ":
+                dup_data.at[dup_data_idx, "summ-conformers"] = total
+            elif self.args.program.lower() == "crest":
+                outmols = crest_mols
 
         if self.args.program.lower() == "fullmonte":
             status = generating_conformations_fullmonte(
@@ -1404,6 +1784,11 @@ class csearch:
             initial_confs = self.args.auto_sample
         elif self.args.sample == "auto":
             initial_confs = int(self.auto_sampling(mol))
+        elif self.args.sample == "adaptive":
+            if self.args.max_sample is None:
+                initial_confs = ADAPTIVE_MAX_SAMPLE_FACTOR * int(self.auto_sampling(mol))
+            else:
+                initial_confs = int(self.args.max_sample)
         else:
             initial_confs = int(self.args.sample)
 
@@ -1421,10 +1806,8 @@ class csearch:
             self.args.log.write("\nx  No rotatable dihedral found. Updating to CSEARCH to RDKit, writing to FULLMONTE SDF")
 
         ff = self.args.ff
-        dup_data.at[dup_data_idx, "RDKit-Initial-samples"] = initial_confs
         if self.args.program.lower() == "rdkit":
             rotmatches = []
-        cids = self.embed_conf(mol, initial_confs, coord_Map, alg_Map, mol_template)
 
         # energy minimize all to get more realistic results
         # identify the atoms and decide Force Field
@@ -1433,6 +1816,23 @@ class csearch:
                 self.args.log.write(f"\nx  {self.args.ff} is not compatible with the molecule, changing to UFF")
                 ff = "UFF"
 
+        minimized = None
+        if self.args.sample == "adaptive" and self.args.program.lower() not in ['crest']:
+            outmols, cenergy, initial_confs = self.adaptive_embed(
+                mol,
+                initial_confs,
+                coord_Map,
+                alg_Map,
+                mol_template,
+                ff,
+                geom,
+            )
+            minimized = (outmols, cenergy)
+            cids = list(range(len(cenergy)))
+        else:
+            cids = self.embed_conf(mol, initial_confs, coord_Map, alg_Map, mol_template)
+        dup_data.at[dup_data_idx, "RDKit-Initial-samples"] = initial_confs
+
         try:
             status, mol_crest = self.min_after_embed(
                 mol,
@@ -1451,7 +1851,8 @@ class csearch:
                 ff,
                 smi,
                 geom,
-                original_atn
+                original_atn,
+                minimized=minimized
             )
         except IndexError:
             status = -1
@@ -1463,3 +1864,114 @@ class csearch:
             sdwriter.close()
 
         return status, rotmatches, ff, mol_crest
+
+
+def job_args(args, log=None):
+    """
+    Returns a copy of the AQME arguments with its own per-job variables (i.e. metal 
+    atoms and indexes), so the information of one molecule doesn't leak into the 
+    next jobs
+    """
+
+    new_args = copy.copy(args)
+    for var in ["metal_atoms", "metal_idx", "complex_coord", "metal_sym"]:
+        setattr(new_args, var, list(getattr(args, var)))
+    if log is not None:
+        new_args.log = log
+
+    return new_args
+
+
+def csearch_job(args, job_input):
+    """
+    Runs the conformer generation of one job from load_jobs() using an isolated 
+    csearch object. This function is picklable, so it can be sent to the 
+    multiprocessing pool of run_csearch()
+
+    Returns
+    -------
+    total_data : pandas.DataFrame
+        Data of the conformer generation of the job (None if the job failed)
+    log : Logger or JobLogger
+        Logger used in the job
+    stop_csearch : bool
+        If True, the job stopped the CSEARCH workflow (sys.exit)
+    """
+
+    job = csearch.__new__(csearch)
+    job.args = job_args(args)
+    stop_csearch = False
+    try:
+        total_data = job.compute_confs(*job_input)
+    except SystemExit:
+        total_data = None
+        stop_csearch = True
+
+    return total_data, job.args.log, stop_csearch
+
+
+def crest_run_job(args, run_input):
+    """
+    Runs one of the CREST runs of csearch.crest_multistart() in its own scratch 
+    folder (crest_xyz/{name}). The run doesn't change the working directory or 
+    the environment of the process, so it can be sent to a pool of threads
+
+    Returns
+    -------
+    status : int
+        Status returned by xtb_opt_main()
+    n_confs : int
+        Number of conformers obtained in the CREST run
+    n_seconds : float
+        Time of the CREST run
+    messages : list
+        Messages of the log generated in the run
+    """
+
+    (name, charge, mult, smi, constraints_atoms, constraints_dist, 
+     constraints_angle, constraints_dihedral, geom, complex_ts, mol) = run_input
+
+    job = csearch.__new__(csearch)
+    job.args = job_args(args, log=JobLogger())
+    dup_data = creation_of_dup_csv_csearch("crest")
+
+    start_time = time.time()
+    status = xtb_opt_main(
+        name,
+        dup_data,
+        0,
+        job,
+        charge,
+        mult,
+        smi,
+        constraints_atoms,
+        constraints_dist,
+        constraints_angle,
+        constraints_dihedral,
+        'crest',
+        geom,
+        complex_ts=complex_ts,
+        mol=mol,
+        run_dir=name,
+    )
+    n_seconds = round(time.time() - start_time, 2)
+
+    return status, dup_data.at[0, "crest-conformers"], n_seconds, job.args.log.messages
+
+
+def get_csearch_folder(args):
+    """
+    Returns the folder where the SDF files of CSEARCH are stored
+    """
+
+    if args.destination is None:
+        csearch_folder = Path(args.initial_dir).joinpath(
+            f"CSEARCH"
+        )
+    else:
+        if args.initial_dir.as_posix() in f"{args.destination}":
+            csearch_folder = Path(args.destination)
+        else:
+            csearch_folder = Path(args.initial_dir).joinpath(args.destination)
+
+    return csearch_folder
@@ -0,0 +1,164 @@
+#####################################################.
+#        This file stores all the functions         #
+#        used in the CSEARCH conformer cache        #
+#####################################################.
+
+import os
+import json
+import glob
+import hashlib
+import shutil
+from pathlib import Path
+import pandas as pd
+from rdkit.Chem import AllChem as Chem
+
+from aqme.utils import conformer_writer, conformer_reader
+from aqme.csearch.utils import params_checksum
+
+
+def conformer_cache_key(
+    args,
+    mol,
+    charge,
+    mult,
+    constraints_atoms,
+    constraints_dist,
+    constraints_angle,
+    constraints_dihedral,
+    complex_type,
+    geom,
+):
+    """
+    Returns the key of a molecule in the conformer cache, combining its canonical
+    SMILES, charge, mult and constraints with the CSEARCH options that affect the
+    conformers generated
+
+    Parameters
+    ----------
+    args : argparse.args
+        AQME arguments
+    mol : RDKit mol object
+        Molecule created from the SMILES string of the job
+
+    Returns
+    -------
+    str
+        SHA-256 hash used as the name of the files in the cache
+    """
+
+    key_items = [
+        Chem.MolToSmiles(mol),
+        charge,
+        mult,
+        constraints_atoms,
+        constraints_dist,
+        constraints_angle,
+        constraints_dihedral,
+        complex_type,
+        geom,
+        params_checksum(args),
+    ]
+
+    return hashlib.sha256(repr(key_items).encode()).hexdigest()
+
+
+def load_cached_confs(args, key, name, smi, sdf_file):
+    """
+    Writes the conformers stored in the cache to sdf_file and returns their
+    CSEARCH data (or None if the molecule isn't in the cache)
+    """
+
+    cache_sdf = Path(args.conformer_cache).joinpath(f"{key}{args.output}")
+    cache_json = Path(args.conformer_cache).joinpath(f"{key}.json")
+    try:
+        with open(cache_json, "r") as cache_file:
+            cache_data = json.load(cache_file)
+        cached_mols = conformer_reader(cache_sdf, removeHs=False)
+        sdwriter = conformer_writer(sdf_file)
+        for mol in cached_mols:
+            # the names and SMILES of the cached molecule are replaced with the current ones
+            mol_name = mol.GetProp("_Name")
+            if mol_name.startswith(cache_data["name"]):
+                mol.SetProp("_Name", name + mol_name[len(cache_data["name"]):])
+            if mol.HasProp("SMILES"):
+                mol.SetProp("SMILES", str(smi))
+            sdwriter.write(mol)
+        sdwriter.close()
+        # the most recently used files are kept when the cache is full
+        os.utime(cache_sdf)
+        os.utime(cache_json)
+    except (OSError, KeyError, json.JSONDecodeError):
+        return None
+
+    dup_data = pd.DataFrame(cache_data["dup_data"])
+    if "Molecule" in dup_data.columns:
+        dup_data["Molecule"] = [
+            name + str(mol_name)[len(cache_data["name"]):]
+            if str(mol_name).startswith(cache_data["name"]) else mol_name
+            for mol_name in dup_data["Molecule"]
+        ]
+
+    return dup_data
+
+
+def store_cached_confs(args, key, name, sdf_file, dup_data):
+    """
+    Adds the conformers of sdf_file and their CSEARCH data to the cache, removing
+    the least recently used molecules if the cache exceeds max_cache_size
+    """
+
+    if dup_data is None or not os.path.exists(sdf_file) or os.path.getsize(sdf_file) == 0:
+        return
+
+    cache_dir = Path(args.conformer_cache)
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    cache_data = {
+        "name": name,
+        "dup_data": json.loads(dup_data.to_json(orient="records")),
+    }
+
+    # files are copied with temporary names first, so parallel jobs never read
+    # half-written files
+    tmp_suffix = f".{os.getpid()}.tmp"
+    shutil.copy(sdf_file, cache_dir.joinpath(f"{key}{args.output}{tmp_suffix}"))
+    with open(cache_dir.joinpath(f"{key}.json{tmp_suffix}"), "w") as cache_file:
+        json.dump(cache_data, cache_file)
+    os.replace(cache_dir.joinpath(f"{key}{args.output}{tmp_suffix}"), cache_dir.joinpath(f"{key}{args.output}"))
+    os.replace(cache_dir.joinpath(f"{key}.json{tmp_suffix}"), cache_dir.joinpath(f"{key}.json"))
+
+    evict_cached_confs(args)
+
+
+def evict_cached_confs(args):
+    """
+    Removes the least recently used molecules until the size of the cache is
+    below max_cache_size (in MB)
+    """
+
+    max_size = float(args.max_cache_size) * 1024 * 1024
+    cache_entries = []
+    cache_size = 0
+    for cache_json in glob.glob(f"{args.conformer_cache}/*.json"):
+        # the conformers are stored as SDF files or conformer archives (same name as the JSON file)
+        entry_files = [
+            file for file in glob.glob(f"{os.path.splitext(cache_json)[0]}.*")
+            if not file.endswith(".tmp")
+        ]
+        try:
+            entry_size = sum(os.path.getsize(file) for file in entry_files)
+            last_used = os.path.getmtime(cache_json)
+        except FileNotFoundError:
+            # removed by another job
+            continue
+        cache_entries.append((last_used, entry_size, entry_files))
+        cache_size += entry_size
+
+    for _, entry_size, entry_files in sorted(cache_entries):
+        if cache_size <= max_size:
+            break
+        for file in entry_files:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        cache_size -= entry_size
@@ -6,16 +6,18 @@
 
 from __future__ import print_function, absolute_import
 import os
-import glob
 import numpy as np
 from rdkit.Chem import AllChem as Chem
 from rdkit.Chem import rdmolfiles
 from rdkit import Geometry
-import subprocess
-import rdkit
 from pathlib import Path
 import shutil
-from aqme.utils import read_file, run_command
+from aqme.utils import (
+    JobSandbox,
+    conformer_writer,
+    read_xyz_frames,
+    xyz_frame_mol,
+)
 from aqme.filter import geom_filter
 from rdkit.Chem import rdMolTransforms
 
@@ -58,12 +60,6 @@ def get_constraint(mol, constraints):
     return all_fix
 
 
-def xyzall_2_xyz(xyzin, name):
-    # converting multiple xyz to single
-    command_run_1 = ["obabel", xyzin, "-oxyz", "-O" + name + "_conf_.xyz", "-m"]
-    subprocess.run(command_run_1, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-
 def xtb_opt_main(
     name,
     dup_data,
@@ -81,11 +77,15 @@ def xtb_opt_main(
     complex_ts=False,
     mol=None,
     name_init=None,
+    run_dir=None,
 
 ):
 
     """
-    Run xTB using subprocess to perform CREST/CREGEN conformer sampling
+    Run xTB using subprocess to perform CREST/CREGEN conformer sampling. The xTB
+    and CREST jobs run in temporary folders (JobSandbox), so the working directory
+    and the environment of the Python process are never modified. If run_dir is
+    specified, the CREST files are stored in a private folder inside crest_xyz
     """
 
     name_no_path = os.path.basename(Path(name)).split(".xyz")[0]
@@ -106,22 +106,22 @@ def xtb_opt_main(
     if method_opt == 'crest':
         self.args.log.write(f"\no  Starting xTB pre-optimization before CREST sampling")
         dat_dir = csearch_dir / "crest_xyz"
+        if run_dir is not None:
+            dat_dir = dat_dir / run_dir
         xyzin = f"{dat_dir}/{name_no_path}.xyz"
+        dat_dir.mkdir(exist_ok=True, parents=True)
+        shutil.move(f"{name}.xyz", xyzin)
     elif method_opt == 'xtb':
-        rdmolfiles.MolToXYZFile(mol, f"{name}.xyz")
         self.args.log.write(f"\no  Starting xTB optimization")
         dat_dir = csearch_dir / "xtb_xyz"
         xyzin = f"{dat_dir}/{name_no_path}_xtb.xyz"
-    dat_dir.mkdir(exist_ok=True, parents=True)
-    shutil.move(f"{name}.xyz", xyzin)
+        dat_dir.mkdir(exist_ok=True, parents=True)
+        rdmolfiles.MolToXYZFile(mol, xyzin)
 
-    os.environ["OMP_STACKSIZE"] = self.args.stacksize
     # to run xTB/CREST with more than 1 processor
-    os.environ["OMP_NUM_THREADS"] = str(self.args.nprocs)
+    xtb_env = {"OMP_STACKSIZE": self.args.stacksize, "OMP_NUM_THREADS": self.args.nprocs}
     opt_valid = True
 
-    os.chdir(dat_dir)
-    
     # for systems that were created from 1D and 2D inputs (i.e. SMILES), this part includes two xTB
     # constrained optimizations to avoid geometry problems in noncovalent complexes and transition states
 
@@ -135,72 +135,26 @@ def xtb_opt_main(
     if complex_ts:
         all_fix = get_constraint(mol, constraints_dist)
 
-        _ = create_xcontrol(
-            self.args,
-            constraints_atoms,
-            all_fix,
-            [],
-            [],
-            xyzin,
-            "constrain1.inp",
-        )
-
-        command1 = [
-            "xtb",
-            xyzin,
-            "--opt",
-            "--input",
-            "constrain1.inp",
-            "-c",
-            str(charge),
-            "--uhf",
-            str(int(mult) - 1),
-            "-P",
-            str(self.args.nprocs),
-        ]
-
-        if self.args.xtb_keywords is not None:
-            for keyword in self.args.xtb_keywords.split():
-                command1.append(keyword)
-
-        xtb_out1 = f'{os.path.dirname(Path(xyzoutxtb1))}/{os.path.basename(Path(xyzoutxtb1)).split(".xyz")[0]}'
-        run_command(command1, f"{xtb_out1}.out")
-        try:
-            os.rename(str(dat_dir) + "/xtbopt.xyz", xyzoutxtb1)
-        except FileNotFoundError:
-            os.rename(str(dat_dir) + "/xtblast.xyz", xyzoutxtb1)
-
-        # remove files that might interfere in subsequent calculations (i.e. wrong electron readings)
-        for file in glob.glob('*') + glob.glob('*.*') + glob.glob('.*'):
-            if os.path.exists(file):
-                if file.find('_xtb2') == -1 and file.find('_xtb1') == -1 and file.find('.out') == -1:
-                    try:
-                        os.remove(file)
-                    except IsADirectoryError:
-                        try:
-                            shutil.rmtree(file)
-                        except OSError: # this avoids problems when running AQME in HPCs
-                            pass
-
-        if constrained_opt:
-            xyzoutxtb2 = str(dat_dir) + "/" + name_no_path + "_xtb2.xyz"
-            # xTB optimization with the user-defined constraints
+        # files that might interfere in subsequent calculations (i.e. wrong electron readings)
+        # are removed with the temporary folder
+        with JobSandbox(dat_dir, env=xtb_env) as sandbox:
             _ = create_xcontrol(
                 self.args,
-                list(constraints_atoms),
-                list(constraints_dist),
-                list(constraints_angle),
-                list(constraints_dihedral),
-                xyzoutxtb1,
-                "constrain2.inp",
+                constraints_atoms,
+                all_fix,
+                [],
+                [],
+                xyzin,
+                "constrain1.inp",
+                sandbox=sandbox,
             )
 
-            command2 = [
+            command1 = [
                 "xtb",
-                xyzoutxtb1,
+                xyzin,
                 "--opt",
                 "--input",
-                "constrain2.inp",
+                "constrain1.inp",
                 "-c",
                 str(charge),
                 "--uhf",
@@ -211,55 +165,79 @@ def xtb_opt_main(
 
             if self.args.xtb_keywords is not None:
                 for keyword in self.args.xtb_keywords.split():
-                    command2.append(keyword)
+                    command1.append(keyword)
 
-            xtb_out2 = f'{os.path.dirname(Path(xyzoutxtb2))}/{os.path.basename(Path(xyzoutxtb2)).split(".xyz")[0]}'
-            run_command(command2, f"{xtb_out2}.out")
+            xtb_out1 = f'{os.path.dirname(Path(xyzoutxtb1))}/{os.path.basename(Path(xyzoutxtb1)).split(".xyz")[0]}'
+            sandbox.run(command1, f"{xtb_out1}.out")
+            sandbox.collect(["xtbopt.xyz", "xtblast.xyz"], xyzoutxtb1)
 
-            try:
-                os.rename(str(dat_dir) + "/xtbopt.xyz", xyzoutxtb2)
-            except FileNotFoundError:
-                os.rename(str(dat_dir) + "/xtblast.xyz", xyzoutxtb2)
+        if constrained_opt:
+            xyzoutxtb2 = str(dat_dir) + "/" + name_no_path + "_xtb2.xyz"
+            # xTB optimization with the user-defined constraints
+            with JobSandbox(dat_dir, env=xtb_env) as sandbox:
+                _ = create_xcontrol(
+                    self.args,
+                    list(constraints_atoms),
+                    list(constraints_dist),
+                    list(constraints_angle),
+                    list(constraints_dihedral),
+                    xyzoutxtb1,
+                    "constrain2.inp",
+                    sandbox=sandbox,
+                )
+
+                command2 = [
+                    "xtb",
+                    xyzoutxtb1,
+                    "--opt",
+                    "--input",
+                    "constrain2.inp",
+                    "-c",
+                    str(charge),
+                    "--uhf",
+                    str(int(mult) - 1),
+                    "-P",
+                    str(self.args.nprocs),
+                ]
+
+                if self.args.xtb_keywords is not None:
+                    for keyword in self.args.xtb_keywords.split():
+                        command2.append(keyword)
+
+                xtb_out2 = f'{os.path.dirname(Path(xyzoutxtb2))}/{os.path.basename(Path(xyzoutxtb2)).split(".xyz")[0]}'
+                sandbox.run(command2, f"{xtb_out2}.out")
+                sandbox.collect(["xtbopt.xyz", "xtblast.xyz"], xyzoutxtb2)
         else:
             xyzoutxtb2 = xyzoutxtb1
 
     else:
         # Preoptimization with xTB to avoid issues from innacurate starting structures in CREST.
         # If you're dealing with a large system, increase the stack size
-        try:
-            command = [
-                "xtb",
-                xyzin,
-                "--opt",
-                "-c",
-                str(charge),
-                "--uhf",
-                str(int(mult) - 1),
-                "-P",
-                str(self.args.nprocs), 
-            ]
+        command = [
+            "xtb",
+            xyzin,
+            "--opt",
+            "-c",
+            str(charge),
+            "--uhf",
+            str(int(mult) - 1),
+        ]
 
-            if self.args.xtb_keywords is not None:
-                for keyword in self.args.xtb_keywords.split():
-                    command.append(keyword)
-            xtb_out1 = f'{os.path.dirname(Path(xyzin))}/{os.path.basename(Path(xyzin)).split(".xyz")[0]}'
-            run_command(command, f"{xtb_out1}_xtb1.out")
+        if self.args.xtb_keywords is not None:
+            for keyword in self.args.xtb_keywords.split():
+                command.append(keyword)
+        xtb_out1 = f'{os.path.dirname(Path(xyzin))}/{os.path.basename(Path(xyzin)).split(".xyz")[0]}'
+        with JobSandbox(dat_dir, env=xtb_env) as sandbox:
+            sandbox.run(command + ["-P", str(self.args.nprocs)], f"{xtb_out1}_xtb1.out")
+            xyz_opt = sandbox.collect("xtbopt.xyz", xyzoutxtb1)
 
-            os.rename(str(dat_dir) + "/xtbopt.xyz", xyzoutxtb1)
-        except FileNotFoundError:
+        if xyz_opt is None:
             self.args.log.write(f"\nx  There was an error during the xTB pre-optimization. This error is related to parallelization of xTB jobs and is normally observed when using metal complexes in some operative systems/OpenMP versions. AQME is switching to using one processor (nprocs=1).\n")
             self.args.nprocs = 1
-            try:
-                xtb_out1 = f'{os.path.dirname(Path(xyzin))}/{os.path.basename(Path(xyzin)).split(".xyz")[0]}'
-                if self.args.xtb_keywords is None:
-                    comm_xtb = f"export OMP_STACKSIZE={self.args.stacksize} && export OMP_NUM_THREADS={self.args.nprocs},1 \
-                    && xtb {xyzin} --opt -c {charge} --uhf {int(mult) - 1} >> {xtb_out1}_xtb1.out"
-                else:
-                    comm_xtb = f"export OMP_STACKSIZE={self.args.stacksize} && export OMP_NUM_THREADS={self.args.nprocs},1 \
-                    && xtb {xyzin} --opt -c {charge} --uhf {int(mult) - 1} {self.args.xtb_keywords} >> {xtb_out1}_xtb1.out"
-                subprocess.call(comm_xtb, shell=False)
-                os.rename(str(dat_dir) + "/xtbopt.xyz", xyzoutxtb1)
-            except FileNotFoundError:
+            with JobSandbox(dat_dir, env={"OMP_STACKSIZE": self.args.stacksize, "OMP_NUM_THREADS": f"{self.args.nprocs},1"}) as sandbox:
+                sandbox.run(command, f"{xtb_out1}_xtb1.out")
+                xyz_opt = sandbox.collect("xtbopt.xyz", xyzoutxtb1)
+            if xyz_opt is None:
                 if self.args.program.lower() == "crest":
                     self.args.log.write(f"\nx  There was another error during the xTB pre-optimization that could not be fixed. Trying CREST directly with no xTB preoptimization.\n")
                 else:
@@ -271,169 +249,137 @@ def xtb_opt_main(
 
     xyzoutall = str(dat_dir) + "/" + name_no_path + "_conformers.xyz"
 
-    # CREST sampling
-    if self.args.program.lower() == "crest":
-        self.args.log.write(f"\no  Starting CREST sampling")
-        if constrained_opt:
-            _ = create_xcontrol(
-                self.args,
-                list(constraints_atoms),
-                list(constraints_dist),
-                list(constraints_angle),
-                list(constraints_dihedral),
-                xyzoutxtb2,
-                ".xcontrol.sample",
-            )
+    with JobSandbox(dat_dir, env=xtb_env) as sandbox:
+        # CREST sampling
+        if self.args.program.lower() == "crest":
+            self.args.log.write(f"\no  Starting CREST sampling")
+            if constrained_opt:
+                _ = create_xcontrol(
+                    self.args,
+                    list(constraints_atoms),
+                    list(constraints_dist),
+                    list(constraints_angle),
+                    list(constraints_dihedral),
+                    xyzoutxtb2,
+                    ".xcontrol.sample",
+                    sandbox=sandbox,
+                )
 
-        command = [
-            "crest",
-            xyzoutxtb2,
-            "--chrg",
-            str(charge),
-            "--uhf",
-            str(int(mult) - 1),
-            "-T",
-            str(self.args.nprocs),
-            "--ewin",
-            str(self.args.ewin_csearch),
-        ]
+            command = [
+                "crest",
+                xyzoutxtb2,
+                "--chrg",
+                str(charge),
+                "--uhf",
+                str(int(mult) - 1),
+                "-T",
+                str(self.args.nprocs),
+                "--ewin",
+                str(self.args.ewin_csearch),
+            ]
 
-        if constrained_opt:
-            command.append("--cinp")
-            command.append(".xcontrol.sample")
-            const_command = command.copy()
+            if constrained_opt:
+                command.append("--cinp")
+                command.append(".xcontrol.sample")
+                const_command = command.copy()
 
-        if self.args.crest_keywords is not None:
-            for keyword in self.args.crest_keywords.split():
-                command.append(keyword)
-        try:
-            run_command(command, f"/{dat_dir}/{name_no_path}.out")
-            natoms = open("crest_best.xyz").readlines()[0].strip()
-        except FileNotFoundError:
-            self.args.log.write(f"\nx  CREST optimization failed! This might be caused by different reasons:\n   1) In metal complexes: using metal complexes without specifying any kind of template in the complex_type option (i.e. squareplanar).\n   2) In TSs: include the \"--noreftopo\" option in CREST with the crest_keywords option (i.e. crest_keywords=\"--noreftopo\").\n   3) In big systems: increase stacksize with the stacksize option (i.e. stacksize=\"4GB\").")
+            if self.args.crest_keywords is not None:
+                for keyword in self.args.crest_keywords.split():
+                    command.append(keyword)
             try:
-                self.args.log.write(f"\no  Trying the CREST calculations with stacksize=\"4GB\".")
-                os.environ["OMP_STACKSIZE"] = '4GB'
-                run_command(command, f"/{dat_dir}/{name_no_path}.out")
-                natoms = open("crest_best.xyz").readlines()[0].strip()
+                sandbox.run(command, f"/{dat_dir}/{name_no_path}.out")
+                natoms = open(sandbox.file("crest_best.xyz")).readlines()[0].strip()
             except FileNotFoundError:
-                self.args.log.write(f"\nx  CREST optimization failed again even with stacksize=\"4GB\"! Contact the administrators to check this issue in more detail.\n")
-                if constrained_opt and "--noreftopo" not in command:
-                    try:
-                        self.args.log.write(f"\no  Constraints were detected, trying a new CREST run with --noreftopo. WARNING! Check that your geometry doesn't isomerize!\n")
-                        if self.args.crest_keywords is not None:
-                            for keyword in self.args.crest_keywords.split():
-                                const_command.append(keyword)
-                        const_command.append('--noreftopo')
-                        run_command(const_command, f"/{dat_dir}/{name_no_path}.out")
-                        natoms = open("crest_best.xyz").readlines()[0].strip()
-                    except FileNotFoundError:
-                        self.args.log.write(f"\nx  CREST optimization failed again even with --noreftopo! Contact the administrators to check this issue in more detail.\n")
+                self.args.log.write(f"\nx  CREST optimization failed! This might be caused by different reasons:\n   1) In metal complexes: using metal complexes without specifying any kind of template in the complex_type option (i.e. squareplanar).\n   2) In TSs: include the \"--noreftopo\" option in CREST with the crest_keywords option (i.e. crest_keywords=\"--noreftopo\").\n   3) In big systems: increase stacksize with the stacksize option (i.e. stacksize=\"4GB\").")
+                try:
+                    self.args.log.write(f"\no  Trying the CREST calculations with stacksize=\"4GB\".")
+                    sandbox.env["OMP_STACKSIZE"] = '4GB'
+                    sandbox.run(command, f"/{dat_dir}/{name_no_path}.out")
+                    natoms = open(sandbox.file("crest_best.xyz")).readlines()[0].strip()
+                except FileNotFoundError:
+                    self.args.log.write(f"\nx  CREST optimization failed again even with stacksize=\"4GB\"! Contact the administrators to check this issue in more detail.\n")
+                    if constrained_opt and "--noreftopo" not in command:
+                        try:
+                            self.args.log.write(f"\no  Constraints were detected, trying a new CREST run with --noreftopo. WARNING! Check that your geometry doesn't isomerize!\n")
+                            if self.args.crest_keywords is not None:
+                                for keyword in self.args.crest_keywords.split():
+                                    const_command.append(keyword)
+                            const_command.append('--noreftopo')
+                            sandbox.run(const_command, f"/{dat_dir}/{name_no_path}.out")
+                            natoms = open(sandbox.file("crest_best.xyz")).readlines()[0].strip()
+                        except FileNotFoundError:
+                            self.args.log.write(f"\nx  CREST optimization failed again even with --noreftopo! Contact the administrators to check this issue in more detail.\n")
+                            opt_valid = False
+                    else:
                         opt_valid = False
-                else:
-                    opt_valid = False
 
-        # CREGEN sorting
-        try:
-            if self.args.cregen and int(natoms) != 1 and opt_valid:
-                self.args.log.write(f"\no  Starting CREGEN sorting")
-                command = ["crest", "crest_best.xyz", "--cregen", "crest_conformers.xyz"]
+            # CREGEN sorting
+            try:
+                if self.args.cregen and int(natoms) != 1 and opt_valid:
+                    self.args.log.write(f"\no  Starting CREGEN sorting")
+                    command = ["crest", "crest_best.xyz", "--cregen", "crest_conformers.xyz"]
 
-                if self.args.cregen_keywords is not None:
-                    for keyword in self.args.cregen_keywords.split():
-                        command.append(keyword)
+                    if self.args.cregen_keywords is not None:
+                        for keyword in self.args.cregen_keywords.split():
+                            command.append(keyword)
 
-                run_command(command, f"{dat_dir}/{name_no_path}_cregen.out")
-        except UnboundLocalError:
-            pass
+                    sandbox.run(command, f"{dat_dir}/{name_no_path}_cregen.out")
+            except UnboundLocalError:
+                pass
 
-        try:
             if opt_valid:
-                if os.path.exists(str(dat_dir) + "/crest_clustered.xyz"):
-                    shutil.copy(str(dat_dir) + "/crest_clustered.xyz", xyzoutall)
-
-                elif os.path.exists(str(dat_dir) + "/crest_ensemble.xyz"):
-                    shutil.copy(str(dat_dir) + "/crest_ensemble.xyz", xyzoutall)
-                else:
-                    shutil.copy(str(dat_dir) + "/crest_conformers.xyz", xyzoutall)
-        except FileNotFoundError:
-            self.args.log.write("\nx  CREST conformer sampling failed! Please, try other options (i.e. include constrains, change the crest_keywords option, etc.)")
-            opt_valid = False
-
-    if opt_valid:
-        if self.args.program.lower() == "crest":
-            xyzall_2_xyz(xyzoutall, name_no_path)
-            xyz_files = glob.glob(name_no_path + "_conf_*.xyz")
-        if self.args.program.lower() == "xtb":
-            xyz_files = [xyzoutxtb1]
-        for _, file in enumerate(xyz_files):
-            name_conf = f'{os.path.basename(Path(file)).split(".xyz")[0]}'
-            command_xyz = ["obabel", "-ixyz", file, "-osdf", "-O" + name_conf + ".sdf"]
-            subprocess.run(command_xyz, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                if sandbox.file("crest_clustered.xyz").exists():
+                    shutil.copy(sandbox.file("crest_clustered.xyz"), f"{dat_dir}/{name_no_path}_clustered.xyz")
+                crest_files = ["crest_clustered.xyz", "crest_ensemble.xyz", "crest_conformers.xyz"]
+                if sandbox.collect(crest_files, xyzoutall) is None:
+                    self.args.log.write("\nx  CREST conformer sampling failed! Please, try other options (i.e. include constrains, change the crest_keywords option, etc.)")
+                    opt_valid = False
 
-        if self.args.program.lower() == "crest":
-            sdwriter = Chem.SDWriter(str(f"{csearch_dir}/{name_no_path}.sdf"))
-        sdf_files = glob.glob(name_no_path + "*.sdf")
-        for file in sdf_files:
-            mol = rdkit.Chem.SDMolSupplier(file, removeHs=False, sanitize=False)
-            mol_rd = rdkit.Chem.RWMol(mol[0])
-            file_nopath = f'{os.path.basename(Path(file)).split(".sdf")[0]}'
-            if self.args.program.lower() == "xtb":
+        # the optimized geometries are attached to the topology of the input mol object
+        # (the frames of the CREST ensemble are read in one pass)
+        n_confs = 0
+        if opt_valid:
+            if self.args.program.lower() == "crest":
+                sdwriter = conformer_writer(f"{csearch_dir}/{name_no_path}{self.args.output}")
+                for symbols, coords, comment in read_xyz_frames(xyzoutall):
+                    n_confs += 1
+                    mol_rd = xyz_frame_mol(symbols, coords, mol, charge)
+                    # convert from hartree (default in xtb) to kcal
+                    energy_Eh = float(comment.split()[0])
+                    energy_kcal = str(energy_Eh*627.5)
+                    mol_rd.SetProp("_Name", name_no_path)
+                    mol_rd.SetProp("Energy", energy_kcal)
+                    mol_rd.SetProp("Real charge", str(charge))
+                    mol_rd.SetProp("Mult", str(int(mult)))
+                    if smi is not None:
+                        mol_rd.SetProp("SMILES", str(smi))
+                    mol_geom = Chem.Mol(mol_rd)
+                    passing_geom = geom_filter(self,mol_geom,geom)
+                    if passing_geom:
+                        sdwriter.write(mol_rd)
+                sdwriter.close()
+            elif self.args.program.lower() == "xtb":
+                symbols, coords, comment = next(read_xyz_frames(xyzoutxtb1))
+                mol_rd = xyz_frame_mol(symbols, coords, mol, charge)
                 # convert from hartree (default in xtb) to kcal
-                energy_Eh = float(open(f'{file_nopath}.xyz', "r").readlines()[1].split()[1])
+                energy_Eh = float(comment.split()[1])
                 energy_kcal = energy_Eh*627.5
                 mol_rd.SetProp("_Name", name_init)
-                os.remove(file)
-            elif self.args.program.lower() == "crest":
-                # convert from hartree (default in xtb) to kcal
-                energy_Eh = float(open(file, "r").readlines()[0])
-                energy_kcal = str(energy_Eh*627.5)
-                mol_rd.SetProp("_Name", name_no_path)
-                mol_rd.SetProp("Energy", energy_kcal)
-                mol_rd.SetProp("Real charge", str(charge))
-                mol_rd.SetProp("Mult", str(int(mult)))
-                if smi is not None:
-                    mol_rd.SetProp("SMILES", str(smi))
-                mol_geom = Chem.Mol(mol_rd)
-                passing_geom = geom_filter(self,mol_geom,geom)
-                if passing_geom:
-                    sdwriter.write(mol_rd)
-                os.remove(file)
-                os.remove(f'{file_nopath}.xyz')
-        if self.args.program.lower() == "crest":
-            sdwriter.close()
-    else:
-        xyz_files = []
-
-    # remove xTB/CREST files to avoid wrong readings of molecular information
-    for file in glob.glob('*') + glob.glob('*.*') + glob.glob('.*'):
-        if os.path.exists(file):
-            if file.find('.out') == -1:
-                if self.args.program.lower() == "xtb":
-                    try:
-                        os.remove(file)
-                    except OSError: # this avoids problems when running AQME in HPCs
-                        pass
-                elif self.args.program.lower() == "crest":
-                    if file.find('_xtb2') == -1 and file.find('_xtb1') == -1 and file.find('.out') == -1:
-                        try:
-                            if file == 'crest_clustered.xyz':
-                                os.rename('crest_clustered.xyz', f"{dat_dir}/{name_no_path}_clustered.xyz")
-                            else:
-                                try:
-                                    os.remove(file)
-                                except OSError: # this avoids problems when running AQME in HPCs
-                                    pass
-                        except IsADirectoryError:
-                            try:
-                                shutil.rmtree(file)
-                            except OSError: # this avoids problems when running AQME in HPCs
-                                pass
-
-    os.chdir(self.args.w_dir_main)
+
+    # remove the xyz files of this job to avoid wrong readings of molecular information
+    # (the files of other jobs in the same folder are not modified)
+    if self.args.program.lower() == "xtb":
+        job_files = [xyzin, xyzoutxtb1, xyzoutxtb2, xyzoutall]
+    elif self.args.program.lower() == "crest":
+        job_files = [xyzin, xyzoutall]
+    for file in job_files:
+        try:
+            os.remove(file)
+        except OSError: # this avoids problems when running AQME in HPCs
+            pass
 
     if method_opt == 'crest':
-        dup_data.at[dup_data_idx, "crest-conformers"] = len(xyz_files)
+        dup_data.at[dup_data_idx, "crest-conformers"] = n_confs
         return 1
 
     if method_opt == 'xtb':
@@ -448,9 +394,11 @@ def create_xcontrol(
     constraints_dihedral,
     xyzin,
     name_constraint,
+    sandbox,
 ):
     """
-    Function to create the .xcontrol.sample if constraints are defined
+    Function to create the .xcontrol.sample if constraints are defined. The files
+    are created inside the temporary folder of the job (sandbox)
     """
 
     constrained_sampling = False
@@ -477,11 +425,7 @@ def create_xcontrol(
         constrained_sampling = True
 
         # call --constrain just fo create a coord.ref file
-        subprocess.run(
-            ["crest", xyzin, "--constrain", "1"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+        sandbox.run(["crest", xyzin, "--constrain", "1"])
 
         # add the constraints part
         edited_xcontrol = "$constrain\n"
@@ -526,7 +470,8 @@ def create_xcontrol(
 
         # metadyn part
         if name_constraint == ".xcontrol.sample":
-            outlines = read_file(os.getcwd(), os.getcwd(), xyzin)
+            with open(xyzin, "r") as xyz_file:
+                outlines = xyz_file.readlines()
             n_atoms = int(outlines[0])
             edited_xcontrol += "$metadyn\n"
             edited_xcontrol += "atoms: "
@@ -562,7 +507,7 @@ def create_xcontrol(
         edited_xcontrol += "\n$end\n"
 
         # write the file
-        xcontrol_file = open(name_constraint, "w")
+        xcontrol_file = open(sandbox.file(name_constraint), "w")
         xcontrol_file.write(edited_xcontrol)
         xcontrol_file.close()
 
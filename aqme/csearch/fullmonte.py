@@ -3,15 +3,34 @@
 #            used in CSEARCH-FullMonte              #
 #####################################################.
 
+import os
 import sys
+import copy
 import numpy as np
 import math
 import random
+import itertools
+import concurrent.futures as futures
+import multiprocessing as mp
 from rdkit.Chem import AllChem as Chem
 from rdkit.Chem import rdMolTransforms, rdMolAlign
 
-from aqme.utils import set_metal_atomic_number, get_conf_RMS
-from aqme.csearch.utils import minimize_rdkit_energy
+from aqme.utils import (
+    set_metal_atomic_number,
+    get_conf_RMS,
+    conformer_writer,
+    conformer_reader,
+    new_conformer,
+    JobLogger,
+)
+from aqme.csearch.utils import minimize_rdkit_energy, minimize_rdkit_confs
+
+# number of steps that each FullMonte walker runs before the unique conformers
+# of all the walkers are merged
+FULLMONTE_EXCHANGE_STEPS = 10
+# maximum number of dihedrals used in the keys of the buckets of TorsionIndex
+# (3^n buckets are searched for each symmetry mapping)
+TORSION_KEY_DIHEDRALS = 4
 
 
 def realign_mol(
@@ -63,7 +82,7 @@ def realign_mol(
     return mol, energy
 
 
-def rotate_dihedrals(conformer, dihedrals, seed, stepsize):
+def rotate_dihedrals(conformer, dihedrals, seed, stepsize, rng=None):
     """
     Applies a random rotation to all the dihedrals
 
@@ -77,16 +96,532 @@ def rotate_dihedrals(conformer, dihedrals, seed, stepsize):
         seed for the random module
     stepsize : float
         Angle in Degrees to do the steps between 0.0 and 360.0
+    rng : random.Random, default=None
+        If defined, random number generator used to pick a different angle for 
+        each dihedral (the seed is not used)
     """
 
     rad_range = np.arange(stepsize, 360.0, stepsize)
     for dihedral in dihedrals:
-        random.seed(seed)  # RAUL: Any good reason to keep reseting the seed?
-        rad_ang = random.choice(rad_range)
+        if rng is not None:
+            rad_ang = rng.choice(rad_range)
+        else:
+            random.seed(seed)  # RAUL: Any good reason to keep reseting the seed?
+            rad_ang = random.choice(rad_range)
         rad = math.pi * rad_ang / 180.0
         rdMolTransforms.SetDihedralRad(conformer, *dihedral, value=rad)
 
 
+def fullmonte_step(
+    seed,
+    unique_mol,
+    c_energy,
+    unique_mol_sample,
+    rotmatches,
+    args,
+    coord_Map,
+    alg_Map,
+    mol_template,
+    ff,
+):
+    """
+    Runs one step of the FullMonte sampling (random rotation of a conformer
+    from unique_mol_sample and minimization) and returns the new mol object
+    and its energy
+    """
+
+    # STEP 2: Choose mol object form unique_mol:
+    random.seed(seed)
+    mol_rot = random.choices(unique_mol_sample, k=1)[0]
+
+    # updating the location of mol object i.e., the hexadecimal locaiton to a new one so the older one isnt affected
+    mol = Chem.RWMol(mol_rot)
+    rot_mol = mol.GetMol()
+
+    # STEP 3: Choose random subset of dihedral from rotmatches
+    random.seed(seed)  # RAUL: Any good reason to keep reseting the seed ?
+    k = min(len(rotmatches), args.nrot_fullmonte)
+    mutable_dihedrals = random.choices(rotmatches, k=k)
+
+    # STEP 4: for the given conformation, then apply a random rotation to each torsion in the subset
+    conformer = rot_mol.GetConformer()
+    rotate_dihedrals(conformer, mutable_dihedrals, seed, args.ang_fullmonte)
+
+    # STEP 5: Optimize geometry rot_mol
+    if (coord_Map, alg_Map, mol_template) == (None, None, None):
+        energy = minimize_rdkit_energy(
+            rot_mol, -1, args.log, ff, args.opt_steps_rdkit
+        )
+    else:
+        mol, energy = realign_mol(
+            rot_mol, -1, coord_Map, alg_Map, mol_template, args.opt_steps_rdkit
+        )
+
+    return rot_mol, energy
+
+
+def fullmonte_batch_step(
+    seed,
+    unique_mol,
+    c_energy,
+    unique_mol_sample,
+    rotmatches,
+    args,
+    coord_Map,
+    alg_Map,
+    mol_template,
+    ff,
+):
+    """
+    Runs one step of the FullMonte sampling with nproposals_fullmonte random
+    rotations, which are stored as conformers of the same mol object and
+    minimized together using multiple threads. Returns a list with the new
+    mol objects and their energies
+    """
+
+    n_proposals = int(args.nproposals_fullmonte)
+    batch_mol = Chem.Mol(unique_mol_sample[0])
+    batch_mol.RemoveAllConformers()
+    for k in range(n_proposals):
+        # each proposal has its own seed derived from the seed of the step
+        rng = random.Random(seed * n_proposals + k)
+        mol_rot = rng.choice(unique_mol_sample)
+        conf = batch_mol.AddConformer(
+            new_conformer(mol_rot.GetConformer().GetPositions()), assignId=True
+        )
+        n_dihedrals = min(len(rotmatches), args.nrot_fullmonte)
+        mutable_dihedrals = rng.choices(rotmatches, k=n_dihedrals)
+        rotate_dihedrals(
+            batch_mol.GetConformer(conf), mutable_dihedrals, seed, args.ang_fullmonte, rng=rng
+        )
+
+    if (coord_Map, alg_Map, mol_template) == (None, None, None):
+        num_threads = max(
+            1,
+            (os.cpu_count() or 1)
+            // (int(args.max_workers) * int(args.nwalkers_fullmonte)),
+        )
+        energies = minimize_rdkit_confs(
+            batch_mol, args.log, ff, args.opt_steps_rdkit, num_threads
+        )
+    else:
+        energies = {}
+        for conformer in batch_mol.GetConformers():
+            batch_mol, energies[conformer.GetId()] = realign_mol(
+                batch_mol,
+                conformer.GetId(),
+                coord_Map,
+                alg_Map,
+                mol_template,
+                args.opt_steps_rdkit,
+            )
+
+    return [
+        (
+            pool_mol(batch_mol, conformer.GetPositions(), energies[conformer.GetId()]),
+            energies[conformer.GetId()],
+        )
+        for conformer in batch_mol.GetConformers()
+    ]
+
+
+def fullmonte_proposals(
+    seed,
+    unique_mol,
+    c_energy,
+    unique_mol_sample,
+    rotmatches,
+    args,
+    coord_Map,
+    alg_Map,
+    mol_template,
+    ff,
+):
+    """
+    Returns the new mol objects (and their energies) of one step of the
+    FullMonte sampling, using one or multiple (batched) proposals
+    """
+
+    step_args = (
+        seed,
+        unique_mol,
+        c_energy,
+        unique_mol_sample,
+        rotmatches,
+        args,
+        coord_Map,
+        alg_Map,
+        mol_template,
+        ff,
+    )
+    if int(args.nproposals_fullmonte) > 1:
+        return fullmonte_batch_step(*step_args)
+    return [fullmonte_step(*step_args)]
+
+
+def torsion_symmetry_maps(mol, rotmatches, heavyonly, max_matches_rmsd):
+    """
+    Returns an array with the atoms of the rotmatches dihedrals for each
+    symmetry-equivalent atom mapping of the molecule (the same mappings used
+    in the RMSD of get_conf_RMS). The first mapping is the identity
+    """
+
+    atom_idx = [
+        atom.GetIdx()
+        for atom in mol.GetAtoms()
+        if not heavyonly or atom.GetAtomicNum() != 1
+    ]
+    sym_mol = Chem.RemoveHs(mol) if heavyonly else mol
+    sym_matches = sym_mol.GetSubstructMatches(
+        sym_mol, uniquify=False, maxMatches=max_matches_rmsd
+    )
+
+    identity = tuple(tuple(dihedral) for dihedral in rotmatches)
+    torsion_maps = [identity]
+    for match in sym_matches:
+        # sym_mol atom i is mapped onto sym_mol atom match[i]
+        atom_map = {atom_idx[i]: atom_idx[j] for i, j in enumerate(match)}
+        torsion_map = tuple(
+            tuple(atom_map[atom] for atom in dihedral) for dihedral in rotmatches
+        )
+        if torsion_map not in torsion_maps:
+            torsion_maps.append(torsion_map)
+
+    return np.array(torsion_maps, dtype=int)
+
+
+def torsion_fingerprints(coords, torsion_maps):
+    """
+    Dihedral angles (in degrees) of a conformer for each mapping of
+    torsion_maps, with shape (number of mappings, number of dihedrals)
+    """
+
+    points = coords[torsion_maps]
+    b0 = points[..., 0, :] - points[..., 1, :]
+    b1 = points[..., 2, :] - points[..., 1, :]
+    b2 = points[..., 3, :] - points[..., 2, :]
+    b1 /= np.linalg.norm(b1, axis=-1, keepdims=True)
+    v = b0 - np.sum(b0 * b1, axis=-1, keepdims=True) * b1
+    w = b2 - np.sum(b2 * b1, axis=-1, keepdims=True) * b1
+    x = np.sum(v * w, axis=-1)
+    y = np.sum(np.cross(b1, v) * w, axis=-1)
+
+    return np.degrees(np.arctan2(y, x))
+
+
+class TorsionIndex:
+    """
+    Quantized dihedral fingerprints of the unique conformers of the FullMonte
+    sampling. Each conformer is stored once (when it's accepted) in a bucket
+    keyed by the bins of its first TORSION_KEY_DIHEDRALS dihedrals, with bins
+    of at least ang_threshold degrees. The conformers with all the dihedrals
+    within ang_threshold of a new conformer (considering the symmetry of the
+    molecule) are in the same or adjacent buckets, so the rest of the unique
+    conformers are never compared
+    """
+
+    def __init__(self, torsion_maps, ang_threshold):
+        self.torsion_maps = torsion_maps
+        self.ang_threshold = float(ang_threshold)
+        self.n_bins = max(1, int(360.0 // self.ang_threshold))
+        self.bin_size = 360.0 / self.n_bins
+        self.n_key = min(TORSION_KEY_DIHEDRALS, torsion_maps.shape[1])
+        self.offsets = np.array(
+            list(itertools.product((-1, 0, 1), repeat=self.n_key)), dtype=int
+        ).reshape(-1, self.n_key)
+        # bucket key -> {id(mol): (mol, energy, dihedrals)}
+        self.buckets = {}
+        self.keys = {}
+
+    def bins(self, torsions):
+        return (
+            np.floor((torsions[..., : self.n_key] + 180.0) / self.bin_size).astype(int)
+            % self.n_bins
+        )
+
+    def add(self, mol, energy):
+        torsions = torsion_fingerprints(
+            mol.GetConformer().GetPositions(), self.torsion_maps[:1]
+        )[0]
+        key = tuple(self.bins(torsions))
+        self.buckets.setdefault(key, {})[id(mol)] = (mol, energy, torsions)
+        self.keys[id(mol)] = key
+
+    def remove(self, mol):
+        key = self.keys.pop(id(mol), None)
+        if key is not None:
+            del self.buckets[key][id(mol)]
+
+    def get_similar(self, rot_mol, energy, energy_threshold):
+        """
+        Returns the stored conformers with an energy difference lower than
+        energy_threshold and all the dihedrals within ang_threshold
+        """
+
+        rot_torsions = torsion_fingerprints(
+            rot_mol.GetConformer().GetPositions(), self.torsion_maps
+        )
+        keys = set()
+        for rot_bins in self.bins(rot_torsions):
+            for offset in (rot_bins + self.offsets) % self.n_bins:
+                keys.add(tuple(offset))
+
+        similar_mols = []
+        for key in keys:
+            for mol, mol_energy, torsions in self.buckets.get(key, {}).values():
+                if abs(mol_energy - energy) >= energy_threshold:
+                    continue
+                # largest difference between dihedrals for the best symmetry mapping
+                delta_torsions = np.abs((rot_torsions - torsions + 180.0) % 360.0 - 180.0)
+                if delta_torsions.max(axis=1).min() <= self.ang_threshold:
+                    similar_mols.append(mol)
+
+        return similar_mols
+
+
+def create_torsion_index(unique_mol, c_energy, torsion_maps, args):
+    """
+    Returns a TorsionIndex with the unique conformers, or None if the dihedral
+    prefilter isn't used (ang_prefilter_fullmonte=None)
+    """
+
+    if torsion_maps is None:
+        return None
+    torsion_index = TorsionIndex(torsion_maps, args.ang_prefilter_fullmonte)
+    for mol, energy in zip(unique_mol, c_energy):
+        torsion_index.add(mol, energy)
+
+    return torsion_index
+
+
+def add_unique_conformer(rot_mol, energy, unique_mol, c_energy, torsion_index=None):
+    """
+    Adds a conformer to the list of unique conformers (and to torsion_index)
+    """
+
+    unique_mol.append(rot_mol)
+    c_energy.append(energy)
+    if torsion_index is not None:
+        torsion_index.add(rot_mol, energy)
+
+
+def is_fullmonte_duplicate(
+    rot_mol, energy, unique_mol, c_energy, args, torsion_index=None
+):
+    """
+    Checks whether a conformer is a duplicate of the unique conformers found
+    (energy and RMSD filters). If torsion_index is defined, the RMSD is only
+    calculated for the conformers with similar dihedral angles (all of them
+    within ang_prefilter_fullmonte, considering the symmetry of the molecule)
+    """
+
+    # compare against allprevious conformers located
+    delta_energy = np.abs(np.asarray(c_energy) - energy)
+    if np.any(delta_energy < args.initial_energy_threshold):
+        return True
+
+    if torsion_index is not None:
+        candidates = torsion_index.get_similar(rot_mol, energy, args.energy_threshold)
+    else:
+        candidates = [
+            unique_mol[j] for j in np.flatnonzero(delta_energy < args.energy_threshold)
+        ]
+
+    for seen_mol in candidates:
+        rms = get_conf_RMS(
+            rot_mol, seen_mol, -1, -1, args.heavyonly, args.max_matches_rmsd
+        )
+        if rms < args.rms_threshold:
+            return True
+    return False
+
+
+def update_fullmonte_pool(unique_mol, c_energy, args, torsion_index=None):
+    """
+    Removes the unique conformers outside the ewin_fullmonte energy window (also
+    from torsion_index) and returns the conformers used in the next steps of the
+    sampling (inside the ewin_sample_fullmonte energy window)
+    """
+
+    unique_mol_sample = []
+    # STEP 7: ANALYSE THE UNIQUE list for lowest energy, reorder the uniques if greater the given thershold remove
+    globmin = min(c_energy)
+    for ene in reversed(c_energy):
+        indx = c_energy.index(ene)
+        if abs(globmin - ene) > args.ewin_fullmonte:
+            if torsion_index is not None:
+                torsion_index.remove(unique_mol[indx])
+            unique_mol.pop(indx)
+            c_energy.pop(indx)
+        if abs(globmin - ene) < args.ewin_sample_fullmonte:
+            unique_mol_sample.append(unique_mol[indx])
+
+    return unique_mol_sample
+
+
+def pool_mol(mol, coords, energy):
+    """
+    Creates a mol object with the coordinates and energy of a conformer of
+    the FullMonte pool (the properties are copied from mol)
+    """
+
+    new_mol = Chem.Mol(mol)
+    new_mol.RemoveAllConformers()
+    new_mol.AddConformer(new_conformer(coords), assignId=True)
+    new_mol.SetProp("Energy", str(energy))
+
+    return new_mol
+
+
+def fullmonte_walker(
+    mol,
+    pool_coords,
+    pool_energies,
+    seeds,
+    rotmatches,
+    args,
+    coord_Map,
+    alg_Map,
+    mol_template,
+    ff,
+    torsion_maps,
+):
+    """
+    Runs the FullMonte steps of one walker (one step for each seed) starting
+    from the merged pool of unique conformers. Returns the coordinates and
+    energies of the new unique conformers and the messages of the log
+    """
+
+    # each walker stores its own log messages
+    args = copy.copy(args)
+    args.log = JobLogger()
+
+    unique_mol = [
+        pool_mol(mol, coords, energy)
+        for coords, energy in zip(pool_coords, pool_energies)
+    ]
+    c_energy = list(pool_energies)
+    torsion_index = create_torsion_index(unique_mol, c_energy, torsion_maps, args)
+    unique_mol_sample = update_fullmonte_pool(unique_mol, c_energy, args, torsion_index)
+
+    new_mols = set()
+    for seed in seeds:
+        for rot_mol, energy in fullmonte_proposals(
+            seed,
+            unique_mol,
+            c_energy,
+            unique_mol_sample,
+            rotmatches,
+            args,
+            coord_Map,
+            alg_Map,
+            mol_template,
+            ff,
+        ):
+            if not is_fullmonte_duplicate(
+                rot_mol, energy, unique_mol, c_energy, args, torsion_index
+            ):
+                add_unique_conformer(rot_mol, energy, unique_mol, c_energy, torsion_index)
+                new_mols.add(id(rot_mol))
+        unique_mol_sample = update_fullmonte_pool(unique_mol, c_energy, args, torsion_index)
+
+    new_confs = [
+        (unique_mol[i].GetConformer().GetPositions(), c_energy[i])
+        for i in range(len(unique_mol))
+        if id(unique_mol[i]) in new_mols
+    ]
+
+    return new_confs, args.log.messages
+
+
+def run_fullmonte_walkers(
+    unique_mol,
+    c_energy,
+    rotmatches,
+    args,
+    coord_Map,
+    alg_Map,
+    mol_template,
+    ff,
+    torsion_maps,
+):
+    """
+    Multi-walker FullMonte sampling. The nsteps_fullmonte steps are shared by
+    nwalkers_fullmonte independent walkers that run in parallel for
+    FULLMONTE_EXCHANGE_STEPS steps starting from the same pool. Then, the new
+    unique conformers of all the walkers are merged (in the order of the
+    walkers, so the results don't depend on the number of processes) and the
+    walkers start again from the merged pool.
+    """
+
+    nwalkers = int(args.nwalkers_fullmonte)
+    n_processes = min(nwalkers, max(1, (os.cpu_count() or 1) // int(args.max_workers)))
+    # the log file can't be shared with the walkers, which send their messages
+    # once they finish
+    walker_args = copy.copy(args)
+    walker_args.log = JobLogger()
+
+    # the seed of each step is the number of the step, and the steps are
+    # distributed in blocks of FULLMONTE_EXCHANGE_STEPS steps between walkers
+    steps = list(range(1, args.nsteps_fullmonte + 1))
+    block = FULLMONTE_EXCHANGE_STEPS
+    rounds = []
+    for start in range(0, len(steps), block * nwalkers):
+        rounds.append(
+            [
+                steps[start + w * block : start + (w + 1) * block]
+                for w in range(nwalkers)
+                if start + w * block < len(steps)
+            ]
+        )
+
+    torsion_index = create_torsion_index(unique_mol, c_energy, torsion_maps, args)
+    executor = None
+    if n_processes > 1:
+        executor = futures.ProcessPoolExecutor(
+            max_workers=n_processes, mp_context=mp.get_context("spawn")
+        )
+    try:
+        for round_seeds in rounds:
+            walker_inputs = [
+                (
+                    unique_mol[0],
+                    [mol.GetConformer().GetPositions() for mol in unique_mol],
+                    list(c_energy),
+                    seeds,
+                    rotmatches,
+                    walker_args,
+                    coord_Map,
+                    alg_Map,
+                    mol_template,
+                    ff,
+                    torsion_maps,
+                )
+                for seeds in round_seeds
+            ]
+            if executor is None:
+                results = [fullmonte_walker(*inputs) for inputs in walker_inputs]
+            else:
+                jobs = [executor.submit(fullmonte_walker, *inputs) for inputs in walker_inputs]
+                results = [job.result() for job in jobs]
+
+            # STEP 6 : Check for DUPLICATES between the conformers of different walkers
+            template_mol = unique_mol[0]
+            for new_confs, messages in results:
+                for message in messages:
+                    args.log.write(message)
+                for coords, energy in new_confs:
+                    rot_mol = pool_mol(template_mol, coords, energy)
+                    if not is_fullmonte_duplicate(
+                        rot_mol, energy, unique_mol, c_energy, args, torsion_index
+                    ):
+                        add_unique_conformer(rot_mol, energy, unique_mol, c_energy, torsion_index)
+            update_fullmonte_pool(unique_mol, c_energy, args, torsion_index)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
 def generating_conformations_fullmonte(
     name,
     args,
@@ -107,12 +642,12 @@ def generating_conformations_fullmonte(
     args.log.write(f"\no  Generation of confomers using FULLMONTE using {n_unique_conformers} unique conformer(s) as starting point(s)")
 
     # Writing the conformers as mol objects to sdf
-    sdtemp = Chem.SDWriter(name + "_" + "rdkit" + args.output)
+    sdtemp = conformer_writer(name + "_" + "rdkit" + args.output)
     for conf in selectedcids_rdkit:
         sdtemp.write(outmols[conf], conf)
     sdtemp.close()
 
-    fmmols = Chem.SDMolSupplier(name + "_" + "rdkit" + args.output, removeHs=False)
+    fmmols = conformer_reader(name + "_" + "rdkit" + args.output, removeHs=False)
     if fmmols is None:
         args.log.write("Could not open " + name + args.output)
         args.log.finalize()
@@ -127,74 +662,65 @@ def generating_conformations_fullmonte(
         unique_mol.append(mol_fm)
         c_energy.append(float(mol_fm.GetProp("Energy")))
 
-    # defining unique mol sample for choosing
-    globmin = min(c_energy)
-    for ene in reversed(c_energy):
-        if abs(globmin - ene) < args.ewin_sample_fullmonte:
-            unique_mol_sample.append(unique_mol[c_energy.index(ene)])
-
-    while nsteps < args.nsteps_fullmonte + 1:
-        seed = nsteps
-
-        # STEP 2: Choose mol object form unique_mol:
-        random.seed(seed)
-        mol_rot = random.choices(unique_mol_sample, k=1)[0]
-
-        # updating the location of mol object i.e., the hexadecimal locaiton to a new one so the older one isnt affected
-        mol = Chem.RWMol(mol_rot)
-        rot_mol = mol.GetMol()
-
-        # STEP 3: Choose random subset of dihedral from rotmatches
-        random.seed(seed)  # RAUL: Any good reason to keep reseting the seed ?
-        k = min(len(rotmatches), args.nrot_fullmonte)
-        mutable_dihedrals = random.choices(rotmatches, k=k)
-
-        # STEP 4: for the given conformation, then apply a random rotation to each torsion in the subset
-        conformer = rot_mol.GetConformer()
-        rotate_dihedrals(conformer, mutable_dihedrals, seed, args.ang_fullmonte)
-
-        # STEP 5: Optimize geometry rot_mol
-        if (coord_Map, alg_Map, mol_template) == (None, None, None):
-            energy = minimize_rdkit_energy(
-                rot_mol, -1, args.log, ff, args.opt_steps_rdkit
-            )
-        else:
-            mol, energy = realign_mol(
-                rot_mol, -1, coord_Map, alg_Map, mol_template, args.opt_steps_rdkit
-            )
-
-        # STEP 6 : Check for DUPLICATES - energy and rms filter (reuse)
-        #  if the conformer is unique then save it the list
-        exclude_conf = False
-        # compare against allprevious conformers located
-        for j, seenmol in enumerate(unique_mol):
-            if abs(energy - c_energy[j]) < args.initial_energy_threshold:
-                exclude_conf = True
-                break
-            if abs(energy - c_energy[j]) < args.energy_threshold:
-                rms = get_conf_RMS(
-                    rot_mol, seenmol, -1, -1, args.heavyonly, args.max_matches_rmsd
-                )
-                if rms < args.rms_threshold:
-                    exclude_conf = True
-                    break
-        if not exclude_conf:
-            unique_mol.append(rot_mol)
-            c_energy.append(energy)
-            unique_mol[c_energy.index(energy)].SetProp("Energy", str(energy))
-
-        unique_mol_sample = []
-        # STEP 7: ANALYSE THE UNIQUE list for lowest energy, reorder the uniques if greater the given thershold remove
+    # dihedrals used to skip the RMSD of conformers with different torsions
+    torsion_maps = None
+    if args.ang_prefilter_fullmonte is not None:
+        torsion_maps = torsion_symmetry_maps(
+            unique_mol[0], rotmatches, args.heavyonly, args.max_matches_rmsd
+        )
+
+    if int(args.nwalkers_fullmonte) > 1:
+        args.log.write(f"\no  Running {args.nwalkers_fullmonte} FULLMONTE walkers in parallel")
+        run_fullmonte_walkers(
+            unique_mol,
+            c_energy,
+            rotmatches,
+            args,
+            coord_Map,
+            alg_Map,
+            mol_template,
+            ff,
+            torsion_maps,
+        )
+
+    else:
+        torsion_index = create_torsion_index(unique_mol, c_energy, torsion_maps, args)
+        # defining unique mol sample for choosing
         globmin = min(c_energy)
         for ene in reversed(c_energy):
-            indx = c_energy.index(ene)
-            if abs(globmin - ene) > args.ewin_fullmonte:
-                unique_mol.pop(indx)
-                c_energy.pop(indx)
             if abs(globmin - ene) < args.ewin_sample_fullmonte:
-                unique_mol_sample.append(unique_mol[indx])
+                unique_mol_sample.append(unique_mol[c_energy.index(ene)])
+
+        while nsteps < args.nsteps_fullmonte + 1:
+            seed = nsteps
+
+            # STEPS 2-5: random rotation of a conformer (or a batch of
+            # conformers) and optimization
+            proposals = fullmonte_proposals(
+                seed,
+                unique_mol,
+                c_energy,
+                unique_mol_sample,
+                rotmatches,
+                args,
+                coord_Map,
+                alg_Map,
+                mol_template,
+                ff,
+            )
+
+            # STEP 6 : Check for DUPLICATES - energy and rms filter (reuse)
+            #  if the conformer is unique then save it the list
+            for rot_mol, energy in proposals:
+                if not is_fullmonte_duplicate(
+                    rot_mol, energy, unique_mol, c_energy, args, torsion_index
+                ):
+                    add_unique_conformer(rot_mol, energy, unique_mol, c_energy, torsion_index)
+                    unique_mol[c_energy.index(energy)].SetProp("Energy", str(energy))
+
+            unique_mol_sample = update_fullmonte_pool(unique_mol, c_energy, args, torsion_index)
 
-        nsteps += 1
+            nsteps += 1
 
     dup_data.at[dup_data_idx, "FullMonte-Unique-conformers"] = len(unique_mol)
 
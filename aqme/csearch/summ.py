@@ -0,0 +1,294 @@
+#####################################################.
+#        This file stores all the functions         #
+#               used in CSEARCH-SUMM                #
+#####################################################.
+
+import os
+import math
+import itertools
+from rdkit.Chem import AllChem as Chem
+from rdkit.Chem import rdMolTransforms
+
+from aqme.filter import (
+    ewin_filter,
+    pre_E_filter,
+    RMSD_and_E_filter,
+    EnergyWindow,
+)
+from aqme.utils import (
+    set_metal_atomic_number,
+    new_conformer,
+    ConformerEnsemble,
+)
+from aqme.csearch.utils import minimize_rdkit_confs
+from aqme.csearch.fullmonte import realign_mol
+
+# number of rotamers minimized at once
+SUMM_BATCH_SIZE = 256
+
+
+class RotamerPruner:
+    """
+    Branch-and-bound cutoff for the enumeration of rotamers. After setting a
+    torsion, the single-point energy (without minimization) of the partial
+    torsion assignment is compared with the lowest energy found at the same
+    depth, and the branch (all the rotamers that share these torsions) is
+    discarded if the difference is higher than the energy window.
+    """
+
+    def __init__(self, mol, conf, ff, energy_window, n_torsions, n_angles):
+        if ff == "MMFF" and Chem.MMFFHasAllMoleculeParams(mol):
+            properties = Chem.MMFFGetMoleculeProperties(mol)
+            self.forcefield = Chem.MMFFGetMoleculeForceField(mol, properties, confId=conf)
+        else:
+            self.forcefield = Chem.UFFGetMoleculeForceField(mol, confId=conf)
+        self.energy_window = float(energy_window)
+        self.n_torsions = n_torsions
+        self.n_angles = n_angles
+        self.lowest_energies = [math.inf] * n_torsions
+        self.n_pruned = 0
+
+    def prune(self, depth, conformer):
+        """
+        Returns True if the branch of the current torsion (depth) is discarded
+        """
+
+        # complete torsion assignments are always minimized
+        if depth >= self.n_torsions - 1:
+            return False
+        energy = self.forcefield.CalcEnergy(conformer.GetPositions().ravel().tolist())
+        if energy - self.lowest_energies[depth] > self.energy_window:
+            self.n_pruned += self.n_angles ** (self.n_torsions - depth - 1)
+            return True
+        self.lowest_energies[depth] = min(energy, self.lowest_energies[depth])
+        return False
+
+
+class SummPool:
+    """
+    Minimized rotamers that pass the energy window (ewin_csearch) and energy
+    duplicate (initial_energy_threshold) filters. The filters are applied as
+    the rotamers are minimized, so only the unique rotamers are kept in memory.
+    """
+
+    def __init__(self, energy_window, threshold):
+        self.energy_window = float(energy_window)
+        self.threshold = float(threshold)
+        self.energy_min = math.inf
+        self.window = EnergyWindow()
+        self.energies, self.coords, self.parents = {}, {}, {}
+        self.n_rotamers = 0
+        self.n_ewin = 0
+        # the energies of the duplicates are kept to assign them to the right
+        # filter once the lowest energy is known
+        self.dup_energies = []
+
+    def add(self, coords, energy, parent):
+        cid = self.n_rotamers
+        self.n_rotamers += 1
+
+        if energy - self.energy_min >= self.energy_window:
+            self.n_ewin += 1
+            return
+        # duplicates of a rotamer with the same (or lower) energy are discarded
+        for dup_cid in self.window.get_cids(energy, self.threshold):
+            if self.energies[dup_cid] <= energy:
+                self.dup_energies.append(energy)
+                return
+
+        self.energies[cid] = energy
+        self.coords[cid] = coords
+        self.parents[cid] = parent
+        self.window.add(cid, energy)
+        self.energy_min = min(energy, self.energy_min)
+
+    def purge(self):
+        """
+        Removes the rotamers that are outside the energy window after finding
+        lower energies
+        """
+
+        for cid in self.window.remove_above(self.energy_min + self.energy_window):
+            del self.energies[cid], self.coords[cid], self.parents[cid]
+            self.n_ewin += 1
+
+
+def rotamer_coords(conformer, rotmatches, degree, pruner=None, i=0):
+    """
+    Generator with the coordinates of all the rotamers obtained by rotating the
+    dihedral angles of rotmatches every degree (in the same order as the
+    recursive enumeration of SUMM)
+    """
+
+    if i >= len(rotmatches):
+        yield conformer.GetPositions()
+        return
+
+    deg = 0
+    while deg < 360.0:
+        rad = math.pi * deg / 180.0
+        rdMolTransforms.SetDihedralRad(conformer, *rotmatches[i], value=rad)
+        if pruner is None or not pruner.prune(i, conformer):
+            yield from rotamer_coords(conformer, rotmatches, degree, pruner, i + 1)
+        deg += int(degree)
+
+
+def minimize_rotamers(
+    mol, rotamers, args, ff, coord_Map, alg_Map, mol_template, num_threads
+):
+    """
+    Generator with the minimized coordinates and energies of the rotamers. The
+    rotamers are minimized in batches of SUMM_BATCH_SIZE conformers using
+    multiple threads
+    """
+
+    batch_mol = Chem.Mol(mol)
+    batch = list(itertools.islice(rotamers, SUMM_BATCH_SIZE))
+    while len(batch) > 0:
+        batch_mol.RemoveAllConformers()
+        for coords in batch:
+            batch_mol.AddConformer(new_conformer(coords), assignId=True)
+
+        if coord_Map is None and alg_Map is None and mol_template is None:
+            energies = minimize_rdkit_confs(
+                batch_mol, args.log, ff, args.opt_steps_rdkit, num_threads
+            )
+        else:
+            energies = {}
+            for conformer in batch_mol.GetConformers():
+                batch_mol, energies[conformer.GetId()] = realign_mol(
+                    batch_mol,
+                    conformer.GetId(),
+                    coord_Map,
+                    alg_Map,
+                    mol_template,
+                    args.opt_steps_rdkit,
+                )
+
+        for conformer in batch_mol.GetConformers():
+            yield conformer.GetPositions(), energies[conformer.GetId()]
+        batch = list(itertools.islice(rotamers, SUMM_BATCH_SIZE))
+
+
+def generating_conformations_summ(
+    name,
+    args,
+    rotmatches,
+    selectedcids_rdkit,
+    outmols,
+    sdwriter,
+    dup_data,
+    dup_data_idx,
+    coord_Map,
+    alg_Map,
+    mol_template,
+    ff,
+):
+    """
+    Systematic rotation of the dihedral angles (SUMM) of the unique RDKit
+    conformers. The rotamers are generated, minimized and filtered as a stream,
+    and only the final unique conformers are written to the SDF file
+    """
+
+    num_threads = max(1, (os.cpu_count() or 1) // int(args.max_workers))
+    n_angles = math.ceil(360.0 / int(args.degree))
+    pool = SummPool(args.ewin_csearch, args.initial_energy_threshold)
+
+    total, n_pruned = 0, 0
+    parents = []
+    for conf in selectedcids_rdkit:
+        # mol object with only this conformer (created from the ensemble)
+        mol_conf = outmols[conf]
+        conformer = mol_conf.GetConformer(conf)
+        parents.append(mol_conf)
+
+        # the starting conformer is also minimized and filtered with its rotamers
+        start_coords = conformer.GetPositions()
+        for m in rotmatches:
+            rdMolTransforms.SetDihedralDeg(conformer, *m, 180.0)
+
+        pruner = None
+        if args.ewin_prune_summ is not None:
+            pruner = RotamerPruner(
+                mol_conf, conf, ff, args.ewin_prune_summ, len(rotmatches), n_angles
+            )
+        rotamers = itertools.chain(
+            [start_coords], rotamer_coords(conformer, rotmatches, args.degree, pruner)
+        )
+
+        n_minimized = 0
+        for coords, energy in minimize_rotamers(
+            mol_conf, rotamers, args, ff, coord_Map, alg_Map, mol_template, num_threads
+        ):
+            pool.add(coords, energy, len(parents) - 1)
+            n_minimized += 1
+            if n_minimized % SUMM_BATCH_SIZE == 0:
+                pool.purge()
+        pool.purge()
+
+        total += n_minimized - 1
+        if pruner is not None:
+            n_pruned += pruner.n_pruned
+
+    dup_data.at[dup_data_idx, "summ-conformers"] = total
+    if args.ewin_prune_summ is not None:
+        args.log.write(f"\no  {n_pruned} rotamers were discarded with the branch-and-bound energy cutoff (ewin_prune_summ = {args.ewin_prune_summ} kcal/mol)")
+
+    # the remaining filters are applied to the rotamers kept, sorted by energy
+    pool_cids = sorted(pool.energies)
+    cenergy = [pool.energies[cid] for cid in pool_cids]
+    pool_mols = ConformerEnsemble(
+        outmols.mol, [pool.coords[cid] for cid in pool_cids], cenergy
+    )
+    sorted_cids = sorted(range(len(pool_cids)), key=lambda cid: cenergy[cid])
+
+    # filter based on energy window ewin_csearch
+    sortedcids_rotated = ewin_filter(
+        sorted_cids,
+        cenergy,
+        dup_data,
+        dup_data_idx,
+        "summ",
+        args.ewin_csearch,
+    )
+    # pre-filter based on energy only
+    selectedcids_initial_rotated = pre_E_filter(
+        sortedcids_rotated,
+        cenergy,
+        dup_data,
+        dup_data_idx,
+        "summ",
+        args.initial_energy_threshold,
+    )
+    # filter based on energy and RMSD
+    selectedcids_rotated = RMSD_and_E_filter(
+        pool_mols,
+        selectedcids_initial_rotated,
+        cenergy,
+        args,
+        dup_data,
+        dup_data_idx,
+        "summ",
+    )
+
+    # adds the rotamers discarded while minimizing
+    n_dup_ewin = sum(
+        1 for energy in pool.dup_energies if energy - pool.energy_min >= pool.energy_window
+    )
+    dup_data.at[dup_data_idx, "summ-energy-window"] += pool.n_ewin + n_dup_ewin
+    dup_data.at[dup_data_idx, "summ-initial_energy_threshold"] += len(pool.dup_energies) - n_dup_ewin
+
+    for i, cid in enumerate(selectedcids_rotated):
+        parent = parents[pool.parents[pool_cids[cid]]]
+        mol_rd = pool_mols[cid]
+        for prop in parent.GetPropNames():
+            mol_rd.SetProp(prop, parent.GetProp(prop))
+        mol_rd.SetProp("_Name", parent.GetProp("_Name") + " " + str(i))
+        mol_rd.SetProp("Energy", str(cenergy[cid]))
+        if len(args.metal_atoms) >= 1:
+            set_metal_atomic_number(mol_rd, args.metal_idx, args.metal_sym)
+        sdwriter.write(mol_rd, cid)
+
+    status = 1
+
+    return status
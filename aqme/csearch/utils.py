@@ -8,7 +8,12 @@ import sys
 import subprocess
 import pandas as pd
 import ast
+import hashlib
 from pathlib import Path
+from multiprocessing import shared_memory
+import concurrent.futures as futures
+import multiprocessing as mp
+import numpy as np
 from rdkit.Chem import AllChem as Chem
 from rdkit.ML.Cluster import Butina
 from aqme.utils import (
@@ -16,10 +21,17 @@ from aqme.utils import (
     mol_from_sdf_or_mol_or_mol2,
     read_xyz_charge_mult,
     add_prefix_suffix,
-    get_conf_RMS
+    get_conf_RMS,
 )
+from aqme.filter import get_rmsd_coords, get_best_rms_batch
 from aqme.csearch.crest import nci_ts_mol
 
+# minimum amount of work (conformer pairs x atom mappings x atoms) to compute
+# the RMSD matrix of cluster_conformers() with multiple processes. The serial
+# RMSD runs at ~2-4e6 units/s and starting the spawn pool costs ~4 s, so the
+# pool is only used above ~5-10 s of serial work
+CLUSTER_PARALLEL_WORK = 20000000
+
 
 def creation_of_dup_csv_csearch(program):
     """
@@ -83,6 +95,91 @@ def creation_of_dup_csv_csearch(program):
     return pd.DataFrame(columns=columns)
 
 
+# options that change the conformers obtained in CSEARCH (used to check whether
+# a finished job can be reused)
+CSEARCH_PARAMS = [
+    "program",
+    "output",
+    "sample",
+    "auto_sample",
+    "sample_convergence",
+    "max_sample",
+    "ff",
+    "seed",
+    "ewin_csearch",
+    "initial_energy_threshold",
+    "energy_threshold",
+    "rms_threshold",
+    "opt_steps_rdkit",
+    "heavyonly",
+    "max_matches_rmsd",
+    "max_mol_wt",
+    "max_torsions",
+    "bond_thres",
+    "angle_thres",
+    "dihedral_thres",
+    "geom_prescreen",
+    "auto_metal_atoms",
+    "metal_atoms",
+    "degree",
+    "ewin_prune_summ",
+    "ewin_fullmonte",
+    "ewin_sample_fullmonte",
+    "nsteps_fullmonte",
+    "nrot_fullmonte",
+    "ang_fullmonte",
+    "nwalkers_fullmonte",
+    "nproposals_fullmonte",
+    "ang_prefilter_fullmonte",
+    "crest_force",
+    "crest_keywords",
+    "cregen",
+    "cregen_keywords",
+    "xtb_keywords",
+    "crest_nrun",
+    "crest_nclust",
+]
+
+
+def job_checksum(job_input):
+    """
+    Returns a SHA-256 hash of a CSEARCH job (SMILES or mol object, name, charge, 
+    mult, constraints, complex_type and geom)
+    """
+
+    job_items = []
+    for item in job_input:
+        # 3D inputs store mol objects instead of SMILES
+        if isinstance(item, Chem.Mol):
+            item = Chem.MolToMolBlock(item)
+        job_items.append(item)
+
+    return hashlib.sha256(repr(job_items).encode()).hexdigest()
+
+
+def params_checksum(args):
+    """
+    Returns a SHA-256 hash of the CSEARCH options that affect the conformers generated
+    """
+
+    params = [(param, getattr(args, param)) for param in CSEARCH_PARAMS]
+
+    return hashlib.sha256(repr(params).encode()).hexdigest()
+
+
+def file_checksum(file):
+    """
+    Returns the SHA-256 checksum of a file
+    """
+
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1048576), b""):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
 def csv_2_list(contraints):
     try:
         if pd.isnull(contraints):
@@ -124,31 +221,40 @@ def prepare_direct_smi(args):
 
 
 def prepare_smiles_files(args, csearch_file):
-    with open(csearch_file) as smifile:
-        lines = [line for line in smifile if line.strip()]
-    job_inputs = []
-    for _, line in enumerate(lines):
-        (
-            smi,
-            name,
-        ) = prepare_smiles_from_line(line, args)
-        obj = (
-            smi,
-            name,
-            args.charge,
-            args.mult,
-            args.constraints_atoms,
-            args.constraints_dist,
-            args.constraints_angle,
-            args.constraints_dihedral,
-            args.complex_type,
-            args.geom
-        )
-        job_inputs.append(obj)
+    job_inputs = list(generate_smiles_jobs(args, csearch_file))
 
     return job_inputs
 
 
+def generate_smiles_jobs(args, csearch_file):
+    """
+    Yields the CSEARCH jobs of a SMILES file one line at a time, so the whole
+    file is never loaded into memory.
+    """
+
+    with open(csearch_file) as smifile:
+        for line in smifile:
+            if not line.strip():
+                continue
+            (
+                smi,
+                name,
+            ) = prepare_smiles_from_line(line, args)
+            obj = (
+                smi,
+                name,
+                args.charge,
+                args.mult,
+                args.constraints_atoms,
+                args.constraints_dist,
+                args.constraints_angle,
+                args.constraints_dihedral,
+                args.complex_type,
+                args.geom
+            )
+            yield obj
+
+
 def prepare_smiles_from_line(line, args):
 
     toks = line.split()
@@ -162,94 +268,77 @@ def prepare_smiles_from_line(line, args):
 
 def prepare_csv_files(args, csearch_file):
     csv_smiles = pd.read_csv(csearch_file)
-    job_inputs = []
-    for i in range(len(csv_smiles)):
-        obj = generate_mol_from_csv(args, csv_smiles, i)
-        job_inputs.append(obj)
+    job_inputs = generate_jobs_from_csv(args, csv_smiles)
     return job_inputs
 
 
-def generate_mol_from_csv(args, csv_smiles, index):
-    # assigning names and smi in each loop
-    try:
-        smiles = csv_smiles.loc[index, "SMILES"]
-    except KeyError:
-        try:
-            smiles = csv_smiles.loc[index, "smiles"]
-        except KeyError:
-            args.log.write("\nx  Make sure the CSV file contains a column called 'SMILES' or 'smiles' with the SMILES of the molecules!")
-            args.log.finalize()
-            sys.exit()
+def generate_csv_jobs(args, csearch_file, chunksize):
+    """
+    Yields the CSEARCH jobs of a CSV file reading chunks of chunksize rows,
+    so the memory used doesn't grow with the size of the library.
+    """
 
-    try:
-        name = csv_smiles.loc[index, "code_name"]
-        name = add_prefix_suffix(name, args)
+    with pd.read_csv(csearch_file, chunksize=chunksize) as csv_reader:
+        for csv_smiles in csv_reader:
+            yield from generate_jobs_from_csv(args, csv_smiles)
 
-    except KeyError:
-        args.log.write("\nx  Make sure the CSV file contains a column called 'code_name' with the names of the molecules!")
+
+def generate_jobs_from_csv(args, csv_smiles):
+    """
+    Creates the CSEARCH jobs from a DataFrame, handling each column at once
+    instead of looking up the values row by row.
+    """
+
+    # assigning names and smi
+    if "SMILES" in csv_smiles.columns:
+        smiles_col = "SMILES"
+    elif "smiles" in csv_smiles.columns:
+        smiles_col = "smiles"
+    else:
+        args.log.write("\nx  Make sure the CSV file contains a column called 'SMILES' or 'smiles' with the SMILES of the molecules!")
         args.log.finalize()
         sys.exit()
 
-    constraints_atoms = args.constraints_atoms
-    constraints_dist = args.constraints_dist
-    constraints_angle = args.constraints_angle
-    constraints_dihedral = args.constraints_dihedral
-
-    if "constraints_atoms" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'constraints_atoms']).lower() != 'nan':
-            constraints_atoms = csv_smiles.loc[index, "constraints_atoms"]
-
-    if "constraints_dist" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'constraints_dist']).lower() != 'nan':
-            constraints_dist = csv_smiles.loc[index, "constraints_dist"]
-
-    if "constraints_angle" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'constraints_angle']).lower() != 'nan':
-            constraints_angle = csv_smiles.loc[index, "constraints_angle"]
-
-    if "constraints_dihedral" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'constraints_dihedral']).lower() != 'nan':
-            constraints_dihedral = csv_smiles.loc[index, "constraints_dihedral"]
-
-    constraints_atoms = csv_2_list(constraints_atoms)
-    constraints_dist = csv_2_list(constraints_dist)
-    constraints_angle = csv_2_list(constraints_angle)
-    constraints_dihedral = csv_2_list(constraints_dihedral)
-
-    charge = args.charge
-    mult = args.mult
-    if "charge" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'charge']).lower() != 'nan':
-            charge = csv_smiles.loc[index, "charge"]
-    if "mult" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'mult']).lower() != 'nan':
-            mult = csv_smiles.loc[index, "mult"]
-
-    complex_type = args.complex_type
-    if "complex_type" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'complex_type']).lower() != 'nan':
-            complex_type = csv_smiles.loc[index, "complex_type"]
-
-    geom = args.geom
-    if "geom" in csv_smiles.columns:
-        if str(csv_smiles.loc[index, 'geom']).lower() != 'nan':
-            geom = csv_smiles.loc[index, "geom"]
-    geom = csv_2_list(geom)
+    if "code_name" not in csv_smiles.columns:
+        args.log.write("\nx  Make sure the CSV file contains a column called 'code_name' with the names of the molecules!")
+        args.log.finalize()
+        sys.exit()
 
-    obj = (
-        smiles,
-        name,
-        charge,
-        mult,
-        constraints_atoms,
-        constraints_dist,
-        constraints_angle,
-        constraints_dihedral,
-        complex_type,
-        geom
+    smiles = csv_smiles[smiles_col].tolist()
+    names = [add_prefix_suffix(name, args) for name in csv_smiles["code_name"].tolist()]
+
+    def column_values(column, default):
+        # empty cells (and missing columns) take the value from args
+        if column not in csv_smiles.columns:
+            return [default] * len(csv_smiles)
+        values = csv_smiles[column].astype(object)
+        return [default if pd.isnull(value) else value for value in values.tolist()]
+
+    constraints_atoms = [csv_2_list(value) for value in column_values("constraints_atoms", args.constraints_atoms)]
+    constraints_dist = [csv_2_list(value) for value in column_values("constraints_dist", args.constraints_dist)]
+    constraints_angle = [csv_2_list(value) for value in column_values("constraints_angle", args.constraints_angle)]
+    constraints_dihedral = [csv_2_list(value) for value in column_values("constraints_dihedral", args.constraints_dihedral)]
+    charge = column_values("charge", args.charge)
+    mult = column_values("mult", args.mult)
+    complex_type = column_values("complex_type", args.complex_type)
+    geom = [csv_2_list(value) for value in column_values("geom", args.geom)]
+
+    job_inputs = list(
+        zip(
+            smiles,
+            names,
+            charge,
+            mult,
+            constraints_atoms,
+            constraints_dist,
+            constraints_angle,
+            constraints_dihedral,
+            complex_type,
+            geom
+        )
     )
 
-    return obj
+    return job_inputs
 
 
 def prepare_cdx_files(args, csearch_file):
@@ -459,6 +548,45 @@ def minimize_rdkit_energy(mol, conf, log, FF, maxsteps):
     return energy
 
 
+def minimize_rdkit_confs(mol, log, FF, maxsteps, num_threads=0):
+    """
+    Minimizes all the conformers of a molecule with multiple threads (the 
+    force field parameters are only set up once) and returns a dictionary 
+    with the final energy of each conformer ID.
+    """
+
+    if FF not in ["MMFF", "UFF"]:
+        log.write(f" Force field {FF} not supported!")
+        log.finalize()
+        sys.exit()
+
+    # if MMFF parameters are missing, MMFF will not work. Attempt UFF.
+    if FF == "MMFF" and not Chem.MMFFHasAllMoleculeParams(mol):
+        FF = "UFF"
+
+    try:
+        if FF == "MMFF":
+            results = Chem.MMFFOptimizeMoleculeConfs(
+                mol, numThreads=num_threads, maxIters=maxsteps
+            )
+        else:
+            results = Chem.UFFOptimizeMoleculeConfs(
+                mol, numThreads=num_threads, maxIters=maxsteps
+            )
+    except RuntimeError:
+        # one conformer at a time, keeping the non-optimized geometries that fail
+        return {
+            conf.GetId(): minimize_rdkit_energy(mol, conf.GetId(), log, FF, maxsteps)
+            for conf in mol.GetConformers()
+        }
+
+    energies = {}
+    for conf, (_, energy) in zip(mol.GetConformers(), results):
+        energies[conf.GetId()] = float(energy)
+
+    return energies
+
+
 def getDihedralMatches(mol, heavy):
     # this is rdkit's "strict" pattern
     pattern = r"*~[!$(*#*)&!D1&!$(C(F)(F)F)&!$(C(Cl)(Cl)Cl)&!$(C(Br)(Br)Br)&!$(C([CH3])([CH3])[CH3])&!$([CD3](=[N,O,S])-!@[#7,O,S!D1])&!$([#7,O,S!D1]-!@[CD3]=[N,O,S])&!$([CD3](=[N+])-!@[#7!D1])&!$([#7!D1]-!@[CD3]=[N+])]-!@[!$(*#*)&!D1&!$(C(F)(F)F)&!$(C(Cl)(Cl)Cl)&!$(C(Br)(Br)Br)&!$(C([CH3])([CH3])[CH3])]~*"
@@ -548,11 +676,119 @@ def smi_to_mol(
         complex_ts
     )
 
-def cluster_conformers(mols, heavy_only, max_matches_rmsd, cluster_thr):
-    dists = []
-    for i in range(len(mols)):
-        for j in range(i):
-            dists.append(get_conf_RMS(mols[i],mols[j], i, j, heavy_only, max_matches_rmsd))
+def rmsd_matrix_rows(coords, matches, dists, start_row, end_row):
+    """
+    Fills the rows start_row to end_row of the condensed RMSD matrix dists
+    (pairs i > j, in the order used by Butina.ClusterData) with the RMSD of
+    the RMSD_and_E_filter (get_best_rms_batch). coords are the centered
+    coordinates of get_rmsd_coords() stacked in an array
+    """
+
+    for i in range(max(start_row, 1), end_row):
+        row_start = i * (i - 1) // 2
+        dists[row_start : row_start + i] = get_best_rms_batch(coords[i], coords[:i], matches)
+
+
+def rmsd_matrix_rows_shared(coords_name, coords_shape, dists_name, n_pairs, matches, start_row, end_row):
+    """
+    Runs rmsd_matrix_rows() in a worker process, reading the coordinates and
+    writing the RMSD values in shared memory blocks
+    """
+
+    coords_shm = shared_memory.SharedMemory(name=coords_name)
+    dists_shm = shared_memory.SharedMemory(name=dists_name)
+    try:
+        coords = np.ndarray(coords_shape, dtype=np.float64, buffer=coords_shm.buf)
+        dists = np.ndarray((n_pairs,), dtype=np.float32, buffer=dists_shm.buf)
+        rmsd_matrix_rows(coords, matches, dists, start_row, end_row)
+        del coords, dists
+    finally:
+        coords_shm.close()
+        dists_shm.close()
+
+
+def rmsd_matrix(mols, heavy_only, max_matches_rmsd, n_processes=1):
+    """
+    Condensed matrix (float32) with the RMSD of all the pairs of mol objects
+    (using the first conformer of each mol object), with the same RMSD as the
+    RMSD_and_E_filter. Large matrices are computed in blocks of rows by
+    n_processes processes that share the coordinates and the matrix through
+    shared memory
+    """
+
+    n_confs = len(mols)
+    n_pairs = n_confs * (n_confs - 1) // 2
+    cids = list(range(n_confs))
+    coords, matches = get_rmsd_coords(mols, cids, "summ", heavy_only, max_matches_rmsd)
+    if coords is None:
+        # conformers with different atoms or atom orders
+        dists = np.empty(n_pairs, dtype=np.float32)
+        for i in range(1, n_confs):
+            for j in range(i):
+                dists[i * (i - 1) // 2 + j] = get_conf_RMS(
+                    mols[i], mols[j], -1, -1, heavy_only, max_matches_rmsd
+                )
+        return dists
+    coords = np.array([coords[cid] for cid in cids])
+
+    # the pool is only used when its start-up time is small compared to the
+    # calculation (the cost of each pair grows with the atom mappings and atoms)
+    work = n_pairs * len(matches) * coords.shape[1]
+    if n_processes <= 1 or work < CLUSTER_PARALLEL_WORK:
+        dists = np.empty(n_pairs, dtype=np.float32)
+        rmsd_matrix_rows(coords, matches, dists, 0, n_confs)
+        return dists
+
+    # blocks of rows with a similar number of pairs (a few blocks per process
+    # to balance the load)
+    n_blocks = 4 * n_processes
+    row_limits = [0]
+    for block in range(1, n_blocks):
+        row = int(np.ceil(np.sqrt(2.0 * n_pairs * block / n_blocks)))
+        if row_limits[-1] < row < n_confs:
+            row_limits.append(row)
+    row_limits.append(n_confs)
+
+    coords_shm = shared_memory.SharedMemory(create=True, size=coords.nbytes)
+    dists_shm = shared_memory.SharedMemory(create=True, size=max(1, n_pairs * 4))
+    try:
+        np.ndarray(coords.shape, dtype=np.float64, buffer=coords_shm.buf)[:] = coords
+        with futures.ProcessPoolExecutor(
+            max_workers=n_processes, mp_context=mp.get_context("spawn")
+        ) as executor:
+            jobs = [
+                executor.submit(
+                    rmsd_matrix_rows_shared,
+                    coords_shm.name,
+                    coords.shape,
+                    dists_shm.name,
+                    n_pairs,
+                    matches,
+                    start_row,
+                    end_row,
+                )
+                for start_row, end_row in zip(row_limits[:-1], row_limits[1:])
+            ]
+            for job in jobs:
+                job.result()
+        dists = np.ndarray((n_pairs,), dtype=np.float32, buffer=dists_shm.buf).copy()
+    finally:
+        coords_shm.close()
+        coords_shm.unlink()
+        dists_shm.close()
+        dists_shm.unlink()
+
+    return dists
+
+
+def cluster_conformers(mols, heavy_only, max_matches_rmsd, cluster_thr, n_processes=1):
+    """
+    Butina clustering of a list of mol objects (using the first conformer of
+    each mol object) based on their RMSD. Returns the mol objects of the
+    centroids of the clusters and their indexes in the list
+    """
+
+    dists = rmsd_matrix(mols, heavy_only, max_matches_rmsd, n_processes)
 
     clusts = Butina.ClusterData(dists, len(mols), cluster_thr, isDistData=True, reordering=True)
     centroids = [x[0] for x in clusts]
@@ -3,9 +3,11 @@
 #             used for filtering                    #
 #####################################################.
 
+import bisect
+import numpy as np
 from rdkit import Chem
 from rdkit.Chem import rdMolTransforms, Descriptors
-from aqme.utils import periodic_table, get_conf_RMS
+from aqme.utils import periodic_table, get_conf_RMS, ConformerEnsemble
 
 # Aux functions of the geometry filter
 # def is_carbene_like(neighbours):
@@ -223,7 +225,7 @@ from aqme.utils import periodic_table, get_conf_RMS
 
 
 # Main API of the geometry filter
-def geom_filter(self,mol,geom):
+def geom_filter(self,mol,geom,rule=None,thres_factor=1.0,conf=0):
     """
     Returns whether a mol object passes all the geometric rules.
 
@@ -233,6 +235,14 @@ def geom_filter(self,mol,geom):
             Self object with the AQME arguments used
     mol : rdkit.Chem.Mol
             Molecule to be tested.
+    rule : list, default=None
+            Atoms and value of the rule obtained with geom_rule() (if None, the 
+            rule is obtained from geom for this mol object)
+    thres_factor : float, default=1.0
+            Factor applied to the bond_thres, angle_thres and dihedral_thres 
+            thresholds (i.e. to loosen the rule)
+    conf : int, default=0
+            ID of the conformer tested
 
     Returns
     -------
@@ -245,22 +255,49 @@ def geom_filter(self,mol,geom):
     passing = True
     if geom != []:
         passing = False
-        if geom == ['Ir_squareplanar']:
-            new_geom = Ir_SP_filter(mol)
-            if len(new_geom) == 0:
-                self.args.log.write(f"x  This molecule is not one of the supported Ir squareplanar complexes! It was discarded by the geom filter")
-                passing = False
-            passing = matching_fun(self,mol,'Ir_squareplanar',new_geom,passing)
-
-        else:
-            if len(geom) != 2:
-                self.args.log.write(f"x  The geom option {geom} was not correctly defined, the geometric filter will be turned off! Correct format: [SMARTS,THRESHOLD], for example [CCCO,180] for a 180 degree dihedral")
-                return passing
-            passing = matching_fun(self,mol,'regular_rule',geom,passing)
+        if rule is None:
+            rule = geom_rule(self,mol,geom)
+        if rule is None:
+            return passing
+        passing = matching_fun(self,mol,rule,passing,thres_factor,conf)
     
     return passing
 
 
+def geom_rule(self,mol,geom):
+    """
+    Finds the atoms and the target value of the geom rule in a molecule. All 
+    the conformers of a molecule share the same atoms, so the SMARTS patterns 
+    are compiled and matched only once per molecule. Returns [matches, value, 
+    rule content], or None if the rule is not correctly defined.
+    """
+
+    if geom == ['Ir_squareplanar']:
+        new_geom = Ir_SP_filter(mol)
+        if len(new_geom) == 0:
+            self.args.log.write(f"x  This molecule is not one of the supported Ir squareplanar complexes! It was discarded by the geom filter")
+            return [[], None, 'Ir_squareplanar']
+        return [new_geom[:3], new_geom[3], 'Ir_squareplanar']
+
+    if len(geom) != 2:
+        self.args.log.write(f"x  The geom option {geom} was not correctly defined, the geometric filter will be turned off! Correct format: [SMARTS,THRESHOLD], for example [CCCO,180] for a 180 degree dihedral")
+        return None
+
+    # SMARTS match to detect the atoms used to calculate the geometric value
+    matches = []
+    smarts = geom[0]
+    geom_val = geom[1]
+    smarts_content = ''.join(smarts.replace('[',']').split(']')) # this way both 'ATOM' and '[ATOM]' work
+    try:
+        matches = mol.GetSubstructMatches(Chem.MolFromSmarts(smarts))
+    except: # I tried to make this except more specific for Boost.Python.ArgumentError, but apparently it's not as simple as it looks
+        matches = mol.GetSubstructMatches(Chem.MolFromSmarts(f'[{smarts}]'))
+    if len(matches) > 0:
+        matches = list(matches[0])
+
+    return [matches, geom_val, smarts_content]
+
+
 def Ir_SP_filter(mol):
     '''
     Special geometry rule designed to filter the correct conformers of Ir squareplanar complexes.
@@ -320,44 +357,31 @@ def Ir_SP_filter(mol):
 
     return new_geom
 
-def matching_fun(self,mol,type_match,geom,passing):
+def matching_fun(self,mol,rule,passing,thres_factor=1.0,conf=0):
     '''
-    Checks matches and analyzed if they pass the geometry rules
+    Checks if the conformer passes the geometry rule (obtained with geom_rule)
     '''
 
-    # SMARTS match to detect the atoms and calculate the geometric value. Then, check if the value
+    # calculate the geometric value of the atoms matched and check if the value
     # is within the threshold
+    matches, geom_val, smarts_content = rule
 
-    if type_match == 'regular_rule':
-        matches = []
-        smarts = geom[0]
-        geom_val = geom[1]
-        smarts_content = ''.join(smarts.replace('[',']').split(']')) # this way both 'ATOM' and '[ATOM]' work
-        try:
-            matches = mol.GetSubstructMatches(Chem.MolFromSmarts(smarts))
-        except: # I tried to make this except more specific for Boost.Python.ArgumentError, but apparently it's not as simple as it looks
-            matches = mol.GetSubstructMatches(Chem.MolFromSmarts(f'[{smarts}]'))
-        if len(matches) > 0:
-            matches = list(matches[0])
-        
-    elif type_match == 'Ir_squareplanar':
-        matches = geom[:3]
-        geom_val = geom[3]
-        smarts_content = 'Ir_squareplanar'
-
-    mol_conf = mol.GetConformer(0) # Retrieve the only 3D conformer generated in that mol object for rdMolTransforms
+    mol_conf = mol.GetConformer(conf) # Retrieve the 3D conformer for rdMolTransforms
     if smarts_content in periodic_table():
         if len(matches) >= 1:
             passing = True
     elif len(matches) == 2:
         mol_val = rdMolTransforms.GetBondLength(mol_conf, matches[0], matches[1])
-        passing = (geom_val - self.args.bond_thres) <= mol_val <= (geom_val + self.args.bond_thres)
+        thres = self.args.bond_thres * thres_factor
+        passing = (geom_val - thres) <= mol_val <= (geom_val + thres)
     elif len(matches) == 3:
         mol_val = rdMolTransforms.GetAngleDeg(mol_conf, matches[0], matches[1], matches[2])
-        passing = (geom_val - self.args.angle_thres) <= mol_val <= (geom_val + self.args.angle_thres)
+        thres = self.args.angle_thres * thres_factor
+        passing = (geom_val - thres) <= mol_val <= (geom_val + thres)
     elif len(matches) == 4:
         mol_val = rdMolTransforms.GetDihedralDeg(mol_conf, matches[0], matches[1], matches[2], matches[3])
-        passing = (geom_val - self.args.dihedral_thres) <= mol_val <= (geom_val + self.args.dihedral_thres)
+        thres = self.args.dihedral_thres * thres_factor
+        passing = (geom_val - thres) <= mol_val <= (geom_val + thres)
 
     return passing
 
@@ -453,6 +477,57 @@ def ewin_filter(
     return sortedcids
 
 
+class EnergyWindow:
+    """
+    Stores the accepted conformers sorted by energy, so the conformers inside
+    an energy threshold are found with a binary search instead of comparing
+    against all the accepted conformers
+    """
+
+    def __init__(self):
+        self.energies = []
+        self.cids = []
+        self.cid_set = set()
+
+    def add(self, cid, energy):
+        idx = bisect.bisect_right(self.energies, energy)
+        self.energies.insert(idx, energy)
+        self.cids.insert(idx, cid)
+        self.cid_set.add(cid)
+
+    def get_cids(self, energy, threshold, max_cids=None):
+        """
+        Returns the conformers with an energy difference lower than threshold
+        (sorted by energy difference), or only the closest max_cids conformers
+        """
+
+        # the window is slightly wider to avoid rounding issues, and the 
+        # energy differences are checked afterwards
+        start = bisect.bisect_left(self.energies, energy - threshold - 1e-6)
+        end = bisect.bisect_right(self.energies, energy + threshold + 1e-6)
+        window_cids = []
+        for idx in range(start, end):
+            E_diff = abs(energy - self.energies[idx])  # in kcal/mol
+            if E_diff < threshold:
+                window_cids.append((E_diff, self.cids[idx]))
+        window_cids.sort(key=lambda pair: pair[0])
+
+        return [cid for _, cid in window_cids[:max_cids]]
+
+    def remove_above(self, energy):
+        """
+        Removes the conformers with energies higher or equal to energy and 
+        returns their cids
+        """
+
+        idx = bisect.bisect_left(self.energies, energy)
+        removed_cids = self.cids[idx:]
+        del self.energies[idx:], self.cids[idx:]
+        self.cid_set.difference_update(removed_cids)
+
+        return removed_cids
+
+
 def pre_E_filter(
     sortedcids, cenergy, dup_data, dup_data_idx, calc_type, threshold
 ):
@@ -491,18 +566,20 @@ def pre_E_filter(
 
     # Add the first one
     selectedcids_initial.append(sortedcids[0])
+    # the energies of the accepted conformers are kept sorted, so only the closest
+    # ones in energy need to be checked
+    window = EnergyWindow()
+    window.add(sortedcids[0], cenergy[sortedcids[0]])
     for conf in sortedcids[1:]:
         is_unique = True
-        # check rmsd
-        for seenconf in selectedcids_initial:
-            E_diff = abs(cenergy[conf] - cenergy[seenconf])  # in kcal/mol
-            if E_diff < threshold:
-                eng_dup += 1
-                is_unique = False
-                break
+        # check energy
+        if len(window.get_cids(cenergy[conf], threshold, max_cids=1)) > 0:
+            eng_dup += 1
+            is_unique = False
         if is_unique:
-            if conf not in selectedcids_initial:
+            if conf not in window.cid_set:
                 selectedcids_initial.append(conf)
+                window.add(conf, cenergy[conf])
 
     if calc_type == "rdkit":
         column = "RDKit-initial_energy_threshold"
@@ -537,41 +614,60 @@ def RMSD_and_E_filter(
     rms_threshold = float(args.rms_threshold)
     max_matches_rmsd = int(args.max_matches_rmsd)
 
+    # the H atoms are removed and the symmetry-equivalent atoms are matched only once
+    coords, matches = get_rmsd_coords(
+        outmols, selectedcids_initial, calc_type, args.heavyonly, max_matches_rmsd
+    )
+    # only the accepted conformers inside the energy threshold are compared
+    window = EnergyWindow()
+    window.add(selectedcids_initial[0], cenergy[selectedcids_initial[0]])
+
     for _,conf in enumerate(selectedcids_initial[1:]):
         # This keeps track of whether or not your conformer is unique
         excluded_conf = False
 
         # check energy and rmsd
-        for seenconf in selectedcids:
-            E_diff = abs(cenergy[conf] - cenergy[seenconf])  # in kcal/mol
-            if E_diff < energy_threshold:
-                if calc_type == "rdkit":
-                    rms = get_conf_RMS(
-                        outmols[seenconf],
-                        outmols[conf],
-                        seenconf,
-                        conf,
-                        args.heavyonly,
-                        max_matches_rmsd
-                    )
-                # elif calc_type == 'summ' or calc_type == 'fullmonte' or calc_type =='xtb' or calc_type =='ani':
-                elif calc_type == "summ" or calc_type == "xtb" or calc_type == "ani":
-                    rms = get_conf_RMS(
-                        outmols[conf],
-                        outmols[seenconf],
-                        -1,
-                        -1,
-                        args.heavyonly,
-                        max_matches_rmsd
-                    )
-                if rms < rms_threshold:
-                    excluded_conf = True
-                    eng_rms_dup += 1
-                    break
+        seenconfs = window.get_cids(cenergy[conf], energy_threshold)
+
+        if len(seenconfs) > 0:
+            if coords is not None:
+                rms_list = get_best_rms_batch(
+                    coords[conf], np.array([coords[seenconf] for seenconf in seenconfs]), matches
+                )
+            else:
+                # conformers with different atoms or atom orders
+                rms_list = []
+                for seenconf in seenconfs:
+                    if calc_type == "rdkit":
+                        rms = get_conf_RMS(
+                            outmols[seenconf],
+                            outmols[conf],
+                            seenconf,
+                            conf,
+                            args.heavyonly,
+                            max_matches_rmsd
+                        )
+                    # elif calc_type == 'summ' or calc_type == 'fullmonte' or calc_type =='xtb' or calc_type =='ani':
+                    elif calc_type == "summ" or calc_type == "xtb" or calc_type == "ani":
+                        rms = get_conf_RMS(
+                            outmols[conf],
+                            outmols[seenconf],
+                            -1,
+                            -1,
+                            args.heavyonly,
+                            max_matches_rmsd
+                        )
+                    rms_list.append(rms)
+                    if rms < rms_threshold:
+                        break
+            if min(rms_list) < rms_threshold:
+                excluded_conf = True
+                eng_rms_dup += 1
 
         if not excluded_conf:
-            if conf not in selectedcids:
+            if conf not in window.cid_set:
                 selectedcids.append(conf)
+                window.add(conf, cenergy[conf])
 
     # Write the found duplicates:
     if calc_type == "rdkit":
@@ -592,3 +688,127 @@ def RMSD_and_E_filter(
         dup_data.at[dup_data_idx, uniques_column] = len(selectedcids)
 
     return selectedcids
+
+
+def symmetrize_terminal_atoms(mol):
+    """
+    Makes terminal O and N atoms of conjugated groups (i.e. O atoms of nitro and 
+    carboxylate groups) equivalent, as done in the GetBestRMS() RDKit function 
+    (symmetrizeConjugatedTerminalGroups option)
+    """
+
+    pattern = Chem.MolFromSmarts(
+        "[O,N;D1;$([O,N;D1]-[*]=[O,N;D1]),$([O,N;D1]=[*]-[O,N;D1])]~[*]"
+    )
+    for atom_idx, neigh_idx in mol.GetSubstructMatches(pattern):
+        mol.GetAtomWithIdx(atom_idx).SetFormalCharge(0)
+        mol.GetBondBetweenAtoms(atom_idx, neigh_idx).SetBondType(Chem.BondType.SINGLE)
+
+
+def get_rmsd_coords(outmols, cids, calc_type, heavy, max_matches_rmsd):
+    """
+    Gets the coordinates and the symmetry-equivalent atom mappings used in the RMSD 
+    calculations of the RMSD_and_E_filter, so the H atoms are removed and the 
+    substructure matches are calculated only once per molecule
+
+    Parameters
+    ----------
+    outmols : list of rdkit.Chem.Mol or ConformerEnsemble
+        Mol objects of the conformers
+    cids : list
+        Conformers used in the filter
+    calc_type : str
+        'rdkit' (all the conformers are stored in each mol object) or 'summ', 
+        'xtb' and 'ani' (one conformer per mol object)
+    heavy : bool
+        If True it will ignore the H atoms when computing the RMSD
+    max_matches_rmsd : int
+        Max number of matches found in a SubstructMatch()
+
+    Returns
+    -------
+    coords, matches
+        Dictionary with the centered coordinates of each conformer (as 
+        np.float64 arrays) and array with the atom mappings. If the conformers 
+        don't share the same atoms, (None, None) is returned
+    """
+
+    # conformers stored in a ConformerEnsemble share the same topology
+    is_ensemble = isinstance(outmols, ConformerEnsemble)
+    if is_ensemble:
+        ref_mol = outmols.mol
+    else:
+        ref_mol = outmols[cids[0]]
+        atomic_nums = [atom.GetAtomicNum() for atom in ref_mol.GetAtoms()]
+        for cid in cids[1:]:
+            if [atom.GetAtomicNum() for atom in outmols[cid].GetAtoms()] != atomic_nums:
+                return None, None
+
+    # keep track of the atoms that are not removed with RemoveHs
+    rms_mol = Chem.Mol(ref_mol)
+    for atom in rms_mol.GetAtoms():
+        atom.SetIntProp("rms_idx", atom.GetIdx())
+    if heavy:
+        rms_mol = Chem.RemoveHs(rms_mol)
+    atom_idx = [atom.GetIntProp("rms_idx") for atom in rms_mol.GetAtoms()]
+
+    rms_mol = Chem.RWMol(rms_mol)
+    symmetrize_terminal_atoms(rms_mol)
+    matches = rms_mol.GetSubstructMatches(
+        rms_mol, uniquify=False, useChirality=False, maxMatches=max_matches_rmsd
+    )
+    matches = np.array(matches, dtype=int)
+
+    coords = {}
+    for cid in cids:
+        if is_ensemble:
+            conf_coords = outmols.coords[cid]
+        elif calc_type == "rdkit":
+            conf_coords = outmols[cid].GetConformer(cid).GetPositions()
+        else:
+            conf_coords = outmols[cid].GetConformer().GetPositions()
+        conf_coords = np.array(conf_coords[atom_idx], dtype=np.float64)
+        coords[cid] = conf_coords - conf_coords.mean(axis=0)
+
+    return coords, matches
+
+
+def get_best_rms_batch(probe_coords, ref_coords, matches):
+    """
+    Calculates the best RMSD (considering all the atom mappings) between one 
+    conformer and a group of conformers, using the Kabsch algorithm with NumPy
+
+    Parameters
+    ----------
+    probe_coords : np.array
+        Centered coordinates of the probe conformer, shape (n_atoms, 3)
+    ref_coords : np.array
+        Centered coordinates of the reference conformers, shape (n_confs, n_atoms, 3)
+    matches : np.array
+        Symmetry-equivalent atom mappings, shape (n_matches, n_atoms)
+
+    Returns
+    -------
+    np.array
+        Best RMSD of the probe with each reference conformer
+    """
+
+    n_atoms = probe_coords.shape[0]
+    probe_norm = np.sum(probe_coords ** 2)
+    ref_norm = np.sum(ref_coords ** 2, axis=(1, 2))
+
+    best_msd = np.empty(len(ref_coords))
+    # the conformers are processed in chunks to limit the memory used
+    chunk = max(1, 2000000 // (len(matches) * n_atoms * 3))
+    for start in range(0, len(ref_coords), chunk):
+        # (n_confs, n_matches, n_atoms, 3) coordinates with the atom orders of each match
+        ref_matched = ref_coords[start:start + chunk][:, matches]
+        cov_matrix = np.einsum("ai,cmaj->cmij", probe_coords, ref_matched)
+        u, sigma, vt = np.linalg.svd(cov_matrix)
+        # avoids reflections
+        sign = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+        sigma[..., -1] *= sign
+        msd = (probe_norm + ref_norm[start:start + chunk, None] - 2 * sigma.sum(axis=-1)) / n_atoms
+        best_msd[start:start + chunk] = msd.min(axis=1)
+
+    return np.sqrt(np.clip(best_msd, 0, None))
@@ -84,7 +84,6 @@ NMR simulation
 ######################################################.
 
 import os
-import subprocess
 import glob
 import sys
 import time
@@ -98,9 +97,13 @@ from pathlib import Path
 import dbstep.Dbstep as db
 from aqme.utils import (
     load_variables,
-    read_xyz_charge_mult,
     mol_from_sdf_or_mol_or_mol2,
-    run_command,
+    conformer_reader,
+    read_xyz_frames,
+    xyz_charge_mult,
+    write_xyz_file,
+    pdb_mols,
+    JobSandbox,
     check_files
 )
 from aqme.qdescp_utils import (
@@ -113,8 +116,6 @@ from aqme.qdescp_utils import (
     read_fukui
 )
 
-from aqme.csearch.crest import xyzall_2_xyz
-
 
 class qdescp:
     """
@@ -286,81 +287,52 @@ class qdescp:
             name = os.path.basename(Path(file)).split('.')[0]
             ext = os.path.basename(Path(file)).split(".")[1]
             self.args.log.write(f"\n\n   ----- {name} -----")
-            if ext.lower() in ["sdf", "xyz", "pdb"]:
-                if ext.lower() == "xyz":
-                    # separate the parent XYZ file into individual XYZ files
-                    xyzall_2_xyz(file, name)
-                    for conf_file in glob.glob(f"{name}_conf_*.xyz"):
-                        if self.args.charge is None:
-                            charge_xyz, _ = read_xyz_charge_mult(conf_file)
-                        else:
-                            charge_xyz = self.args.charge
-                        if self.args.mult is None:
-                            _, mult_xyz = read_xyz_charge_mult(conf_file)
-                        else:
-                            mult_xyz = self.args.mult
-                        xyz_files.append(
-                            os.path.dirname(os.path.abspath(file)) + "/" + conf_file
-                        )
-                        xyz_charges.append(charge_xyz)
-                        xyz_mults.append(mult_xyz)
-
-                elif ext.lower() == "pdb":
-                    command_pdb = [
-                        "obabel",
-                        "-ipdb",
-                        file,
-                        "-oxyz",
-                        f"-O{os.path.dirname(os.path.abspath(file))}/{name}_conf_.xyz",
-                        "-m",
-                    ]
-                    subprocess.run(
-                        command_pdb,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-
-                elif ext.lower() == "sdf":
-                    command_sdf = [
-                        "obabel",
-                        "-isdf",
-                        file,
-                        "-oxyz",
-                        f"-O{os.path.dirname(os.path.abspath(file))}/{name}_conf_.xyz",
-                        "-m",
-                    ]
-                    subprocess.run(
-                        command_sdf,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-
-            if ext.lower() in ["sdf", "pdb"]:
-                if self.args.charge is None:
-                    _, charges, _, _ = mol_from_sdf_or_mol_or_mol2(file, "csearch", self.args)
+            # the conformers are written as individual XYZ files (without using Open Babel)
+            conf_path = f"{os.path.dirname(os.path.abspath(file))}/{name}_conf_"
+            if ext.lower() == "xyz":
+                # separate the parent XYZ file into individual XYZ files
+                for i, (symbols, coords, title) in enumerate(read_xyz_frames(file)):
+                    charge_xyz, mult_xyz = xyz_charge_mult([title])
+                    if self.args.charge is not None:
+                        charge_xyz = self.args.charge
+                    if self.args.mult is not None:
+                        mult_xyz = self.args.mult
+                    xyz_files.append(write_xyz_file(f"{conf_path}{i+1}.xyz", symbols, coords, title))
+                    xyz_charges.append(charge_xyz)
+                    xyz_mults.append(mult_xyz)
+
+            elif ext.lower() in ["sdf", "pdb"]:
+                if ext.lower() == "sdf":
+                    mols = conformer_reader(file, removeHs=False, sanitize=False)
+                    if self.args.charge is None or self.args.mult is None:
+                        _, charges, mults, _ = mol_from_sdf_or_mol_or_mol2(file, "csearch", self.args)
                 else:
-                    charges = [self.args.charge] * len(
-                        glob.glob(
-                            f"{os.path.dirname(os.path.abspath(file))}/{name}_conf_*.xyz"
-                        )
-                    )
-                if self.args.mult is None:
-                    _, _, mults, _ = mol_from_sdf_or_mol_or_mol2(file, "csearch", self.args)
-                else:
-                    mults = [self.args.mult] * len(
-                        glob.glob(
-                            f"{os.path.dirname(os.path.abspath(file))}/{name}_conf_*.xyz"
-                        )
-                    )
-
-                for count, f in enumerate(
-                    glob.glob(
-                        f"{os.path.dirname(os.path.abspath(file))}/{name}_conf_*.xyz"
-                    )
-                ):
-                    xyz_files.append(f)
-                    xyz_charges.append(charges[count])
-                    xyz_mults.append(mults[count])
+                    mols = pdb_mols(file)
+                    charges = [Chem.GetFormalCharge(mol) for mol in mols]
+                    # the H atoms of the PDB file are explicit, so the radical electrons
+                    # are perceived from the valences of the atoms
+                    mults = []
+                    for mol in mols:
+                        for atom in mol.GetAtoms():
+                            atom.SetNoImplicit(True)
+                        mol.UpdatePropertyCache(strict=False)
+                        Chem.AssignRadicals(mol)
+                        NumRadicalElectrons = 0
+                        for atom in mol.GetAtoms():
+                            NumRadicalElectrons += atom.GetNumRadicalElectrons()
+                        TotalElectronicSpin = NumRadicalElectrons / 2
+                        mults.append(int((2 * TotalElectronicSpin) + 1))
+                if self.args.charge is not None:
+                    charges = [self.args.charge] * len(mols)
+                if self.args.mult is not None:
+                    mults = [self.args.mult] * len(mols)
+
+                for i, mol in enumerate(mols):
+                    xyz_file = f"{conf_path}{i+1}.xyz"
+                    Chem.MolToXYZFile(mol, xyz_file)
+                    xyz_files.append(xyz_file)
+                    xyz_charges.append(charges[i])
+                    xyz_mults.append(mults[i])
 
             for xyz_file, charge, mult in zip(xyz_files, xyz_charges, xyz_mults):
                 name_xtb = os.path.basename(Path(xyz_file)).split(".")[0]
@@ -403,132 +375,129 @@ class qdescp:
         self.xtb_fukui = str(dat_dir) + "/{0}.fukui".format(name)
         self.xtb_fod = str(dat_dir) + "/{0}.fod".format(name)
 
-        # initial xTB optimization
-        if self.args.xtb_opt:
-            os.chdir(dat_dir)
-            command_opt = [
+        # the xTB jobs run in a temporary folder and only the output files used
+        # to collect the properties are kept
+        with JobSandbox(dat_dir) as sandbox:
+            # initial xTB optimization
+            if self.args.xtb_opt:
+                command_opt = [
+                    "xtb",
+                    self.xtb_xyz,
+                    "--opt",
+                    "--acc",
+                    str(self.args.qdescp_acc),
+                    "--gfn",
+                    "2",
+                    "--chrg",
+                    str(charge),
+                    "--uhf",
+                    str(int(mult) - 1),
+                    "-P",
+                    str(self.args.nprocs),
+                ]
+                if self.args.qdescp_solvent is not None:
+                    command_opt.append("--alpb")
+                    command_opt.append(f"{self.args.qdescp_solvent}")
+                sandbox.run(command_opt, self.xtb_opt)
+
+                # replaces RDKit geometries with xTB geometries
+                os.remove(self.xtb_xyz)
+                sandbox.collect(["xtbopt.xyz", "xtblast.xyz"], self.xtb_xyz)
+
+            command1 = [
+                "xtb",
+                self.xtb_xyz,
+                "--pop",
+                "--wbo",
+                "--acc",
+                str(self.args.qdescp_acc),
+                "--gfn",
+                "2",
+                "--chrg",
+                str(charge),
+                "--uhf",
+                str(int(mult) - 1),
+                "--etemp",
+                str(self.args.qdescp_temp),
+                "--input",
+                str(self.inp),
+                "-P",
+                str(self.args.nprocs),
+            ]
+            if self.args.qdescp_solvent is not None:
+                command1.append("--alpb")
+                command1.append(f"{self.args.qdescp_solvent}")
+            sandbox.run(command1, self.xtb_out)
+
+            sandbox.collect("xtbout.json", self.xtb_json)
+            sandbox.collect("wbo", self.xtb_wbo)
+
+            command2 = [
+                "xtb",
+                self.xtb_xyz,
+                "--pop",
+                "--gfn",
+                "1",
+                "--chrg",
+                str(charge),
+                "--acc",
+                str(self.args.qdescp_acc),
+                "--uhf",
+                str(int(mult) - 1),
+                "--etemp",
+                str(self.args.qdescp_temp),
+                "-P",
+                str(self.args.nprocs),
+            ]
+            if self.args.qdescp_solvent is not None:
+                command2.append("--alpb")
+                command2.append(f"{self.args.qdescp_solvent}")
+            sandbox.run(command2, self.xtb_gfn1)
+
+            command3 = [
                 "xtb",
                 self.xtb_xyz,
-                "--opt",
+                "--vfukui",
+                "--gfn",
+                "2",
+                "--chrg",
+                str(charge),
                 "--acc",
                 str(self.args.qdescp_acc),
+                "--uhf",
+                str(int(mult) - 1),
+                "--etemp",
+                str(self.args.qdescp_temp),
+                "-P",
+                str(self.args.nprocs),
+            ]
+            if self.args.qdescp_solvent is not None:
+                command3.append("--alpb")
+                command3.append(f"{self.args.qdescp_solvent}")
+            sandbox.run(command3, self.xtb_fukui)
+
+            command4 = [
+                "xtb",
+                self.xtb_xyz,
+                "--fod",
                 "--gfn",
                 "2",
                 "--chrg",
                 str(charge),
+                "--acc",
+                str(self.args.qdescp_acc),
                 "--uhf",
                 str(int(mult) - 1),
+                "--etemp",
+                str(self.args.qdescp_temp),
                 "-P",
                 str(self.args.nprocs),
             ]
             if self.args.qdescp_solvent is not None:
-                command_opt.append("--alpb")
-                command_opt.append(f"{self.args.qdescp_solvent}")
-            run_command(command_opt, self.xtb_opt)
-
-            # replaces RDKit geometries with xTB geometries
-            os.remove(self.xtb_xyz)
-            try:
-                os.rename(str(dat_dir) + "/xtbopt.xyz", self.xtb_xyz)
-            except FileNotFoundError:
-                os.rename(str(dat_dir) + "/xtblast.xyz", self.xtb_xyz)
-
-        os.chdir(dat_dir)
-        command1 = [
-            "xtb",
-            self.xtb_xyz,
-            "--pop",
-            "--wbo",
-            "--acc",
-            str(self.args.qdescp_acc),
-            "--gfn",
-            "2",
-            "--chrg",
-            str(charge),
-            "--uhf",
-            str(int(mult) - 1),
-            "--etemp",
-            str(self.args.qdescp_temp),
-            "--input",
-            str(self.inp),
-            "-P",
-            str(self.args.nprocs),
-        ]
-        if self.args.qdescp_solvent is not None:
-            command1.append("--alpb")
-            command1.append(f"{self.args.qdescp_solvent}")
-        run_command(command1, self.xtb_out)
-
-        os.rename("xtbout.json", self.xtb_json)
-        os.rename("wbo", self.xtb_wbo)
-
-        command2 = [
-            "xtb",
-            self.xtb_xyz,
-            "--pop",
-            "--gfn",
-            "1",
-            "--chrg",
-            str(charge),
-            "--acc",
-            str(self.args.qdescp_acc),
-            "--uhf",
-            str(int(mult) - 1),
-            "--etemp",
-            str(self.args.qdescp_temp),
-            "-P",
-            str(self.args.nprocs),
-        ]
-        if self.args.qdescp_solvent is not None:
-            command2.append("--alpb")
-            command2.append(f"{self.args.qdescp_solvent}")
-        run_command(command2, self.xtb_gfn1)
-
-        command3 = [
-            "xtb",
-            self.xtb_xyz,
-            "--vfukui",
-            "--gfn",
-            "2",
-            "--chrg",
-            str(charge),
-            "--acc",
-            str(self.args.qdescp_acc),
-            "--uhf",
-            str(int(mult) - 1),
-            "--etemp",
-            str(self.args.qdescp_temp),
-            "-P",
-            str(self.args.nprocs),
-        ]
-        if self.args.qdescp_solvent is not None:
-            command3.append("--alpb")
-            command3.append(f"{self.args.qdescp_solvent}")
-        run_command(command3, self.xtb_fukui)
-
-        command4 = [
-            "xtb",
-            self.xtb_xyz,
-            "--fod",
-            "--gfn",
-            "2",
-            "--chrg",
-            str(charge),
-            "--acc",
-            str(self.args.qdescp_acc),
-            "--uhf",
-            str(int(mult) - 1),
-            "--etemp",
-            str(self.args.qdescp_temp),
-            "-P",
-            str(self.args.nprocs),
-        ]
-        if self.args.qdescp_solvent is not None:
-            command4.append("--alpb")
-            command4.append(f"{self.args.qdescp_solvent}")
-        run_command(command4, self.xtb_fod)
-
-        os.chdir(self.args.initial_dir)
+                command4.append("--alpb")
+                command4.append(f"{self.args.qdescp_solvent}")
+            sandbox.run(command4, self.xtb_fod)
+
 
     def collect_xtb_properties(self,name_initial,atom_props,update_atom_props):
         """
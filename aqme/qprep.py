@@ -3,8 +3,8 @@ Parameters
 ----------
    files : mol object, str or list of str, default=None
       This module prepares input QM file(s). Formats accepted: mol object(s), 
-      Gaussian or ORCA LOG/OUT output files, JSON, XYZ, SDF, PDB. Also, 
-      lists can be used (i.e. [FILE1.log, FILE2.log] or \*.FORMAT such as \*.json).
+      Gaussian or ORCA LOG/OUT output files, JSON, XYZ, SDF, AQMZ (conformer 
+      archives from CSEARCH/CMIN), PDB. Also, lists can be used (i.e. [FILE1.log, FILE2.log] or \*.FORMAT such as \*.json).
    atom_types : list of str, default=[]
       (If files is None) List containing the atoms of the system
    cartesians : list of str, default=[]
@@ -57,9 +57,7 @@ Parameters
 ######################################################.
 
 import os
-import subprocess
 import sys
-import glob
 import time
 import json
 from aqme.utils import (
@@ -68,12 +66,13 @@ from aqme.utils import (
     read_file,
     move_file,
     load_variables,
-    read_xyz_charge_mult,
     mol_from_sdf_or_mol_or_mol2,
+    select_low_energy,
+    xyz_mols,
+    pdb_mols,
     add_prefix_suffix,
     check_files
 )
-from aqme.csearch.crest import xyzall_2_xyz
 from pathlib import Path
 
 
@@ -92,8 +91,8 @@ class qprep:
         _ = check_files(self,'qprep')
 
         file_format = os.path.basename(Path(self.args.files[0])).split('.')[1]
-        if file_format.lower() not in ['sdf', 'xyz', 'pdb', 'log', 'out', 'json']:
-            self.args.log.write(f"\nx  The format used ({file_format}) is not compatible with QPREP! Formats accepted: sdf, xyz, pdb, log, out, json")
+        if file_format.lower() not in ['sdf', 'aqmz', 'xyz', 'pdb', 'log', 'out', 'json']:
+            self.args.log.write(f"\nx  The format used ({file_format}) is not compatible with QPREP! Formats accepted: sdf, aqmz, xyz, pdb, log, out, json")
             self.args.log.finalize()
             sys.exit()
 
@@ -133,64 +132,30 @@ class qprep:
         # write input files
         for file in self.args.files:
             name = os.path.basename(Path(file)).split(".")[0]
-            if file_format.lower() in ["sdf", "xyz", "pdb"]:
-                sdf_files = []
+            if file_format.lower() in ["sdf", "aqmz", "xyz", "pdb"]:
+                # XYZ and PDB files are converted into mol objects in memory
                 if file_format.lower() == "xyz":
-                    # separate the parent XYZ file into individual XYZ files
-                    xyzall_2_xyz(file, f"{self.args.w_dir_main}/{name}")
-                    for conf_file in glob.glob(
-                        f"{self.args.w_dir_main}/{name}_conf_*.xyz"
-                    ):
-                        if self.args.charge is None:
-                            charge_xyz, _ = read_xyz_charge_mult(conf_file)
-                        else:
-                            charge_xyz = self.args.charge
-                        if self.args.mult is None:
-                            _, mult_xyz = read_xyz_charge_mult(conf_file)
-                        else:
-                            mult_xyz = self.args.mult
-                        # generate SDF files from XYZ with Openbabel
-                        command_xyz = [
-                            "obabel",
-                            "-ixyz",
-                            conf_file,
-                            "-osdf",
-                            f"-O{conf_file.split('.xyz')[0]}.sdf",
-                            "--property",
-                            f"Real charge={str(charge_xyz)}",
-                            ";",
-                            f"Mult={str(mult_xyz)}",
-                        ]
-                        subprocess.run(
-                            command_xyz,
-                            stdout=subprocess.DEVNULL,
-                            stderr=subprocess.DEVNULL,
-                        )
-                        sdf_files.append(f"{conf_file.split('.xyz')[0]}.sdf")
-                        # delete individual XYZ files
-                        os.remove(conf_file)
+                    # each conformer of the parent XYZ file is used as an individual input
+                    mol_inputs = []
+                    for i, mol in enumerate(xyz_mols(file)):
+                        if self.args.charge is not None:
+                            mol.SetProp("Real charge", str(self.args.charge))
+                        if self.args.mult is not None:
+                            mol.SetProp("Mult", str(self.args.mult))
+                        mol_inputs.append((f"{name}_conf_{i+1}", [mol]))
 
                 elif file_format.lower() == "pdb":
-                    command_pdb = [
-                        "obabel",
-                        "-ipdb",
-                        f"{file}",
-                        "-osdf",
-                        f"-O{file.split('.pdb')[0]}.sdf",
-                    ]
-                    subprocess.run(
-                        command_pdb,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-                    sdf_files.append(f"{file.split('.pdb')[0]}.sdf")
+                    mol_inputs = [(name, select_low_energy(pdb_mols(file), self.get_low_check()))]
 
                 else:
-                    sdf_files.append(file)
+                    mol_inputs = [(name, None)]
 
-                for sdf_file in sdf_files:
+                for mol_name, mols in mol_inputs:
                     try:
-                        self.sdf_2_com(sdf_file, destination, file_format)
+                        if mols is None:
+                            self.sdf_2_com(file, destination, file_format)
+                        else:
+                            self.mols_2_com(mols, mol_name, destination, file_format)
 
                     except OSError:
                         self.args.log.write(f"x  {name} couldn't be processed!")
@@ -199,10 +164,6 @@ class qprep:
                     if create_dat:
                         self.args.log.write(f"o  {name} successfully processed at {destination}")
 
-                    if file_format.lower() in ["xyz", "pdb"]:
-                        # delete SDF files when the input was an XYZ/PDB file
-                        os.remove(sdf_file)
-
             # for Gaussian output files (LOG/OUT), JSON files and MOL objects
             else:
                 atom_types, cartesians, charge, mult, found_coords = self.qprep_coords(
@@ -230,9 +191,11 @@ class qprep:
             self.args.log.write(f"\nTime QPREP: {elapsed_time} seconds\n")
             self.args.log.finalize()
 
-    def sdf_2_com(self, sdf_file, destination, file_format):
-        sdf_name = os.path.basename(Path(sdf_file)).split(".")[0]
-        # get atom types, atomic coordinates, charge and multiplicity of all the mols in the SDF file
+    def get_low_check(self):
+        """
+        Returns the criteria used to select the conformers from the SDF files 
+        (lowest_only, lowest_n and e_threshold_qprep options)
+        """
 
         low_check = None
         if self.args.lowest_only == True:
@@ -241,7 +204,18 @@ class qprep:
             low_check=int(self.args.lowest_n)
         if self.args.e_threshold_qprep is not None:
             low_check=float(self.args.e_threshold_qprep)
-        mols = mol_from_sdf_or_mol_or_mol2(sdf_file, "qprep", self.args, low_check=low_check)
+        return low_check
+
+    def sdf_2_com(self, sdf_file, destination, file_format):
+        sdf_name = os.path.basename(Path(sdf_file)).split(".")[0]
+        # get atom types, atomic coordinates, charge and multiplicity of all the mols in the SDF file
+        mols = mol_from_sdf_or_mol_or_mol2(sdf_file, "qprep", self.args, low_check=self.get_low_check())
+        self.mols_2_com(mols, sdf_name, destination, file_format)
+
+    def mols_2_com(self, mols, sdf_name, destination, file_format):
+        """
+        Writes the input files of a list of mol objects
+        """
 
         for i, mol in enumerate(mols):
             (
@@ -250,7 +224,7 @@ class qprep:
                 charge,
                 mult,
                 _,
-            ) = self.qprep_coords(sdf_file, mol, file_format)
+            ) = self.qprep_coords(sdf_name, mol, file_format)
 
             if "_conf_" not in sdf_name:
                 name_conf = f"{sdf_name}_conf_{i+1}"
@@ -9,13 +9,22 @@ import sys
 import time
 import getopt
 import glob
+import shutil
+import tempfile
 import yaml
 import ast
+import json
+import struct
+import zlib
+import numpy as np
 from pathlib import Path
 from rdkit.Chem.rdMolAlign import GetBestRMS
 from rdkit.Chem.rdmolops import RemoveHs
 from rdkit.Chem import Mol
 from rdkit.Chem import AllChem as Chem
+from rdkit.Chem import PropertyMol
+from rdkit.Chem import rdDetermineBonds
+from rdkit.Geometry import Point3D
 from aqme.argument_parser import set_options, var_dict
 from rdkit import RDLogger
 
@@ -23,6 +32,11 @@ GAS_CONSTANT = 8.3144621  # J / K / mol
 J_TO_AU = 4.184 * 627.509541 * 1000.0  # UNIT CONVERSION
 T = 298.15
 
+# conformer archives (alternative to SDF files, used with output='.aqmz')
+CONF_ARCHIVE_EXT = ".aqmz"
+CONF_ARCHIVE_MAGIC = b"AQMECONF"
+CONF_ARCHIVE_VERSION = 1
+
 aqme_version = "1.5.2"
 time_run = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
 aqme_ref = f"AQME v {aqme_version}, Alegre-Requena, J. V.; Sowndarya, S.; Perez-Soto, R.; Alturaifi, T.; Paton, R. AQME: Automated Quantum Mechanical Environments for Researchers and Educators. Wiley Interdiscip. Rev. Comput. Mol. Sci. 2023, DOI: 10.1002/wcms.1663."
@@ -30,14 +44,88 @@ aqme_ref = f"AQME v {aqme_version}, Alegre-Requena, J. V.; Sowndarya, S.; Perez-
 RDLogger.DisableLog("rdApp.*")
 
 
-def run_command(command, outfile):
+class JobSandbox:
     """
-    Runs the subprocess command and saves the results in an output file (not shown in the terminal)
+    Private temporary folder used to run external programs (i.e. xTB and CREST). 
+    The commands run inside the folder through the cwd of subprocess and with 
+    their own environment variables, so the working directory and os.environ 
+    of the Python process are never modified and different jobs can run at the 
+    same time (i.e. in threads). Only the declared output files are collected 
+    with collect(), and the folder (with the rest of files) is removed at the end.
+
+    Parameters
+    ----------
+    parent_dir : str or Path, default=None
+        Folder where the temporary folder is created (the system temporary 
+        folder is used if None)
+    env : dict, default=None
+        Environment variables of the job (i.e. {'OMP_NUM_THREADS': 4}), added 
+        to the environment of the Python process
+    inputs : list, default=None
+        Files copied into the temporary folder before running the commands
+
+    Example
+    -------
+    >>> with JobSandbox(dat_dir, env={'OMP_NUM_THREADS': 2}) as sandbox:
+    ...     sandbox.run(['xtb', xyz_file, '--opt'], 'xtb.out')
+    ...     sandbox.collect(['xtbopt.xyz', 'xtblast.xyz'], 'opt.xyz')
     """
 
-    output = open(outfile, "w")
-    subprocess.run(command, stdout=output, stderr=subprocess.DEVNULL)
-    output.close()
+    def __init__(self, parent_dir=None, env=None, inputs=None):
+        self.parent_dir = parent_dir
+        self.env = dict(os.environ)
+        if env is not None:
+            self.env.update({key: str(value) for key, value in env.items()})
+        self.inputs = inputs if inputs is not None else []
+        self.path = None
+
+    def __enter__(self):
+        if self.parent_dir is not None:
+            Path(self.parent_dir).mkdir(exist_ok=True, parents=True)
+        self.path = Path(tempfile.mkdtemp(prefix="aqme_", dir=self.parent_dir))
+        for file in self.inputs:
+            shutil.copy(file, self.path)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def file(self, name):
+        """
+        Returns the path of a file inside the temporary folder
+        """
+        return self.path / name
+
+    def run(self, command, outfile=None, env=None):
+        """
+        Runs the subprocess command inside the temporary folder and saves the 
+        results in an output file (the results are discarded if outfile is None). 
+        The variables of env are only used in this command.
+        """
+
+        job_env = self.env
+        if env is not None:
+            job_env = dict(self.env)
+            job_env.update({key: str(value) for key, value in env.items()})
+        if outfile is None:
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=self.path, env=job_env)
+        else:
+            with open(outfile, "w") as output:
+                subprocess.run(command, stdout=output, stderr=subprocess.DEVNULL, cwd=self.path, env=job_env)
+
+    def collect(self, names, destination):
+        """
+        Moves the first file of names (str or list) found in the temporary folder 
+        to destination. Returns the destination, or None if no file was found.
+        """
+
+        if isinstance(names, str):
+            names = [names]
+        for name in names:
+            if self.file(name).exists():
+                shutil.move(str(self.file(name)), str(destination))
+                return destination
+        return None
 
 
 def periodic_table():
@@ -125,6 +213,463 @@ class Logger:
             pass
 
 
+class JobLogger:
+    """
+    Class that stores the messages of jobs that run in separate processes, 
+    since the file object of Logger can't be shared between processes. The 
+    messages are written into the main Logger once the job finishes.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def write(self, message):
+        """
+        Stores the message to write it later in the main log file.
+
+        Parameters
+        ----------
+        message : str
+           Text to be written in the log file.
+        """
+        self.messages.append(message)
+
+    def finalize(self):
+        """
+        Nothing to close, the main Logger is closed in the parent process
+        """
+        pass
+
+
+def new_conformer(coords):
+    """
+    Creates a 3D RDKit conformer from an (n_atoms, 3) array of coordinates
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    conformer = Chem.Conformer(len(coords))
+    try:
+        conformer.SetPositions(coords)
+    except AttributeError:
+        # older RDKit versions
+        for atom_idx, (x, y, z) in enumerate(coords):
+            conformer.SetAtomPosition(atom_idx, Point3D(x, y, z))
+    conformer.Set3D(True)
+    return conformer
+
+
+class ConformerEnsemble:
+    """
+    Compact storage for the conformers of a single molecule. Instead of one mol 
+    object per conformer, it keeps one mol object with the topology (without 
+    conformers), the coordinates of all the conformers in a (n_confs, n_atoms, 3) 
+    array, their energies and the properties written in the SDF files.
+
+    Mol objects of individual conformers are created only when they are requested 
+    (ensemble[idx]), and they contain a single conformer whose ID is idx, so they 
+    can be used as the multi-conformer mol objects used previously 
+    (i.e. ensemble[idx].GetConformer(idx)).
+    """
+
+    def __init__(self, mol, coords=None, energies=None):
+        self.mol = Mol(mol)
+        self.mol.RemoveAllConformers()
+        n_atoms = self.mol.GetNumAtoms()
+        if coords is None:
+            coords = np.empty((0, n_atoms, 3))
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, n_atoms, 3)
+        if energies is None:
+            energies = np.full(len(self.coords), np.nan)
+        self.energies = np.asarray(energies, dtype=np.float64)
+        self.props = {}
+
+    @classmethod
+    def from_mol(cls, mol, conf_ids, energies=None):
+        """
+        Creates the ensemble from conformers of a multi-conformer mol object.
+
+        Parameters
+        ----------
+        mol : rdkit.Chem.Mol
+           Mol object with the conformers
+        conf_ids : list
+           IDs of the conformers included in the ensemble (in this order)
+        energies : list, default=None
+           Energies of the conformers
+        """
+        coords = [mol.GetConformer(conf_id).GetPositions() for conf_id in conf_ids]
+        if len(coords) == 0:
+            coords = None
+        return cls(mol, coords, energies)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, idx):
+        return self.get_mol(idx)
+
+    def set_prop(self, prop, values):
+        """
+        Sets a property for all the conformers (one value per conformer).
+        """
+        self.props[prop] = [str(value) for value in values]
+
+    def get_mol(self, idx):
+        """
+        Returns a mol object with conformer idx (the ID of the conformer is idx) 
+        and its properties.
+        """
+        mol = PropertyMol.PropertyMol(self.mol)
+        conformer = new_conformer(self.coords[idx])
+        conformer.SetId(idx)
+        mol.AddConformer(conformer, assignId=False)
+        for prop, values in self.props.items():
+            mol.SetProp(prop, values[idx])
+        return mol
+
+
+class ConformerArchiveWriter:
+    """
+    Writes conformers into a compressed binary conformer archive (.aqmz), an
+    alternative to SDF files with the same write(mol, confId)/close() methods
+    as Chem.SDWriter.
+
+    Consecutive conformers with the same topology are stored together in
+    zlib-compressed blocks that contain the RDKit binary of the topology, the
+    coordinates (float32), the energies and the properties of the SDF files
+    (_Name, Energy, Real charge, Mult, SMILES, etc.). The offsets of the blocks
+    are stored in an index at the end of the file, so any conformer can be read
+    without parsing the rest of the file (see ConformerArchive).
+    """
+
+    max_block_confs = 500
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        # the file is created empty, as Chem.SDWriter does
+        self.file = open(self.filename, "wb")
+        self.index = []
+        self.topology = None
+        self.coords, self.energies, self.props = [], [], []
+
+    def write(self, mol, confId=-1):
+        """
+        Adds a conformer of the mol object to the archive.
+
+        Parameters
+        ----------
+        mol : rdkit.Chem.Mol
+           Mol object with the conformer
+        confId : int, default=-1
+           ID of the conformer written (-1 for the default conformer)
+        """
+        topology_mol = Mol(mol)
+        topology_mol.RemoveAllConformers()
+        topology = topology_mol.ToBinary(
+            Chem.PropertyPickleOptions.AtomProps | Chem.PropertyPickleOptions.BondProps
+        )
+        if topology != self.topology or len(self.coords) == self.max_block_confs:
+            self.write_block()
+            self.topology = topology
+
+        props = {"_Name": mol.GetProp("_Name") if mol.HasProp("_Name") else ""}
+        for prop in mol.GetPropNames():
+            props[prop] = mol.GetProp(prop)
+        try:
+            energy = float(props["Energy"])
+        except (KeyError, ValueError):
+            energy = np.nan
+
+        self.coords.append(mol.GetConformer(confId).GetPositions())
+        self.energies.append(energy)
+        self.props.append(props)
+
+    def write_block(self):
+        """
+        Compresses the conformers stored and writes them as a new block.
+        """
+        if len(self.coords) == 0:
+            return
+        if len(self.index) == 0:
+            self.file.write(struct.pack("<8sI", CONF_ARCHIVE_MAGIC, CONF_ARCHIVE_VERSION))
+
+        coords = np.asarray(self.coords, dtype="<f4")
+        payload = b"".join([
+            struct.pack("<III", len(self.topology), coords.shape[0], coords.shape[1]),
+            self.topology,
+            coords.tobytes(),
+            np.asarray(self.energies, dtype="<f8").tobytes(),
+            json.dumps(self.props).encode(),
+        ])
+        block = zlib.compress(payload)
+        self.index.append([self.file.tell(), len(block), coords.shape[0]])
+        self.file.write(block)
+        self.coords, self.energies, self.props = [], [], []
+
+    def close(self):
+        """
+        Writes the remaining conformers and the index of blocks, and closes the file
+        """
+        if self.file.closed:
+            return
+        self.write_block()
+        # archives without conformers are left empty (like SDF files)
+        if len(self.index) > 0:
+            index_offset = self.file.tell()
+            self.file.write(json.dumps(self.index).encode())
+            self.file.write(struct.pack("<Q8s", index_offset, CONF_ARCHIVE_MAGIC))
+        self.file.close()
+
+    def __del__(self):
+        # files are also completed when the writer is garbage collected, as in Chem.SDWriter
+        try:
+            self.close()
+        except AttributeError:
+            pass
+
+
+class ConformerArchive:
+    """
+    Reads the conformers of a compressed binary conformer archive (.aqmz). It
+    can be used as a Chem.SDMolSupplier (len(), iteration and random access with
+    archive[idx]), and the mol objects returned contain a single conformer and
+    the properties stored (as strings, like in SDF files).
+    """
+
+    def __init__(self, filename, removeHs=False, sanitize=True):
+        self.filename = str(filename)
+        self.removeHs = removeHs
+        self.sanitize = sanitize
+        with open(self.filename, "rb") as F:
+            magic, version = struct.unpack("<8sI", F.read(12))
+            if magic != CONF_ARCHIVE_MAGIC or version > CONF_ARCHIVE_VERSION:
+                raise OSError(f"{self.filename} is not a valid conformer archive")
+            F.seek(-16, os.SEEK_END)
+            index_offset, _ = struct.unpack("<Q8s", F.read(16))
+            F.seek(index_offset)
+            self.index = json.loads(F.read()[:-16])
+        self.block_starts = np.cumsum([0] + [n_confs for _, _, n_confs in self.index])
+        self.block_idx, self.block = None, None
+
+    def __len__(self):
+        return int(self.block_starts[-1])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        return self.get_mol(idx)
+
+    def get_mol(self, idx):
+        """
+        Returns a mol object with conformer idx and its properties.
+        """
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("conformer index out of range")
+        block_idx = int(np.searchsorted(self.block_starts, idx, side="right")) - 1
+        topology, coords, _, props = self.read_block(block_idx)
+        conf_idx = idx - int(self.block_starts[block_idx])
+
+        mol = Mol(topology)
+        conformer = new_conformer(coords[conf_idx])
+        mol.AddConformer(conformer, assignId=True)
+        for prop, value in props[conf_idx].items():
+            mol.SetProp(prop, value)
+        if self.sanitize:
+            try:
+                Chem.SanitizeMol(mol)
+            except ValueError:
+                return None
+        if self.removeHs:
+            mol = Chem.RemoveHs(mol, sanitize=self.sanitize)
+        return mol
+
+    @property
+    def energies(self):
+        """
+        Energies of all the conformers (without creating the mol objects)
+        """
+        energies = [self.read_block(block_idx)[2] for block_idx in range(len(self.index))]
+        if len(energies) == 0:
+            return np.empty(0)
+        return np.concatenate(energies)
+
+    def read_block(self, block_idx):
+        """
+        Reads and decompresses a block (the last block read is kept in memory)
+        """
+        if block_idx != self.block_idx:
+            offset, length, _ = self.index[block_idx]
+            with open(self.filename, "rb") as F:
+                F.seek(offset)
+                payload = zlib.decompress(F.read(length))
+            topology_size, n_confs, n_atoms = struct.unpack_from("<III", payload)
+            start = struct.calcsize("<III")
+            topology = payload[start : start + topology_size]
+            start += topology_size
+            coords = np.frombuffer(payload, dtype="<f4", count=n_confs * n_atoms * 3, offset=start)
+            start += coords.nbytes
+            energies = np.frombuffer(payload, dtype="<f8", count=n_confs, offset=start)
+            start += energies.nbytes
+            props = json.loads(payload[start:])
+            self.block = (topology, coords.reshape(n_confs, n_atoms, 3), energies, props)
+            self.block_idx = block_idx
+        return self.block
+
+
+def is_conf_archive(filename):
+    """
+    Checks whether a file is a conformer archive (from its first bytes, so it
+    doesn't depend on the file extension)
+    """
+    try:
+        with open(filename, "rb") as F:
+            return F.read(len(CONF_ARCHIVE_MAGIC)) == CONF_ARCHIVE_MAGIC
+    except OSError:
+        return False
+
+
+def conformer_writer(filename):
+    """
+    Returns a writer for the conformers, a ConformerArchiveWriter for .aqmz files
+    and a Chem.SDWriter otherwise
+    """
+    if str(filename).lower().endswith(CONF_ARCHIVE_EXT):
+        return ConformerArchiveWriter(filename)
+    return Chem.SDWriter(str(filename))
+
+
+def conformer_reader(filename, removeHs=False, sanitize=True):
+    """
+    Returns a reader for the conformers, a ConformerArchive for conformer
+    archives and a Chem.SDMolSupplier otherwise
+    """
+    if is_conf_archive(filename):
+        return ConformerArchive(filename, removeHs=removeHs, sanitize=sanitize)
+    return Chem.SDMolSupplier(str(filename), removeHs=removeHs, sanitize=sanitize)
+
+
+def read_xyz_frames(file):
+    """
+    Generator with the frames of a (multi-frame) XYZ file, i.e. the conformer 
+    ensembles of CREST, which are read in one pass.
+
+    Parameters
+    ----------
+    file : str or pathlib.Path
+        XYZ file with one or more frames
+
+    Yields
+    ------
+    symbols : list
+        Element symbols of the atoms
+    coords : numpy.ndarray
+        (n_atoms, 3) array with the coordinates of the frame
+    comment : str
+        Title line of the frame (i.e. the energy in CREST ensembles)
+    """
+
+    with open(file, "r") as F:
+        for line in F:
+            if line.strip() == "":
+                continue
+            n_atoms = int(line.split()[0])
+            comment = F.readline().strip()
+            symbols = []
+            coords = np.empty((n_atoms, 3))
+            for atom_idx in range(n_atoms):
+                fields = F.readline().split()
+                symbols.append(fields[0].capitalize())
+                coords[atom_idx] = [float(x) for x in fields[1:4]]
+            yield symbols, coords, comment
+
+
+def xyz_frame_mol(symbols, coords, mol=None, charge=0, bond_orders=True):
+    """
+    Creates a mol object from the atoms and coordinates of an XYZ frame. If mol 
+    contains the same atoms in the same order, the coordinates are attached to 
+    its topology (bonds, charges, etc.). Otherwise, the connectivity is 
+    perceived from the coordinates (and the bond orders if bond_orders=True).
+    """
+
+    if mol is not None and [atom.GetSymbol() for atom in mol.GetAtoms()] == list(symbols):
+        frame_mol = Chem.Mol(mol)
+        frame_mol.RemoveAllConformers()
+        frame_mol.AddConformer(new_conformer(coords), assignId=True)
+        return frame_mol
+
+    xyz_block = f"{len(symbols)}\n\n"
+    for symbol, (x, y, z) in zip(symbols, coords):
+        xyz_block += f"{symbol} {x:.6f} {y:.6f} {z:.6f}\n"
+    frame_mol = Chem.MolFromXYZBlock(xyz_block)
+    if bond_orders:
+        try:
+            rdDetermineBonds.DetermineBonds(frame_mol, charge=int(charge))
+            return frame_mol
+        except (ValueError, RuntimeError):
+            # bond orders can't be assigned in some systems (i.e. metal complexes)
+            frame_mol = Chem.MolFromXYZBlock(xyz_block)
+    rdDetermineBonds.DetermineConnectivity(frame_mol)
+    frame_mol.UpdatePropertyCache(strict=False)
+    return frame_mol
+
+
+def write_xyz_file(file, symbols, coords, title=""):
+    """
+    Writes an XYZ file with the atoms and coordinates of one frame
+    """
+
+    with open(file, "w") as F:
+        F.write(f"{len(symbols)}\n{title}\n")
+        for symbol, (x, y, z) in zip(symbols, coords):
+            F.write(f"{symbol:<2} {x:>12.6f} {y:>12.6f} {z:>12.6f}\n")
+    return file
+
+
+def xyz_mols(file):
+    """
+    Reads the frames of an XYZ file as mol objects (one per frame) with the 
+    connectivity perceived from the coordinates, without using Open Babel. 
+    The title line of each frame is stored as the name of the mol object, and 
+    the charge and multiplicity defined in the title (charge=X and mult=Y) 
+    as the Real charge and Mult properties.
+    """
+
+    mols = []
+    for symbols, coords, title in read_xyz_frames(file):
+        charge_xyz, mult_xyz = xyz_charge_mult([title])
+        mol = xyz_frame_mol(symbols, coords, charge=charge_xyz, bond_orders=False)
+        mol.SetProp("_Name", title)
+        mol.SetProp("Real charge", str(charge_xyz))
+        mol.SetProp("Mult", str(mult_xyz))
+        mols.append(mol)
+    return mols
+
+
+def pdb_mols(file):
+    """
+    Reads the models of a PDB file as mol objects (one per model) without 
+    using Open Babel
+    """
+
+    pdb_mol = Chem.MolFromPDBFile(str(file), removeHs=False, sanitize=False)
+    if pdb_mol is None:
+        return []
+    pdb_mol.UpdatePropertyCache(strict=False)
+    name = os.path.basename(Path(file)).split(".")[0]
+
+    mols = []
+    for conformer in pdb_mol.GetConformers():
+        mol = Mol(pdb_mol)
+        mol.RemoveAllConformers()
+        mol.AddConformer(Chem.Conformer(conformer), assignId=True)
+        mol.SetProp("_Name", name)
+        mols.append(mol)
+    return mols
+
+
 def move_file(destination, source, file):
     """
     Moves files from the source folder to the destination folder and creates
@@ -331,7 +876,9 @@ def command_line_args():
         "lowest_only",
         "chk",
         "nodup_check",
-        "robert"
+        "robert",
+        "resume",
+        "ani_jit"
     ]
     list_args = [
         "files",
@@ -352,11 +899,15 @@ def command_line_args():
         "opt_steps",
         "opt_steps_rdkit",
         "auto_sample",
+        "max_sample",
         "seed",
         "max_matches_rmsd",
         "max_workers",
+        "input_chunksize",
         "nsteps_fullmonte",
         "nrot_fullmonte",
+        "nwalkers_fullmonte",
+        "nproposals_fullmonte",
         "nprocs",
         "crest_nrun",
     ]
@@ -365,12 +916,17 @@ def command_line_args():
         "ewin_csearch",
         "opt_fmax",
         "degree",
+        "ewin_prune_summ",
+        "ewin_ani_prescreen",
+        "sample_convergence",
+        "ang_prefilter_fullmonte",
         "rms_threshold",
         "energy_threshold",
         "initial_energy_threshold",
         "max_mol_wt",
         "ewin_sample_fullmonte",
         "ewin_fullmonte",
+        "max_cache_size",
         "dup_threshold",
         "ro_threshold",
         "amplitude_ifreq",
@@ -381,6 +937,7 @@ def command_line_args():
         "bond_thres",
         "angle_thres",
         "dihedral_thres",
+        "geom_prescreen",
         "crest_force",
         "qdescp_temp",
         "qdescp_acc",
@@ -684,10 +1241,20 @@ def read_xyz_charge_mult(file):
     in the title lines as charge=X and mult=Y (i.e. FILENAME charge=1 mult=1 Eopt -129384.564)
     """
 
-    charge_xyz, mult_xyz = None, None
     # read charge and mult from xyz files
     with open(file, "r") as F:
         lines = F.readlines()
+
+    return xyz_charge_mult(lines)
+
+
+def xyz_charge_mult(lines):
+    """
+    Reads charge and multiplicity from the lines of XYZ files (i.e. the title
+    line of each frame)
+    """
+
+    charge_xyz, mult_xyz = None, None
     for line in lines:
         for keyword in line.strip().split():
             if keyword.lower().find("charge=") > -1:
@@ -705,6 +1272,31 @@ def read_xyz_charge_mult(file):
     return charge_xyz, mult_xyz
 
 
+def select_low_energy(mols, low_check=None):
+    """
+    Selects the mol objects used from a list of conformers sorted by energy: 
+    only the lowest conformer (low_check='lowest_only'), the N lowest conformers 
+    (int) or the conformers within an energy window in kcal/mol (float)
+    """
+
+    if low_check=='lowest_only':
+        return [mols[0]]
+    elif isinstance(low_check, int):
+        check_n = min(len(mols),low_check)
+        n_mols = []
+        for i in range(check_n):
+            n_mols.append(mols[i])
+        return n_mols
+    elif isinstance(low_check, float):
+        n_mols = []
+        for i in range(len(mols)):
+            if abs(float(mols[i].GetProp('Energy')) - float(mols[0].GetProp('Energy'))) < low_check: # kcal/mol
+                n_mols.append(mols[i])
+        return n_mols
+    else:
+        return mols
+
+
 def mol_from_sdf_or_mol_or_mol2(input_file, module, args, low_check=None):
 
     """
@@ -712,23 +1304,8 @@ def mol_from_sdf_or_mol_or_mol2(input_file, module, args, low_check=None):
     """
     if module in ["qprep","cmin"]:
         # using sanitize=False to avoid reading problems
-        mols = Chem.SDMolSupplier(input_file, removeHs=False, sanitize=False)
-        if low_check=='lowest_only':
-            return [mols[0]]
-        elif isinstance(low_check, int):
-            check_n = min(len(mols),low_check)
-            n_mols = []
-            for i in range(check_n):
-                n_mols.append(mols[i])
-            return n_mols
-        elif isinstance(low_check, float):
-            n_mols = []
-            for i in range(len(mols)):
-                if abs(float(mols[i].GetProp('Energy')) - float(mols[0].GetProp('Energy'))) < low_check: # kcal/mol
-                    n_mols.append(mols[i])
-            return n_mols
-        else:
-            return mols
+        mols = conformer_reader(input_file, removeHs=False, sanitize=False)
+        return select_low_energy(mols, low_check)
 
     elif module == "csearch":
 
@@ -14,7 +14,6 @@ from rdkit import Chem
 import ipywidgets
 from ipywidgets import interact
 import os
-import subprocess
 import time
 from pathlib import Path
 
@@ -22,6 +21,8 @@ from pathlib import Path
 from aqme.utils import (
     load_variables,
     mol_from_sdf_or_mol_or_mol2,
+    xyz_mols,
+    pdb_mols,
 )
 
 
@@ -36,40 +37,16 @@ class vismol:
         # load default and user-specified variables
         self.args = load_variables(kwargs, "vismol")
 
-        # write input files
+        # read the conformers (XYZ and PDB files are converted into mol objects in memory)
         for file in self.args.files:
-            name = os.path.basename(Path(file)).split(".")[0]
-            if os.path.basename(Path(file)).split(".")[1].lower() in ["sdf", "xyz", "pdb"]:
-                sdf_files = []
-                if os.path.basename(Path(file)).split(".")[1].lower() == "xyz":
-                    # separate the parent XYZ file into individual XYZ files
-                    command_xyz = [
-                        "obabel",
-                        "-ixyz",
-                        file,
-                        "-osdf",
-                        f"-O{name}.sdf",
-                    ]
-                    subprocess.run(
-                        command_xyz,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-                    sdf_files.append(f"{name}.sdf")
-
-                elif os.path.basename(Path(file)).split(".")[1].lower() == "pdb":
-                    command_pdb = ["obabel", "-ipdb", file, "-osdf", f"-O{name}.sdf"]
-                    subprocess.run(
-                        command_pdb,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-                    sdf_files.append(f"{name}.sdf")
+            file_format = os.path.basename(Path(file)).split(".")[1].lower()
+            if file_format in ["sdf", "xyz", "pdb"]:
+                if file_format == "xyz":
+                    self.confs = xyz_mols(file)
+                elif file_format == "pdb":
+                    self.confs = pdb_mols(file)
                 else:
-                    sdf_files.append(file)
-
-            for sdf_file in sdf_files:
-                self.confs = mol_from_sdf_or_mol_or_mol2(sdf_file, "qprep", self.args)
+                    self.confs = mol_from_sdf_or_mol_or_mol2(file, "qprep", self.args)
 
                 interact(
                     self.style_selector,
@@ -80,12 +57,6 @@ class vismol:
                         description="Style:",
                     ),
                 )
-                if os.path.basename(Path(file)).split(".")[1].lower() in ["xyz", "pdb"]:
-                    try:
-                        # delete SDF files when the input was an XYZ/PDB file
-                        os.remove(sdf_file)
-                    except PermissionError:
-                        pass # in Windows, the generated SDF file cannot be removed
 
         elapsed_time = round(time.time() - start_time_overall, 2)
         self.args.log.write(f"\nTime VIZMOL: {elapsed_time} seconds\n")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+######################################################.
+#        Benchmark of the ANI energies and forces    #
+#     used in CMIN: eager vs TorchScript models      #
+######################################################.
+
+# Run from the main folder of AQME (not collected by pytest):
+#   python tests/benchmark_cmin_ani.py --ani_method ANI2x --repeats 100
+
+import os
+import glob
+import time
+import argparse
+import warnings
+import numpy as np
+from rdkit import Chem
+from aqme.cmin_utils import get_ani_model
+
+warnings.filterwarnings("ignore")
+
+w_dir_main = os.getcwd()
+cmin_methods_dir = w_dir_main + "/tests/cmin_methods"
+
+
+def ani_species(model, mol):
+    """
+    Species tensor of a mol object (same conversion as cmin.ani_optimize)
+    """
+
+    import torch
+
+    if getattr(model, "periodic_table_index", False):
+        return torch.tensor([[atom.GetAtomicNum() for atom in mol.GetAtoms()]])
+    return model.species_to_tensor([atom.GetSymbol() for atom in mol.GetAtoms()]).unsqueeze(0)
+
+
+def energy_forces(model, species, coords):
+    """
+    Energies and forces of a batch of conformers (one forward/backward pass)
+    """
+
+    import torch
+
+    coordinates = torch.tensor(coords, dtype=torch.float32, requires_grad=True)
+    _, energies = model((species.expand(len(coords), -1), coordinates))
+    forces = -torch.autograd.grad(energies.sum(), coordinates)[0]
+    return energies.detach(), forces
+
+
+def time_model(model, species, batches, repeats):
+    """
+    Average time (s) of one evaluation of all the batches
+    """
+
+    # warm-up (TorchScript profiles and optimizes the graph in the first calls)
+    for _ in range(10):
+        for batch in batches:
+            energy_forces(model, species, batch)
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            energy_forces(model, species, batch)
+    return (time.perf_counter() - start_time) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eager vs TorchScript ANI inference in CMIN")
+    parser.add_argument("--ani_method", default="ANI2x", help="ANI model (i.e. ANI2x)")
+    parser.add_argument("--repeats", type=int, default=100, help="Number of timed evaluations")
+    parser.add_argument("--threads", type=int, default=None, help="Number of torch threads")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    eager_model = get_ani_model(args.ani_method)
+    jit_model = get_ani_model(args.ani_method, jit=True)
+
+    print(f"{args.ani_method}, {torch.get_num_threads()} torch threads, {args.repeats} repeats")
+    print(f"{'file':<28}{'mode':<8}{'confs':>6}{'eager (ms)':>12}{'jit (ms)':>10}{'speedup':>9}")
+    for file in sorted(glob.glob(f"{cmin_methods_dir}/*.sdf")):
+        mols = [mol for mol in Chem.SDMolSupplier(file, removeHs=False) if mol is not None]
+        if len(mols) == 0:
+            continue
+        coords = np.array([mol.GetConformer().GetPositions() for mol in mols])
+        try:
+            species = ani_species(eager_model, mols[0])
+            energy_forces(eager_model, species, coords[:1])
+        except (KeyError, ValueError, RuntimeError, IndexError):
+            print(f"{os.path.basename(file):<28}skipped (atoms not supported by {args.ani_method})")
+            continue
+
+        # all the conformers at once (batched optimizer) and one conformer per call
+        for mode, batches in [("batch", [coords]), ("single", [conf[None] for conf in coords])]:
+            eager_time = time_model(eager_model, species, batches, args.repeats)
+            jit_time = time_model(jit_model, species, batches, args.repeats)
+            print(
+                f"{os.path.basename(file):<28}{mode:<8}{len(coords):>6}"
+                f"{eager_time * 1000:>12.2f}{jit_time * 1000:>10.2f}{eager_time / jit_time:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ import os
 import glob
 import pytest
 from aqme.cmin import cmin
+from aqme.cmin_utils import fire_optimize
+import numpy as np
 import rdkit
 import shutil
 
@@ -69,6 +71,90 @@ def test_cmin_methods(
         assert coord not in outlines[4]
     os.chdir(w_dir_main)
 
+# tests of the batched FIRE optimizer used with ANI (same steps as ase.optimize.FIRE)
+@pytest.mark.parametrize(
+    "n_confs, fmax",
+    [
+        (1, 0.01),
+        (4, 0.01),
+        (4, 0.1),
+    ],
+)
+def test_cmin_fire(n_confs, fmax):
+    from ase import Atoms
+    from ase.optimize import FIRE
+    from ase.calculators.lj import LennardJones
+
+    rng = np.random.default_rng(0)
+    coords = [
+        np.array([[0.0, 0.0, 0.0], [1.2, 0.0, 0.0], [0.0, 1.3, 0.0], [0.0, 0.0, 1.1]])
+        + rng.normal(scale=0.1, size=(4, 3))
+        for _ in range(n_confs)
+    ]
+
+    def energy_forces(coords_batch):
+        energies, forces = [], []
+        for conf_coords in coords_batch:
+            atoms = Atoms("Ar4", positions=conf_coords, calculator=LennardJones())
+            energies.append(atoms.get_potential_energy())
+            forces.append(atoms.get_forces())
+        return np.array(energies), np.array(forces)
+
+    opt_coords, energies, converged = fire_optimize(energy_forces, coords, fmax, 500)
+
+    assert converged.all()
+    for i in range(n_confs):
+        atoms = Atoms("Ar4", positions=coords[i], calculator=LennardJones())
+        FIRE(atoms, logfile=None).run(fmax=fmax, steps=500)
+        assert np.allclose(atoms.get_positions(), opt_coords[i])
+        assert np.isclose(atoms.get_potential_energy(), energies[i])
+
+# tests of the ANI prescreening with a single network of the ensemble (the ANI
+# optimizations are replaced by fixed energies, to avoid loading the ANI models)
+def test_cmin_ani_prescreen(monkeypatch):
+    optimized = []
+
+    def fake_ani_optimize(self, mols, model_index=None):
+        optimized.append((model_index, [mol.GetConformer().GetPositions().copy() for mol in mols]))
+        results = []
+        for i, mol in enumerate(mols):
+            if model_index is not None:
+                # conformer 1 becomes a duplicate of conformer 0, and conformers
+                # 2 and 3 are outside the energy window
+                if i == 1:
+                    mol.GetConformer().SetPositions(mols[0].GetConformer().GetPositions())
+                results.append((mol, [0.0, 0.05, 20.0, 30.0][i], True))
+            else:
+                results.append((mol, 0.0, True))
+        return results
+
+    monkeypatch.setattr(cmin, "ani_optimize", fake_ani_optimize)
+    os.chdir(cmin_methods_dir)
+    cmin(
+        program="ani",
+        files="pentane_rdkit_methods.sdf",
+        suffix="prescreen",
+        ewin_ani_prescreen=5,
+        max_workers=1,
+    )
+
+    # only the conformer kept in the prescreening is refined with the full ensemble
+    assert [model_index for model_index, _ in optimized] == [0, None]
+    assert len(optimized[0][1]) == 4
+    assert len(optimized[1][1]) == 1
+    assert np.allclose(optimized[1][1][0], optimized[0][1][0])
+
+    file = f'{cmin_methods_dir}/CMIN/pentane_rdkit_methods_prescreen_ani_all_confs.sdf'
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False, sanitize=False)
+    assert len(mols) == 1
+
+    # the conformers discarded in the prescreening are counted in the CMIN data
+    with open(f'{cmin_methods_dir}/CMIN-Data.csv') as csv_data:
+        header, values = [line.strip().split(",") for line in csv_data.readlines()[:2]]
+    assert int(float(values[header.index("ANI-energy-window")])) == 2
+    assert int(float(values[header.index("ANI-RMSD-and-energy-duplicates")])) == 1
+    os.chdir(w_dir_main)
+
 # tests for removing foler
 @pytest.mark.parametrize(
     "folder_list, file_list",
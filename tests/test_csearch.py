@@ -9,7 +9,13 @@ import os
 import pytest
 import glob
 from aqme.csearch import csearch
+import aqme.csearch.base
+from aqme.csearch.utils import rmsd_matrix, cluster_conformers, getDihedralMatches
+from aqme.csearch.fullmonte import TorsionIndex, torsion_symmetry_maps, torsion_fingerprints
+from aqme.utils import ConformerArchive, get_conf_RMS
+import numpy as np
 import rdkit
+import rdkit.Chem.AllChem
 import shutil
 
 # saves the working directory
@@ -118,6 +124,253 @@ def test_csearch_input_parameters(program, input, output_nummols):
     os.chdir(w_dir_main)
 
 
+# tests for inputs read in chunks
+@pytest.mark.parametrize(
+    "program, input, input_chunksize, max_workers, output_nummols",
+    [
+        ("rdkit", "pentane.smi", 1, 1, [2, 4]),
+        ("rdkit", "pentane.csv", 1, 1, [2, 4]),
+        ("rdkit", "pentane.csv", 1, 2, [2, 4]),
+    ],
+)
+def test_csearch_input_chunksize(program, input, input_chunksize, max_workers, output_nummols):
+    os.chdir(csearch_input_dir)
+    # runs the program with the different tests
+    csearch(
+        program=program,
+        input=input,
+        input_chunksize=input_chunksize,
+        max_workers=max_workers,
+    )
+
+    # tests here
+    file1 = f'{csearch_input_dir}/CSEARCH/butane_{input.split(".")[1]}_{program}.sdf'
+    file2 = f'{csearch_input_dir}/CSEARCH/pentane_{input.split(".")[1]}_{program}.sdf'
+    with rdkit.Chem.SDMolSupplier(file1, removeHs=False) as mol1:
+        assert len(mol1) == output_nummols[0]
+    with rdkit.Chem.SDMolSupplier(file2, removeHs=False) as mol2:
+        assert len(mol2) == output_nummols[1]
+    os.remove(file1)
+    os.remove(file2)
+
+    # the CSV file is written as the jobs finish
+    csv_file = f'{csearch_input_dir}/CSEARCH-Data-{input.split(".")[0]}.csv'
+    with open(csv_file) as csv_data:
+        assert len(csv_data.readlines()) == 3
+    os.remove(csv_file)
+    os.chdir(w_dir_main)
+
+
+# tests for resuming CSEARCH runs
+@pytest.mark.parametrize(
+    "program, input, input_chunksize, output_nummols",
+    [
+        ("rdkit", "pentane.csv", 0, [2, 4]),
+        ("rdkit", "pentane.csv", 1, [2, 4]),
+    ],
+)
+def test_csearch_resume(program, input, input_chunksize, output_nummols):
+    os.chdir(csearch_input_dir)
+    csv_file = f'{csearch_input_dir}/CSEARCH-Data-{input.split(".")[0]}.csv'
+    manifest_file = f'{csearch_input_dir}/CSEARCH/CSEARCH-manifest.csv'
+    file1 = f'{csearch_input_dir}/CSEARCH/butane_{input.split(".")[1]}_{program}.sdf'
+    file2 = f'{csearch_input_dir}/CSEARCH/pentane_{input.split(".")[1]}_{program}.sdf'
+    # removes files from previous tests
+    for file in [csv_file, manifest_file]:
+        if os.path.exists(file):
+            os.remove(file)
+
+    # runs the program twice, the second run should skip all the jobs
+    for _ in range(2):
+        csearch(
+            program=program,
+            input=input,
+            input_chunksize=input_chunksize,
+            resume=True,
+        )
+        with open(csv_file) as csv_data:
+            assert len(csv_data.readlines()) == 3
+        with open(manifest_file) as manifest:
+            assert len(manifest.readlines()) == 3
+
+    # only the job with a missing SDF file is repeated
+    os.remove(file2)
+    csearch(
+        program=program,
+        input=input,
+        input_chunksize=input_chunksize,
+        resume=True,
+    )
+    with open(csv_file) as csv_data:
+        assert len(csv_data.readlines()) == 4
+    with rdkit.Chem.SDMolSupplier(file1, removeHs=False) as mol1:
+        assert len(mol1) == output_nummols[0]
+    with rdkit.Chem.SDMolSupplier(file2, removeHs=False) as mol2:
+        assert len(mol2) == output_nummols[1]
+
+    # runs without resume don't update the manifest
+    with open(manifest_file) as manifest:
+        n_manifest = len(manifest.readlines())
+    csearch(
+        program=program,
+        input=input,
+        input_chunksize=input_chunksize,
+    )
+    with open(manifest_file) as manifest:
+        assert len(manifest.readlines()) == n_manifest
+
+    os.remove(file1)
+    os.remove(file2)
+    os.remove(csv_file)
+    os.remove(manifest_file)
+    os.chdir(w_dir_main)
+
+
+# tests for resuming CSEARCH runs that stopped partway
+@pytest.mark.parametrize(
+    "program, input, input_chunksize",
+    [
+        ("rdkit", "pentane.csv", 0),
+        ("rdkit", "pentane.csv", 1),
+    ],
+)
+def test_csearch_resume_aborted(monkeypatch, program, input, input_chunksize):
+    os.chdir(csearch_input_dir)
+    csv_file = f'{csearch_input_dir}/CSEARCH-Data-{input.split(".")[0]}.csv'
+    manifest_file = f'{csearch_input_dir}/CSEARCH/CSEARCH-manifest.csv'
+    for file in [csv_file, manifest_file]:
+        if os.path.exists(file):
+            os.remove(file)
+
+    # the run stops in the second job (i.e. the process is killed). The jobs run in
+    # this process, so the job function can be replaced
+    csearch_job = aqme.csearch.base.csearch_job
+    n_jobs = []
+
+    def aborted_csearch_job(args, job_input):
+        n_jobs.append(job_input[1])
+        if len(n_jobs) == 2:
+            raise KeyboardInterrupt
+        return csearch_job(args, job_input)
+
+    monkeypatch.setattr(aqme.csearch.base, "csearch_job", aborted_csearch_job)
+    with pytest.raises(KeyboardInterrupt):
+        csearch(program=program, input=input, input_chunksize=input_chunksize, resume=True, max_workers=1)
+    monkeypatch.undo()
+
+    # the finished job is in the CSV file and in the manifest
+    with open(csv_file) as csv_data:
+        assert len(csv_data.readlines()) == 2
+    with open(manifest_file) as manifest:
+        assert len(manifest.readlines()) == 2
+
+    # only the missing job runs when the run is resumed
+    csearch(program=program, input=input, input_chunksize=input_chunksize, resume=True, max_workers=1)
+    with open(csv_file) as csv_data:
+        assert len(csv_data.readlines()) == 3
+    with open(manifest_file) as manifest:
+        assert len(manifest.readlines()) == 3
+
+    for file in glob.glob(f'{csearch_input_dir}/CSEARCH/*_{program}.sdf'):
+        os.remove(file)
+    os.remove(csv_file)
+    os.remove(manifest_file)
+    os.chdir(w_dir_main)
+
+
+# tests for the conformer cache
+@pytest.mark.parametrize(
+    "program, input, output, max_cache_size, cache_files, output_nummols",
+    [
+        ("rdkit", "pentane.csv", ".sdf", 1000, 4, [2, 4]),
+        ("rdkit", "pentane.csv", ".sdf", 0, 0, [2, 4]),
+        ("rdkit", "pentane.csv", ".aqmz", 1000, 4, [2, 4]),
+    ],
+)
+def test_csearch_conformer_cache(program, input, output, max_cache_size, cache_files, output_nummols):
+    os.chdir(csearch_input_dir)
+    cache_dir = f'{csearch_input_dir}/conformer_cache'
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+
+    # the second run uses a prefix, so the names of the cached conformers are updated
+    for prefix in ["", "cache"]:
+        csearch(
+            program=program,
+            input=input,
+            prefix=prefix,
+            output=output,
+            conformer_cache=cache_dir,
+            max_cache_size=max_cache_size,
+        )
+        assert len(glob.glob(f'{cache_dir}/*')) == cache_files
+
+        name_prefix = f"{prefix}_" if prefix != "" else ""
+        file1 = f'{csearch_input_dir}/CSEARCH/{name_prefix}butane_{input.split(".")[1]}_{program}{output}'
+        file2 = f'{csearch_input_dir}/CSEARCH/{name_prefix}pentane_{input.split(".")[1]}_{program}{output}'
+        if output == ".sdf":
+            mol1 = rdkit.Chem.SDMolSupplier(file1, removeHs=False)
+            mol2 = rdkit.Chem.SDMolSupplier(file2, removeHs=False)
+        else:
+            mol1 = ConformerArchive(file1)
+            mol2 = ConformerArchive(file2)
+        assert len(mol1) == output_nummols[0]
+        assert mol1[0].GetProp("_Name").startswith(f"{name_prefix}butane")
+        assert len(mol2) == output_nummols[1]
+        del mol1, mol2
+        os.remove(file1)
+        os.remove(file2)
+
+    shutil.rmtree(cache_dir)
+    os.chdir(w_dir_main)
+
+
+# tests for the conformer archives
+@pytest.mark.parametrize(
+    "program, smi, name",
+    [
+        ("rdkit", "CCCCC", "pentane_archive"),
+        ("summ", "CCCCC", "pentane_archive"),
+        ("fullmonte", "CCCCC", "pentane_archive"),
+    ],
+)
+def test_csearch_output_archive(program, smi, name):
+    os.chdir(csearch_others_dir)
+    # the same conformers are written in SDF files and conformer archives
+    for output in [".sdf", ".aqmz"]:
+        csearch(
+            program=program,
+            smi=smi,
+            name=name,
+            output=output,
+        )
+
+    file_sdf = f"CSEARCH/{name}_{program}.sdf"
+    file_archive = f"CSEARCH/{name}_{program}.aqmz"
+    mols_sdf = rdkit.Chem.SDMolSupplier(file_sdf, removeHs=False)
+    mols_archive = ConformerArchive(file_archive)
+    assert len(mols_archive) == len(mols_sdf)
+    assert len(mols_archive.energies) == len(mols_sdf)
+    for mol_sdf, mol_archive in zip(mols_sdf, mols_archive):
+        assert mol_archive.GetProp("_Name").split()[0] == mol_sdf.GetProp("_Name").split()[0]
+        for prop in ["Real charge", "Mult", "SMILES"]:
+            assert mol_archive.GetProp(prop) == mol_sdf.GetProp(prop)
+        assert mol_archive.GetNumAtoms() == mol_sdf.GetNumAtoms()
+        assert abs(float(mol_archive.GetProp("Energy")) - float(mol_sdf.GetProp("Energy"))) < 0.001
+        assert mol_archive.GetProp("_Name") == mol_sdf.GetProp("_Name")
+        assert abs(
+            mol_archive.GetConformer().GetPositions() - mol_sdf.GetConformer().GetPositions()
+        ).max() < 0.001
+    # random access
+    assert mols_archive[-1].GetProp("Energy") == mols_archive.get_mol(len(mols_archive) - 1).GetProp("Energy")
+    assert os.path.getsize(file_archive) < os.path.getsize(file_sdf)
+
+    del mols_sdf, mols_archive
+    os.remove(file_sdf)
+    os.remove(file_archive)
+    os.chdir(w_dir_main)
+
+
 # tests for parameters of SUMM
 @pytest.mark.parametrize(
     "program, smi, name, charge, mult, ang_summ, output_nummols",
@@ -154,6 +407,69 @@ def test_csearch_summ_parameters(
     os.chdir(w_dir_main)
 
 
+# tests for the SUMM rotamers, with and without the branch-and-bound cutoff
+@pytest.mark.parametrize(
+    "program, smi, name, ewin_prune_summ",
+    [
+        ("summ", "CCCCCC", "hexane_summ", None),
+        ("summ", "CCCCCC", "hexane_summ_prune", 5.0),
+    ],
+)
+def test_csearch_summ_rotamers(program, smi, name, ewin_prune_summ):
+    os.chdir(csearch_rdkit_summ_dir)
+    csearch(
+        program=program,
+        smi=smi,
+        name=name,
+        ewin_prune_summ=ewin_prune_summ,
+    )
+
+    file = str("CSEARCH/" + name + "_" + program + ".sdf")
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+    assert len(mols) > 1
+    energies = [float(mol.GetProp("Energy")) for mol in mols]
+    assert energies == sorted(energies)
+    # the all-anti conformer of hexane is always found
+    assert abs(energies[0] - (-5.47)) < 0.05
+    # the conformers written are the minimized rotamers
+    for mol in mols:
+        properties = rdkit.Chem.AllChem.MMFFGetMoleculeProperties(mol)
+        forcefield = rdkit.Chem.AllChem.MMFFGetMoleculeForceField(mol, properties)
+        assert abs(forcefield.CalcEnergy() - float(mol.GetProp("Energy"))) < 0.05
+    os.chdir(w_dir_main)
+
+
+# tests for the RMSD matrix of the SUMM clustering (same RMSD as get_conf_RMS,
+# including the symmetry of terminal conjugated groups like COOH and NO2)
+@pytest.mark.parametrize(
+    "smi, heavy_only",
+    [
+        ("OC(=O)CCC[N+](=O)[O-]", True),
+        ("OC(=O)CCC[N+](=O)[O-]", False),
+    ],
+)
+def test_csearch_cluster_rmsd(smi, heavy_only):
+    mol = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smi))
+    cids = rdkit.Chem.AllChem.EmbedMultipleConfs(mol, 10, randomSeed=42)
+    mols = []
+    for cid in cids:
+        conf_mol = rdkit.Chem.Mol(mol)
+        conf_mol.RemoveAllConformers()
+        conf_mol.AddConformer(rdkit.Chem.Conformer(mol.GetConformer(cid)), assignId=True)
+        mols.append(conf_mol)
+
+    dists = rmsd_matrix(mols, heavy_only, 1000)
+    ref_dists = [
+        get_conf_RMS(rdkit.Chem.Mol(mols[i]), rdkit.Chem.Mol(mols[j]), -1, -1, heavy_only, 1000)
+        for i in range(len(mols))
+        for j in range(i)
+    ]
+    assert np.allclose(dists, ref_dists, atol=1e-5)
+
+    _, centroids = cluster_conformers(mols, heavy_only, 1000, 0.5)
+    assert sorted(centroids) == sorted(set(centroids))
+
+
 # tests for parameters of CREST
 @pytest.mark.parametrize(
     "program, smi, name, cregen, cregen_keywords, crest_keywords, charge, mult, output_nummols",
@@ -349,6 +665,50 @@ def test_csearch_crest_parameters(
                 assert line.find('-P 14') > -1
 
 
+# tests that the CREST conformers keep the topology of the input (bonds and charges)
+@pytest.mark.parametrize(
+    "smi, name, charge, crest_nrun",
+    [
+        ("C[N+](=O)[O-]", "nitromethane_topology", 0, 1),
+        ("CCC(=O)[O-]", "propanoate_topology", -1, 1),
+        ("CCC(=O)[O-]", "propanoate_topology_nrun", -1, 2),
+    ],
+)
+def test_csearch_crest_topology(smi, name, charge, crest_nrun):
+    os.chdir(csearch_crest_dir)
+    csearch(
+        program="crest",
+        smi=smi,
+        name=name,
+        charge=charge,
+        mult=1,
+        crest_nrun=crest_nrun,
+    )
+
+    mol_input = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smi))
+    bonds_input = sorted(
+        (bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(), bond.GetBondType())
+        for bond in mol_input.GetBonds()
+    )
+    charges_input = [atom.GetFormalCharge() for atom in mol_input.GetAtoms()]
+    if crest_nrun == 1:
+        files = [f"CSEARCH/{name}_crest.sdf"]
+    else:
+        files = glob.glob(f"CSEARCH/{name}_run_*_crest.sdf")
+    assert len(files) >= 1
+    for file in files:
+        mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+        assert len(mols) >= 1
+        for mol in mols:
+            bonds = sorted(
+                (bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(), bond.GetBondType())
+                for bond in mol.GetBonds()
+            )
+            assert bonds == bonds_input
+            assert [atom.GetFormalCharge() for atom in mol.GetAtoms()] == charges_input
+    os.chdir(w_dir_main)
+
+
 # tests for parameters of csearch fullmonte
 @pytest.mark.parametrize(
     "program, smi, name, charge, mult, ewin_fullmonte, ewin_sample_fullmonte, nsteps_fullmonte, nrot_fullmonte, ang_fullmonte, output_nummols",
@@ -394,6 +754,196 @@ def test_csearch_fullmonte_parameters(
     os.chdir(w_dir_main)
 
 
+# tests for the multi-walker and batched fullmonte sampling
+@pytest.mark.parametrize(
+    "program, smi, name, charge, mult, nwalkers_fullmonte, nproposals_fullmonte, output_nummols",
+    [
+        ("fullmonte", "CCCCC", "pentane_walkers_1", 3, 4, 1, 1, 4),
+        ("fullmonte", "CCCCC", "pentane_walkers_3", 3, 4, 3, 1, 4),
+        ("fullmonte", "CCCCC", "pentane_proposals_4", 3, 4, 1, 4, 4),
+        ("fullmonte", "CCCCC", "pentane_walkers_proposals", 3, 4, 2, 4, 4),
+    ],
+)
+def test_csearch_fullmonte_walkers(
+    program,
+    smi,
+    name,
+    charge,
+    mult,
+    nwalkers_fullmonte,
+    nproposals_fullmonte,
+    output_nummols,
+):
+    os.chdir(csearch_fullmonte_dir)
+    # runs the program with the different tests
+    csearch(
+        w_dir_main=csearch_fullmonte_dir,
+        program=program,
+        smi=smi,
+        name=name,
+        charge=charge,
+        mult=mult,
+        ewin_fullmonte=12,
+        ewin_sample_fullmonte=3,
+        nsteps_fullmonte=200,
+        nrot_fullmonte=4,
+        ang_fullmonte=10,
+        nwalkers_fullmonte=nwalkers_fullmonte,
+        nproposals_fullmonte=nproposals_fullmonte,
+    )
+
+    # tests here
+    file = str("CSEARCH/" + name + "_" + program + ".sdf")
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+    assert len(mols) == output_nummols
+    energies = [float(mol.GetProp("Energy")) for mol in mols]
+    assert energies == sorted(energies)
+    # the conformers merged from the walkers keep the properties of the molecule
+    for mol in mols:
+        assert charge == int(mol.GetProp("Real charge"))
+        assert mult == int(mol.GetProp("Mult"))
+    os.chdir(w_dir_main)
+
+
+# tests for the dihedral prefilter of the RMSD in fullmonte
+@pytest.mark.parametrize(
+    "program, smi, name, ang_prefilter_fullmonte, output_nummols",
+    [
+        ("fullmonte", "CCCCCO", "pentanol_prefilter_none", None, 30),
+        ("fullmonte", "CCCCCO", "pentanol_prefilter_60", 60.0, 30),
+    ],
+)
+def test_csearch_fullmonte_prefilter(
+    program,
+    smi,
+    name,
+    ang_prefilter_fullmonte,
+    output_nummols,
+):
+    os.chdir(csearch_fullmonte_dir)
+    # runs the program with the different tests
+    csearch(
+        w_dir_main=csearch_fullmonte_dir,
+        program=program,
+        smi=smi,
+        name=name,
+        nsteps_fullmonte=100,
+        ang_prefilter_fullmonte=ang_prefilter_fullmonte,
+    )
+
+    # tests here
+    file = str("CSEARCH/" + name + "_" + program + ".sdf")
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+    assert len(mols) == output_nummols
+    os.chdir(w_dir_main)
+
+
+# tests for the buckets of dihedral angles used by the prefilter of fullmonte
+# (same conformers as comparing the dihedrals of all the unique conformers)
+@pytest.mark.parametrize(
+    "smi, ang_threshold",
+    [
+        ("CCCCCO", 60.0),
+        ("CCCCCO", 30.0),
+        ("OCC(O)CCOCCO", 60.0),
+    ],
+)
+def test_csearch_fullmonte_torsion_index(smi, ang_threshold):
+    mol = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smi))
+    cids = rdkit.Chem.AllChem.EmbedMultipleConfs(mol, 60, randomSeed=42)
+    mols = []
+    for cid in cids:
+        conf_mol = rdkit.Chem.Mol(mol)
+        conf_mol.RemoveAllConformers()
+        conf_mol.AddConformer(rdkit.Chem.Conformer(mol.GetConformer(cid)), assignId=True)
+        mols.append(conf_mol)
+    rotmatches = getDihedralMatches(mol, True)
+    torsion_maps = torsion_symmetry_maps(mol, rotmatches, True, 1000)
+
+    torsion_index = TorsionIndex(torsion_maps, ang_threshold)
+    for mol_unique in mols[:40]:
+        torsion_index.add(mol_unique, 0.0)
+    torsion_index.remove(mols[0])
+    unique_torsions = [
+        torsion_fingerprints(mol_unique.GetConformer().GetPositions(), torsion_maps[:1])[0]
+        for mol_unique in mols[1:40]
+    ]
+    for rot_mol in mols:
+        rot_torsions = torsion_fingerprints(rot_mol.GetConformer().GetPositions(), torsion_maps)
+        ref_mols = [
+            id(mol_unique)
+            for mol_unique, torsions in zip(mols[1:40], unique_torsions)
+            if np.abs((rot_torsions - torsions + 180.0) % 360.0 - 180.0).max(axis=1).min() <= ang_threshold
+        ]
+        similar_mols = [id(mol_similar) for mol_similar in torsion_index.get_similar(rot_mol, 0.0, 1.0)]
+        assert sorted(similar_mols) == sorted(ref_mols)
+
+
+# tests for the adaptive sampling of RDKit
+@pytest.mark.parametrize(
+    "program, smi, name, max_sample, output_nummols, initial_samples",
+    [
+        # rigid molecules stop after one or two batches
+        ("rdkit", "c1ccccc1C", "toluene_adaptive", None, 1, 20),
+        ("rdkit", "CC(=O)Nc1ccc(O)cc1", "acetaminophen_adaptive", None, 2, 40),
+        # flexible molecules stop at max_sample
+        ("rdkit", "OCC(O)CCOCCO", "polyol_adaptive", 50, 15, 50),
+    ],
+)
+def test_csearch_adaptive_sample(
+    program, smi, name, max_sample, output_nummols, initial_samples
+):
+    os.chdir(csearch_rdkit_summ_dir)
+    csearch(
+        w_dir_main=csearch_rdkit_summ_dir,
+        program=program,
+        smi=smi,
+        name=name,
+        sample="adaptive",
+        max_sample=max_sample,
+    )
+
+    file = str("CSEARCH/" + name + "_" + program + ".sdf")
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+    assert len(mols) == output_nummols
+    csv_file = f"{csearch_rdkit_summ_dir}/CSEARCH-Data-{name}.csv"
+    with open(csv_file) as csv_data:
+        header, values = [line.strip().split(",") for line in csv_data.readlines()[:2]]
+    assert int(values[header.index("RDKit-Initial-samples")]) == initial_samples
+    os.chdir(w_dir_main)
+
+
+# tests for the geom filter, with and without screening before the minimization
+@pytest.mark.parametrize(
+    "program, smi, name, geom, geom_prescreen, output_nummols",
+    [
+        ("rdkit", "CCCCCC", "hexane_geom", ["CCCC", 180], None, 5),
+        ("rdkit", "CCCCCC", "hexane_geom_prescreen", ["CCCC", 180], 2.0, 5),
+    ],
+)
+def test_csearch_geom_prescreen(
+    program, smi, name, geom, geom_prescreen, output_nummols
+):
+    os.chdir(csearch_rdkit_summ_dir)
+    csearch(
+        w_dir_main=csearch_rdkit_summ_dir,
+        program=program,
+        smi=smi,
+        name=name,
+        geom=geom,
+        geom_prescreen=geom_prescreen,
+    )
+
+    file = str("CSEARCH/" + name + "_" + program + ".sdf")
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+    assert len(mols) == output_nummols
+    # all the conformers pass the final geom filter
+    for mol in mols:
+        dihedral = rdkit.Chem.rdMolTransforms.GetDihedralDeg(mol.GetConformer(), 0, 1, 2, 3)
+        assert abs(abs(dihedral) - 180) <= 30
+    os.chdir(w_dir_main)
+
+
 # tests for parameters of csearch rdkit
 @pytest.mark.parametrize(
     "program, smi, name, charge, mult, sample, opt_steps_rdkit, heavyonly, ewin_csearch, initial_energy_threshold, energy_threshold, rms_threshold, output_nummols ",